@@ -1,6 +1,8 @@
 import pandas as pd
 import json
 
+from BD.keypoint_track import FrameIndex
+
 def extract_arm_trajectories(df_clean, laps_data, waterline_y):
     """
     從已經分析好的 laps_data 和 df_clean 中，提取各趟「游泳段」(swimming segment)的手腕、手肘、肩膀軌跡。
@@ -8,6 +10,7 @@ def extract_arm_trajectories(df_clean, laps_data, waterline_y):
     正規化 Y = Waterline_Y - Raw_Y (如此一來，水面上的點 Y > 0，水面下的點 Y < 0)。
     """
     arm_data = []
+    frame_index = FrameIndex(df_clean["frame_id"].to_numpy())
 
     for lap in laps_data:
         # 只取出游泳段 (Swimming Phase)
@@ -18,7 +21,7 @@ def extract_arm_trajectories(df_clean, laps_data, waterline_y):
         trend = lap["trend"]
         
         # 取出該游泳區段的資料
-        df_swim = df_clean[(df_clean["frame_id"] >= s_swim) & (df_clean["frame_id"] <= e_swim)]
+        df_swim = df_clean.iloc[frame_index.rows(s_swim, e_swim)]
         
         if df_swim.empty:
             continue
@@ -0,0 +1,139 @@
+# BD/batch_smooth.py
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from BD.keypoint_io import write_keypoint_txt
+from BD.txt_base import smooth_keypoints
+
+"""
+關鍵點資料夾批次平滑：把資料夾內的原始 keypoints txt 分給多個子程序平滑 (smooth_keypoints)，
+每個檔案輸出 {base}{suffix}.txt (預設與舊的離線腳本相同，為 {base}_1.txt)。
+輸出檔比輸入檔新的檔案會略過 (--force 全部重做)，結束時印出處理量統計。
+
+用法:
+python -m BD.batch_smooth <folder> [--workers 8] [--suffix _1] [--recursive] [--force]
+"""
+
+
+def output_path_for(input_txt, suffix="_1"):
+    base, ext = os.path.splitext(input_txt)
+    return base + suffix + ext
+
+
+def find_keypoint_files(folder, suffix="_1", recursive=False):
+    """資料夾內待平滑的 txt (排除 .n.txt 與本工具的輸出檔 *{suffix}.txt)。"""
+    pattern = os.path.join(folder, "**", "*.txt") if recursive else os.path.join(folder, "*.txt")
+    files = []
+    for path in sorted(glob.glob(pattern, recursive=recursive)):
+        name = os.path.basename(path)
+        if name.endswith(".n.txt") or name.endswith(f"{suffix}.txt"):
+            continue
+        files.append(path)
+    return files
+
+
+def is_up_to_date(input_txt, output_txt):
+    """輸出檔存在且比輸入檔新 (之後未再修改輸入) 時不必重做。"""
+    return os.path.exists(output_txt) and os.path.getmtime(output_txt) > os.path.getmtime(input_txt)
+
+
+def _smooth_file(task):
+    """子程序：平滑一個檔案，回傳 (輸入路徑, 幀數, 秒數)。"""
+    input_txt, output_txt = task
+    start = time.perf_counter()
+    rows = smooth_keypoints(input_txt)
+    if len(rows) == 0:
+        raise ValueError("no keypoint rows")
+    write_keypoint_txt(output_txt, rows)
+    return input_txt, len(rows), time.perf_counter() - start
+
+
+def batch_smooth(files, suffix="_1", workers=None, force=False):
+    """
+    平滑 files 中的每個檔案，回傳統計 dict：
+    processed / skipped / failed (list of (路徑, 錯誤訊息)) / frames / elapsed / busy
+    (busy 為各檔案處理時間總和，busy / elapsed 約為平行的加速倍數)。
+    """
+    tasks = []
+    skipped = 0
+    for input_txt in files:
+        output_txt = output_path_for(input_txt, suffix)
+        if not force and is_up_to_date(input_txt, output_txt):
+            skipped += 1
+            continue
+        tasks.append((input_txt, output_txt))
+
+    workers = max(1, min(int(workers or os.cpu_count() or 1), len(tasks) or 1))
+    stats = {"processed": 0, "skipped": skipped, "failed": [], "frames": 0, "busy": 0.0}
+    print(f"🚀 {len(tasks)} 個檔案待平滑 (略過 {skipped} 個已是最新)，{workers} 個程序")
+
+    def _record(done, input_txt, result=None, error=None):
+        if error is not None:
+            stats["failed"].append((input_txt, str(error)))
+            print(f"❌ [{done}/{len(tasks)}] {input_txt}: {error}")
+            return
+        _, frames, seconds = result
+        stats["processed"] += 1
+        stats["frames"] += frames
+        stats["busy"] += seconds
+        print(f"✅ [{done}/{len(tasks)}] {os.path.basename(input_txt)} ({frames} 幀, {seconds:.2f}s)")
+
+    start = time.perf_counter()
+    if workers == 1:
+        for done, task in enumerate(tasks, start=1):
+            try:
+                _record(done, task[0], result=_smooth_file(task))
+            except Exception as e:
+                _record(done, task[0], error=e)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_smooth_file, task): task[0] for task in tasks}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    _record(done, futures[future], result=future.result())
+                except Exception as e:
+                    _record(done, futures[future], error=e)
+    stats["elapsed"] = time.perf_counter() - start
+    stats["workers"] = workers
+    return stats
+
+
+def print_summary(stats):
+    elapsed = stats["elapsed"]
+    print("\n===== 批次平滑統計 =====")
+    print(f"處理: {stats['processed']}  略過: {stats['skipped']}  失敗: {len(stats['failed'])}")
+    print(f"總幀數: {stats['frames']}  耗時: {elapsed:.2f}s ({stats['workers']} 個程序)")
+    if elapsed > 0 and stats["processed"]:
+        print(
+            f"處理量: {stats['processed'] / elapsed:.2f} 檔/秒, {stats['frames'] / elapsed:.0f} 幀/秒, "
+            f"平行加速約 {stats['busy'] / elapsed:.1f}x"
+        )
+    for path, error in stats["failed"]:
+        print(f"  ❌ {path}: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Smooth every keypoint txt in a folder in parallel")
+    parser.add_argument("folder")
+    parser.add_argument("--workers", type=int, default=None, help="process count (default: CPU count)")
+    parser.add_argument("--suffix", default="_1", help="output name suffix: {base}{suffix}.txt")
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--force", action="store_true", help="re-smooth files whose output is up to date")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder):
+        print(f"❌ Error: Directory does not exist: {args.folder}")
+        sys.exit(1)
+
+    stats = batch_smooth(
+        find_keypoint_files(args.folder, args.suffix, args.recursive),
+        suffix=args.suffix,
+        workers=args.workers,
+        force=args.force,
+    )
+    print_summary(stats)
+    sys.exit(1 if stats["failed"] else 0)
@@ -5,70 +5,58 @@ import pandas as pd
 import cv2
 import matplotlib.pyplot as plt
 import math
+import os
 from scipy.signal import argrelextrema
-import streamlit as st
+
+from BD.keypoint_track import FrameIndex, load_keypoint_track
+from BD.result_cache import DiskResultCache, content_hash
+from BD.video_info import probe_video
+from BD.video_source import VideoSource, read_frame
+
+
+# analyze_diving_phase 的磁碟快取 (以第一幀、關鍵點內容與參數的雜湊為鍵，LRU，總大小上限 MB)
+DIVING_CACHE = os.getenv("DIVING_CACHE", "1") == "1"
+DIVING_CACHE_DIR = os.getenv("DIVING_CACHE_DIR", os.path.join("data", "cache", "diving_phase"))
+DIVING_CACHE_MAX_MB = float(os.getenv("DIVING_CACHE_MAX_MB", "512"))
+# 入水分析邏輯改變時遞增，舊的快取項目即不再命中
+DIVING_CACHE_VERSION = 1
+
+diving_phase_cache = DiskResultCache(
+    DIVING_CACHE_DIR, int(DIVING_CACHE_MAX_MB * 1024 * 1024), name="diving_phase"
+)
+KICK_ANGLE_FIG_KEYS = ("kick_angle_fig_1", "kick_angle_fig_2")
+
+
+# read_and_clean_txt 的欄名 -> 28 欄版面中的欄位索引
+CLEAN_COLUMNS = {
+    "bbox_x": 2,
+    "bbox_y": 3,
+    "width": 4,
+    "height": 5,
+    "head_x": 7,
+    "col8": 8,  # 頭y
+    "shoulder_x": 10,
+    "shoulder_y": 11,
+    "elbow_x": 13,
+    "elbow_y": 14,
+    "wrist_x": 16,
+    "wrist_y": 17,
+    "hip_x": 19,
+    "hip_y": 20,
+    "knee_x": 22,
+    "knee_y": 23,
+    "ankle_x": 25,
+    "ankle_y": 26,
+}
 
 
 def read_and_clean_txt(path, expected_cols=4):
     """
     讀取 keypoints txt ，只擷取 frame_id、bbox_x、bbox_y、頭部 y座標(col8)
    肩膀(col11), 手肘(col14), 膝蓋(col23), 腳踝(col26), 手腕(col17), 髖關節(col19, 20)
+    path 可為 txt 路徑或已載入的 KeypointTrack。
     """
-    data = []
-    with open(path, "r") as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) >= expected_cols:
-                try:
-                    frame_id = int(parts[0])
-                    bbox_x = float(parts[2])
-                    bbox_y = float(parts[3])
-                    bbox_width = float(parts[4])
-                    bbox_height = float(parts[5]) # 讀取 height
-                    col7 = float(parts[7])   # 頭x
-                    col8 = float(parts[8])   # 頭y
-                    shoulder_x = float(parts[10]) # 肩膀x
-                    col11 = float(parts[11]) # 肩膀y
-                    elbow_x = float(parts[13]) # 手肘x
-                    col14 = float(parts[14]) # 手肘y
-                    wrist_x = float(parts[16]) # 手腕x
-                    col17 = float(parts[17]) # 手腕y
-                    hip_x = float(parts[19]) # 髖關節 x
-                    hip_y = float(parts[20]) # 髖關節 y
-                    knee_x = float(parts[22]) # 膝蓋x
-                    col23 = float(parts[23]) # 膝蓋y
-                    ankle_x = float(parts[25]) # 腳踝x
-                    col26 = float(parts[26]) # 腳踝y
-                    
-                    data.append(
-                        (frame_id, bbox_x, bbox_y, bbox_width, bbox_height, col7, col8, shoulder_x, col11, elbow_x, col14, wrist_x, col17, hip_x, hip_y, knee_x, col23, ankle_x, col26)
-                    )
-                except:
-                    continue
-    return pd.DataFrame(
-        data,
-        columns=[
-            "frame_id",
-            "bbox_x",
-            "bbox_y",
-            "width",
-            "height", # 新增 height column
-            "head_x",
-            "col8",
-            "shoulder_x",
-            "shoulder_y",
-            "elbow_x",
-            "elbow_y",
-            "wrist_x",
-            "wrist_y",
-            "hip_x",
-            "hip_y",
-            "knee_x",
-            "knee_y",
-            "ankle_x",
-            "ankle_y"
-        ],
-    )
+    return load_keypoint_track(path).to_frame(CLEAN_COLUMNS)
 
 
 def calculate_angle(A, B, C):
@@ -305,10 +293,8 @@ def get_diving_swimming_segments(video_path, df, top_n=None): # top_n is depreca
         waterline_y
         segments: list of (s, e) tuples
     """
-    cap = cv2.VideoCapture(video_path)
-    ret, frame = cap.read()
-    cap.release()
-    if not ret:
+    frame = read_frame(video_path)
+    if frame is None:
         raise RuntimeError("影片無法讀取")
 
     waterline_y, _ = detect_waterline_y(frame)
@@ -320,6 +306,7 @@ def get_diving_swimming_segments(video_path, df, top_n=None): # top_n is depreca
     
     # 2. Find One Segment Per Lap
     found_segments = []
+    frame_index = FrameIndex(df["frame_id"].to_numpy())
     
     print(f"   [INFO] Detected {len(laps)} Laps (Ranges):")
     for idx, (f_start, f_end, trend) in enumerate(laps):
@@ -330,7 +317,7 @@ def get_diving_swimming_segments(video_path, df, top_n=None): # top_n is depreca
             continue
             
         # 擷取該 Lap 的資料子集
-        df_lap = df[(df["frame_id"] >= f_start) & (df["frame_id"] <= f_end)]
+        df_lap = df.iloc[frame_index.rows(f_start, f_end)]
         
         best_seg = find_best_segment_in_range(df_lap, waterline_y)
         if best_seg:
@@ -344,29 +331,13 @@ def get_diving_swimming_segments(video_path, df, top_n=None): # top_n is depreca
 
 def calculate_kick_angles_from_txt(file_path):
     """
-    讀取骨架關鍵點 txt，計算踢腿膝蓋角度，直接回傳 dataframe
+    讀取骨架關鍵點 txt (或 KeypointTrack)，計算踢腿膝蓋角度，直接回傳 dataframe
     不輸出檔案
     """
     angles_data = []
 
-    with open(file_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    for line in lines:
-        values = line.split()
-        if len(values) > 0 and values[0].isdigit():
-            frame_id = int(values[0])
-        else:
-            frame_id = -1
-
-        if "no" in values or len(values) < 21:
-            angles_data.append(
-                (frame_id, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan)
-            )
-            continue
-
-        values = list(map(float, values))
-
+    track = load_keypoint_track(file_path)
+    for frame_id, values in zip(track.frame_ids.tolist(), track.rows.tolist()):
         A = (values[19], values[20])  # 髖座標
         B = (values[22], values[23])  # 膝座標
         C = (values[25], values[26])  # 腳踝座標
@@ -436,10 +407,8 @@ def draw_trajectory_on_video(
     head_color=(0, 255, 255),
     line_thickness=3,
 ):
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    source = VideoSource(video_path, threaded=True)
+    fps, width, height = source.fps, source.width, source.height
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
     out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
 
@@ -448,7 +417,7 @@ def draw_trajectory_on_video(
     frame_id = 0
 
     while True:
-        ret, frame = cap.read()
+        ret, frame = source.read()
         if not ret:
             break
 
@@ -476,7 +445,7 @@ def draw_trajectory_on_video(
         out.write(frame)
         frame_id += 1
 
-    cap.release()
+    source.release()
     out.release()
 
 
@@ -503,10 +472,10 @@ def plot_kick_angle_waveform_with_lines_df(
     else:
         upper_angles = sub_df["upper_angle_inc"].values
 
-    # ===== 讀 keypoints =====
-    keypoints = np.loadtxt(keypoints_txt_path)
-    k_frames_all = keypoints[:, 0].astype(int)
-    ankle_x_all = keypoints[:, 25]
+    # ===== 讀 keypoints (txt 路徑或 KeypointTrack) =====
+    keypoints = load_keypoint_track(keypoints_txt_path)
+    k_frames_all = keypoints.frame_ids
+    ankle_x_all = keypoints.x("ankle")
 
     k_mask = (k_frames_all >= segment_start) & (k_frames_all <= segment_end)
     k_frames = k_frames_all[k_mask]
@@ -578,34 +547,81 @@ def plot_kick_angle_waveform_with_lines_df(
     return fig
 
 
-@st.cache_data
+def _kick_angle_fig_path(video_path, track, index):
+    """踢腿角度圖的輸出位置：與關鍵點檔同資料夾的 kick_angle_{index}_{影片名稱}.png。"""
+    base_dir = os.path.dirname(track.source_path or "")
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(base_dir, f"kick_angle_{index}_{base_name}.png")
+
+
 def analyze_diving_phase(
     video_path,
     keypoints_txt_path,
     output_video_path=None,
     lower_blue=(80, 50, 50),
     upper_blue=(140, 255, 255),
+    video_info=None,
 ):
     """
     主流程修改後，不再輸出 kickangle txt，直接使用 dataframe 計算
+    keypoints_txt_path: 平滑後 keypoints txt 路徑，或 orchestrator 已載入的 KeypointTrack
+    video_info: 已探測的 BD.video_info.VideoInfo (None 時自動 probe_video)
+
+    結果存在 diving_phase_cache (鍵為第一幀影像、關鍵點內容、水色範圍與影片幀數/寬度的雜湊)；
+    同一份上傳重新分析時直接回傳，踢腿角度圖從快取重新寫到本次的輸出位置。
     """
-    # 1. 水面
-    cap = cv2.VideoCapture(video_path)
-    ret, frame = cap.read()
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    if not ret:
-        cap.release()
+    track = load_keypoint_track(keypoints_txt_path)
+    video_info = video_info or probe_video(video_path)
+
+    frame = read_frame(video_path)
+    if frame is None:
         raise RuntimeError("Cannot read video frame.")
-    v_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    if not DIVING_CACHE:
+        return _analyze_diving_phase(video_path, track, frame, lower_blue, upper_blue, video_info)
+
+    key = content_hash(
+        DIVING_CACHE_VERSION,
+        frame,
+        track.rows,
+        tuple(lower_blue),
+        tuple(upper_blue),
+        video_info.frame_count,
+        video_info.width,
+    )
+    cached = diving_phase_cache.get(key)
+    if cached is not None:
+        result, figures = cached
+        for index, fig_key in enumerate(KICK_ANGLE_FIG_KEYS, start=1):
+            if figures.get(fig_key) is not None:
+                fig_path = _kick_angle_fig_path(video_path, track, index)
+                with open(fig_path, "wb") as f:
+                    f.write(figures[fig_key])
+                result[fig_key] = fig_path
+        print(f"   [CACHE] analyze_diving_phase hit ({diving_phase_cache.hit_rate():.0%} hit rate)")
+        return result
+
+    result = _analyze_diving_phase(video_path, track, frame, lower_blue, upper_blue, video_info)
+    figures = {}
+    for fig_key in KICK_ANGLE_FIG_KEYS:
+        if result.get(fig_key) is not None:
+            with open(result[fig_key], "rb") as f:
+                figures[fig_key] = f.read()
+    diving_phase_cache.put(key, (result, figures))
+    return result
+
+
+def _analyze_diving_phase(video_path, track, frame, lower_blue, upper_blue, video_info):
+    total_frames = video_info.frame_count
+    v_width = video_info.width
+
+    # 1. 水面
     waterline_y, _ = detect_waterline_y(frame, lower_blue, upper_blue)
 
     if waterline_y is None:
-        cap.release()
         raise RuntimeError("Cannot detect waterline.")
-    cap.release()
     # waterline_y = 190
     # 2. 讀取簡版 keypoints
-    df_clean = read_and_clean_txt(keypoints_txt_path)
+    df_clean = read_and_clean_txt(track)
 
     # --- NEW: Lap-based Detection ---
     laps = detect_laps_by_hip_x(df_clean)
@@ -615,7 +631,7 @@ def analyze_diving_phase(
         print(f"     -> Lap {i+1}: {trend} ({f_start}-{f_end})")
         if trend == "static":
             continue
-        df_lap = df_clean[(df_clean["frame_id"] >= f_start) & (df_clean["frame_id"] <= f_end)]
+        df_lap = df_clean.iloc[track.index.rows(f_start, f_end)]
         # Find best segment in this lap
         seg = find_best_segment_in_range(df_lap, waterline_y)
         if seg:
@@ -641,7 +657,7 @@ def analyze_diving_phase(
             "kick_angle_fig_2": None,
         }
     # 3. 計算踢腿角度 dataframe (全影片一次算完)
-    df_angles = calculate_kick_angles_from_txt(keypoints_txt_path)
+    df_angles = calculate_kick_angles_from_txt(track)
     
     # 4. 逐趟分析 (Per Lap Processing)
     laps_data = []
@@ -650,9 +666,8 @@ def analyze_diving_phase(
     all_diving_segments = []
 
     # 讀取腳踝與髖關節數據 (用於距離/位移計算)
-    keypoints = np.loadtxt(keypoints_txt_path)
-    # k_frames_all = keypoints[:, 0].astype(int)
-    # k_ankle_x_all = keypoints[:, 25]
+    # k_frames_all = track.frame_ids
+    # k_ankle_x_all = track.x("ankle")
     
     for i, (l_start, l_end, trend) in enumerate(laps):
         if trend == "static":
@@ -661,7 +676,7 @@ def analyze_diving_phase(
         print(f"   [ANALYSIS] Processing Lap {i+1}: {trend} ({l_start}-{l_end})")
         
         # (A) 尋找潛泳段 (S, E)
-        df_lap = df_clean[(df_clean["frame_id"] >= l_start) & (df_clean["frame_id"] <= l_end)]
+        df_lap = df_clean.iloc[track.index.rows(l_start, l_end)]
         
         # 優先嘗試：BBox 上緣判斷
         div_seg = find_best_segment_in_range(df_lap, waterline_y, use_bbox=True)
@@ -727,12 +742,13 @@ def analyze_diving_phase(
                 
             # (C) 角度與波型資料 (針對潛泳段)
             # 取出該區段的角度
-            sub_angles = df_angles[(df_angles["frame_id"] >= s_d) & (df_angles["frame_id"] <= e_d)]
+            # df_angles 與 track 逐列對齊，直接以 frame 索引取該段
+            sub_angles = df_angles.iloc[track.index.rows(s_d, e_d)]
             series_frames = sub_angles["frame_id"].tolist()
             series_values = sub_angles["angle"].tolist()
             
             # 找局部最小值 (波谷)
-            min_frames, min_vals = find_local_min_angles_df(df_angles, s_d, e_d)
+            min_frames, min_vals = find_local_min_angles_df(sub_angles, s_d, e_d)
             
             # 簡單計算位移 (使用 Frame 數暫代，或需讀取 Hip X 做差值)
             # Front-end usually needs relative distance. 
@@ -808,27 +824,21 @@ def analyze_diving_phase(
     if touch_frame is None:
         touch_frame = total_frames
     # 6. Save Kick Angle Waveforms
-    import os
-    base_dir = os.path.dirname(keypoints_txt_path)
-    base_name = os.path.splitext(os.path.basename(video_path))[0]
-    
-    fig1_path_rel = f"kick_angle_1_{base_name}.png"
-    fig1_path = os.path.join(base_dir, fig1_path_rel)
-    
+    fig1_path = _kick_angle_fig_path(video_path, track, 1)
+
     kick_angle_fig_1 = plot_kick_angle_waveform_with_lines_df(
-        df_angles, keypoints_txt_path, s1, e1, "Phase 1", draw_aux_lines=False, trend=trend_1
+        df_angles, track, s1, e1, "Phase 1", draw_aux_lines=False, trend=trend_1
     )
     kick_angle_fig_1.savefig(fig1_path)
     plt.close(kick_angle_fig_1)
 
     kick_angle_fig_2_path = None
     if s2 is not None:
-        fig2_path_rel = f"kick_angle_2_{base_name}.png"
-        fig2_path = os.path.join(base_dir, fig2_path_rel)
-        
+        fig2_path = _kick_angle_fig_path(video_path, track, 2)
+
         kick_angle_fig_2 = plot_kick_angle_waveform_with_lines_df(
             df_angles,
-            keypoints_txt_path,
+            track,
             s2,
             e2,
             "Phase 2",
@@ -890,14 +900,13 @@ def draw_multiple_segments_on_video(video_path, df, output_path, segments, line_
     Draws trajectories for multiple segments on the video.
     segments: list of tuples [(s1, e1), (s2, e2), ...]
     """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    try:
+        source = VideoSource(video_path, threaded=True)
+    except IOError:
         print(f"Error: Cannot open video: {video_path}")
         return
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps, width, height = source.fps, source.width, source.height
     
     # Try different codecs
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
@@ -905,7 +914,7 @@ def draw_multiple_segments_on_video(video_path, df, output_path, segments, line_
     
     if not out.isOpened():
         print(f"Error: Cannot open video writer: {output_path}")
-        cap.release()
+        source.release()
         return
 
     paths = [] 
@@ -924,7 +933,7 @@ def draw_multiple_segments_on_video(video_path, df, output_path, segments, line_
     last_seg_idx = -1
     
     while True:
-        ret, frame = cap.read()
+        ret, frame = source.read()
         if not ret:
             break
         
@@ -973,7 +982,7 @@ def draw_multiple_segments_on_video(video_path, df, output_path, segments, line_
         out.write(frame)
         frame_id += 1
 
-    cap.release()
+    source.release()
     out.release()
     print(f"   -> Saved Trajectory Video: {os.path.basename(output_path)}")
 
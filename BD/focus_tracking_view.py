@@ -1,5 +1,9 @@
 # BD/focus_tracking_view.py
 import cv2
+import numpy as np
+
+from BD.keypoint_track import load_keypoint_track
+from BD.video_source import VideoSource
 
 """
 先讀整個影片的最大範圍的bbox
@@ -10,16 +14,19 @@ import cv2
 
 
 def get_max_bbox_size(txt_path, padding1=80, padding2=80):
+    """
+    txt_path 可為 txt 路徑或已載入的 KeypointTrack。
+    BBOX 為 NaN 的幀略過；整段都沒有 BBOX 時只回傳 padding。
+    """
+    track = load_keypoint_track(txt_path)
     max_w = 0
     max_h = 0
-
-    with open(txt_path, "r") as f:
-        for line in f:
-            parts = line.strip().split()
-            w = float(parts[4])
-            h = float(parts[5])
-            max_w = max(max_w, w)
-            max_h = max(max_h, h)
+    widths = track.width[~np.isnan(track.width)]
+    heights = track.height[~np.isnan(track.height)]
+    if len(widths):
+        max_w = max(max_w, float(widths.max()))
+    if len(heights):
+        max_h = max(max_h, float(heights.max()))
 
     return int(max_w + padding1), int(max_h + padding2)
 
@@ -64,49 +71,71 @@ def crop_focus_frame(frame, hip_x, hip_y, box_w, box_h):
 #     cap.release()
 #     out.release()
 #     print(f"追焦影片輸出完成: {output_focus_path}")
-def export_focus_only_video(
-    video_path, txt_path, output_focus_path, padding1=80, padding2=80
-):
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
 
-    # 🎯 讀取影片原始長寬
-    original_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    original_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-    # 🎯 根據您的需求計算追焦尺寸
-    # 高度 = H * 0.25, 寬度 = H * 0.5 (保持 2:1 比例)
-    focus_h = int(original_h * 0.25)
-    focus_w = int(original_h * 0.5)
-    focus_size = (focus_w, focus_h)
+class _FocusCropper:
+    """
+    逐幀產生追焦畫面：每次 render(frame) 消耗關鍵點的一列 (與影片幀一一對應)。
+    供 export_focus_only_video 與 BD.video_postprocessor.render_focus_and_overlay 共用。
+    """
 
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    out = cv2.VideoWriter(output_focus_path, fourcc, fps, focus_size)
-
-    max_w, max_h = get_max_bbox_size(txt_path, padding1, padding2)
+    def __init__(self, txt_path, original_h, padding1=80, padding2=80):
+        # 🎯 根據您的需求計算追焦尺寸
+        # 高度 = H * 0.25, 寬度 = H * 0.5 (保持 2:1 比例)
+        focus_h = int(original_h * 0.25)
+        focus_w = int(original_h * 0.5)
+        self.focus_size = (focus_w, focus_h)
 
-    with open(txt_path, "r") as f:
-        lines = f.readlines()
+        track = load_keypoint_track(txt_path)
+        self.max_w, self.max_h = get_max_bbox_size(track, padding1, padding2)
 
-    for line in lines:
-        ret, frame = cap.read()
-        if not ret:
-            break
+        # 髖關節 (col19, col20) 為追焦中心
+        self._hips = iter(track.records([19, 20]))
 
-        parts = line.strip().split()
-        if len(parts) < 21:
-            continue
+    def render(self, frame):
+        """
+        回傳縮放後的追焦畫面 (新陣列，不共用 frame 的記憶體)；
+        該幀沒有偵測資料時回傳 None，關鍵點已讀完時回傳 False。
+        """
+        row = next(self._hips, None)
+        if row is None:
+            return False
 
-        hip_x, hip_y = float(parts[19]), float(parts[20])
+        _, hip_x, hip_y = row
+        if np.isnan(hip_x) or np.isnan(hip_y):
+            return None
 
         # 裁切出原始比例的框
-        focus_frame = crop_focus_frame(frame, hip_x, hip_y, max_w, max_h)
+        focus_frame = crop_focus_frame(frame, hip_x, hip_y, self.max_w, self.max_h)
 
         # 🎯 縮放到計算出的新尺寸 (H*0.5, H*0.25)
-        focus_resized = cv2.resize(focus_frame, focus_size)
+        return cv2.resize(focus_frame, self.focus_size)
+
 
-        out.write(focus_resized)
+def export_focus_only_video(
+    video_path, txt_path, output_focus_path, padding1=80, padding2=80
+):
+    source = VideoSource(video_path, threaded=True)
+    fps = source.fps
+
+    # 🎯 讀取影片原始長寬
+    cropper = _FocusCropper(txt_path, source.height, padding1, padding2)
+    focus_size = cropper.focus_size
+
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    out = cv2.VideoWriter(output_focus_path, fourcc, fps, focus_size)
+
+    while True:
+        ret, frame = source.read()
+        if not ret:
+            break
+
+        focus_resized = cropper.render(frame)
+        if focus_resized is False:
+            break
+        if focus_resized is not None:
+            out.write(focus_resized)
 
-    cap.release()
+    source.release()
     out.release()
     print(f"追焦影片輸出完成: {output_focus_path}, 尺寸: {focus_size}")
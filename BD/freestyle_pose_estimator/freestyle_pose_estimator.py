@@ -1,17 +1,18 @@
 # SwimAnalysisPro/freestyle_pose_estimator/freestyle_pose_estimator.py
 
-import torch
-from ultralytics import YOLO
 import cv2
 import os
 import numpy as np
 
+from BD.pose_model_registry import get_pose_model
+
 def run_pose_estimation(
     model_path: str,
     video_path: str,
     output_dir: str,
     save_video: bool = True,
-    save_txt: bool = True
+    save_txt: bool = True,
+    backend: str = None,
 ):
     """
     對影片進行姿態估計，輸出帶骨架的影片與預測結果 txt。
@@ -22,6 +23,7 @@ def run_pose_estimation(
         output_dir: 輸出資料夾（會自動建立）
         save_video: 是否輸出帶骨架的影片
         save_txt: 是否輸出預測結果 txt
+        backend: torch / onnx / openvino (見 BD/pose_backends.py)
 
     Returns:
         output_video_path: 輸出影片路徑或 None
@@ -29,7 +31,7 @@ def run_pose_estimation(
     """
 
     os.makedirs(output_dir, exist_ok=True)
-    model = YOLO(model_path)
+    model = get_pose_model(model_path, backend)
 
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
@@ -80,11 +82,11 @@ def run_pose_estimation(
         result = results[0]
 
         if result.keypoints is not None:
-            keypoints = result.keypoints.xy.cpu().numpy() if torch.cuda.is_available() else result.keypoints.xy.numpy()
+            keypoints = result.keypoints.xy.cpu().numpy()
 
             keypoints_conf = result.keypoints.conf
             if keypoints_conf is not None:
-                keypoints_conf = keypoints_conf.cpu().numpy() if torch.cuda.is_available() else keypoints_conf.numpy()
+                keypoints_conf = keypoints_conf.cpu().numpy()
             else:
                 keypoints_conf = np.zeros_like(keypoints[..., 0])
 
@@ -110,15 +112,15 @@ def run_pose_estimation(
                 f_txt.write(f"{frame_id} no detection\n")
                 no_detection_count += 1
             else:
-                xywh = result.boxes.xywh.cpu().numpy() if torch.cuda.is_available() else result.boxes.xywh.numpy()
-                confs = result.boxes.conf.cpu().numpy() if torch.cuda.is_available() else result.boxes.conf.numpy()
-                classes = result.boxes.cls.cpu().numpy() if torch.cuda.is_available() else result.boxes.cls.numpy()
+                xywh = result.boxes.xywh.cpu().numpy()
+                confs = result.boxes.conf.cpu().numpy()
+                classes = result.boxes.cls.cpu().numpy()
 
                 keypoints = None
                 keypoints_conf = None
                 if result.keypoints is not None:
-                    keypoints = result.keypoints.xy.cpu().numpy() if torch.cuda.is_available() else result.keypoints.xy.numpy()
-                    keypoints_conf = result.keypoints.conf.cpu().numpy() if torch.cuda.is_available() else result.keypoints.conf.numpy()
+                    keypoints = result.keypoints.xy.cpu().numpy()
+                    keypoints_conf = result.keypoints.conf.cpu().numpy()
 
                 for i, (box_xywh, conf, cls) in enumerate(zip(xywh, confs, classes)):
                     x_center, y_center, width, height = box_xywh
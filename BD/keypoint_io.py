@@ -0,0 +1,622 @@
+# BD/keypoint_io.py
+import io
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+"""
+姿態估計結果的二進位格式 (.npz)，可取代或搭配 _raw.txt。
+
+檔案內容 (N 為影片幀數，每幀一筆):
+- frame_ids: (N,) int64
+- detected:  (N,) bool，該幀是否有偵測到泳者
+- cls:       (N,) int16，類別 (未偵測到為 0)
+- bbox:      (N, 5) float32，[x_center, y_center, width, height, conf]
+- keypoints: (N, 7, 3) float32，[x, y, conf]
+未偵測到的幀 bbox / keypoints 為 NaN。
+
+另有平滑後關鍵點的記憶體映射存檔 (.npy + .npy.json)，見 save_keypoint_store；
+長期保存用的壓縮封存檔 (.kpz)，見 save_keypoint_archive；
+以及所有關鍵點 txt (_raw.txt 與平滑後 txt) 共用的解析器 parse_keypoint_txt。
+"""
+
+NUM_KEYPOINTS = 7
+NUM_COLUMNS = 7 + NUM_KEYPOINTS * 3  # 與 _raw.txt 相同的 28 欄
+
+# 欄位名稱 (與 _raw.txt 的 28 欄對應)
+KEYPOINT_COLUMN_NAMES = ["frame_id", "class", "x_center", "y_center", "width", "height", "conf"]
+for _i in range(1, NUM_KEYPOINTS + 1):
+    KEYPOINT_COLUMN_NAMES += [f"kp{_i}_x", f"kp{_i}_y", f"kp{_i}_conf"]
+
+
+def _parse_keypoint_line(line, num_columns=NUM_COLUMNS, expected_cols=None):
+    """
+    逐行解析一行關鍵點 txt (parse_keypoint_txt 的參考語意)：
+    "<frame> no detection" -> [frame, 0, NaN...]；欄位不足補 NaN、過多截斷；
+    空行或含無法轉成數字的值回傳 None (略過)。
+    指定 expected_cols 時，少於 expected_cols 個值的列 ("no detection" 以外) 也回傳 None。
+    """
+    parts = line.split()
+    if not parts:
+        return None
+    try:
+        if "no" in parts:
+            row = [float(parts[0]), 0.0]
+        elif expected_cols is not None and len(parts) < expected_cols:
+            return None
+        else:
+            row = [float(v) for v in parts[:num_columns]]
+    except ValueError:
+        return None
+    return row + [np.nan] * (num_columns - len(row))
+
+
+def _parse_keypoint_lines(lines, num_columns=NUM_COLUMNS, expected_cols=None):
+    rows = [_parse_keypoint_line(line, num_columns, expected_cols) for line in lines]
+    rows = [row for row in rows if row is not None]
+    if not rows:
+        return np.empty((0, num_columns), dtype=np.float64)
+    return np.array(rows, dtype=np.float64)
+
+
+# 只含一般十進位寫法 (無指數、無文字) 且每個值最多 15 個字元 (<= 15 位有效數字) 時，
+# pandas 預設的 "high" 解析 (整數尾數 / 10^k，一次正確捨入) 與 float() 逐位元相同，
+# 且比 float_precision="round_trip" 快約一倍；其他情況改用 round_trip。
+_PLAIN_NUMBER_BYTES = b"0123456789.-+ \t\r\n"
+_MAX_EXACT_TOKEN_LEN = 15
+
+
+def _float_precision_for(data):
+    if data.replace(b"no detection", b"").translate(None, _PLAIN_NUMBER_BYTES):
+        return "round_trip"
+    buf = np.frombuffer(data, dtype=np.uint8)
+    # 通過上面的檢查後，<= 32 的位元組只可能是空白或換行
+    bounds = np.concatenate(([-1], np.flatnonzero(buf <= 32), [len(buf)]))
+    if np.diff(bounds).max() - 1 > _MAX_EXACT_TOKEN_LEN:
+        return "round_trip"
+    return "high"
+
+
+def parse_keypoint_txt(path, num_columns=NUM_COLUMNS, expected_cols=None):
+    """
+    解析關鍵點 txt，回傳 (N, num_columns) float64 陣列，結果與逐行 _parse_keypoint_line 完全相同。
+    expected_cols 不為 None 時略過少於 expected_cols 個值的列 (與原本各分析模組
+    len(parts) >= expected_cols 的過濾相同)；預設欄位不足的列補 NaN。
+
+    以 pandas C parser 一次解析整個檔案 (數值與 Python float() 逐位元相同，見 _float_precision_for)，
+    "no"/"detection" 視為 NaN。含 NaN 的列 (未偵測幀、欄位不足、空行) 通常只佔少數，
+    再逐行以 _parse_keypoint_line 重新解析；多出的欄位與逐行版相同直接截斷。
+    遇到 C parser 無法處理的內容 (非數字的值) 時整檔退回逐行解析。
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    try:
+        df = pd.read_csv(
+            io.BytesIO(data),
+            sep=r"\s+",
+            header=None,
+            names=range(num_columns),
+            usecols=range(num_columns),
+            index_col=False,
+            na_values=["no", "detection"],
+            skip_blank_lines=False,
+            float_precision=_float_precision_for(data),
+        )
+    except (pd.errors.ParserError, pd.errors.EmptyDataError):
+        return _parse_keypoint_lines(data.decode("utf-8").splitlines(), num_columns, expected_cols)
+
+    if any(dtype.kind not in "iuf" for dtype in df.dtypes):
+        return _parse_keypoint_lines(data.decode("utf-8").splitlines(), num_columns, expected_cols)
+
+    rows = df.to_numpy(dtype=np.float64)
+    redo = np.flatnonzero(np.isnan(rows).any(axis=1))
+    if len(redo) == 0:
+        return rows
+
+    lines = data.splitlines()
+    if len(lines) != len(rows):
+        # 行數對不上 (特殊換行字元)：不冒險對位，整檔逐行解析
+        return _parse_keypoint_lines(data.decode("utf-8").splitlines(), num_columns, expected_cols)
+
+    keep = np.ones(len(rows), dtype=bool)
+    for i in redo:
+        row = _parse_keypoint_line(lines[i].decode("utf-8"), num_columns, expected_cols)
+        if row is None:
+            keep[i] = False
+        else:
+            rows[i] = row
+    return rows if keep.all() else rows[keep]
+
+
+def write_keypoint_txt(path, rows, int_columns=(0, 1), chunk_rows=10000, no_detection=False):
+    """
+    將 (N, C) 數值陣列寫成關鍵點 txt：int_columns 欄位為 str(int(v))，其餘為 f"{v:.6f}"，
+    以空白分隔、每列一行 (與逐列 iterrows + " ".join 的輸出逐位元組相同)。
+    no_detection=True 時依 _raw.txt 的寫法：除 int_columns 外全為 NaN 的列寫成
+    "<frame> no detection"，關鍵點欄位 (第 7 欄之後) 全為 NaN 的列只寫前 7 欄 (BBOX)。
+
+    每列以預先組好的 % 格式字串一次格式化、分批寫入；
+    先寫 path + ".tmp" 再 rename，中途失敗不會留下半個檔案。
+    """
+    rows = np.asarray(rows, dtype=np.float64)
+    if rows.ndim != 2:
+        raise ValueError(f"Expected a 2-D array, got {rows.shape}")
+    # "%d" % float 與 str(int(float)) 相同 (向 0 截斷；NaN 同樣丟出 ValueError)
+    line_format = " ".join(
+        "%d" if i in int_columns else "%.6f" for i in range(rows.shape[1])
+    ) + "\n"
+    bbox_format = " ".join("%d" if i in int_columns else "%.6f" for i in range(7)) + "\n"
+    value_columns = [i for i in range(rows.shape[1]) if i not in int_columns]
+    undetected = np.zeros(len(rows), dtype=bool)
+    bbox_only = np.zeros(len(rows), dtype=bool)
+    if no_detection and value_columns:
+        undetected = np.isnan(rows[:, value_columns]).all(axis=1)
+        if rows.shape[1] > 7:
+            bbox_only = ~undetected & np.isnan(rows[:, 7:]).all(axis=1)
+
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            for start in range(0, len(rows), chunk_rows):
+                chunk = rows[start : start + chunk_rows].tolist()
+                skip = undetected[start : start + chunk_rows].tolist()
+                short = bbox_only[start : start + chunk_rows].tolist()
+                f.write("".join([
+                    "%d no detection\n" % row[0] if missing
+                    else bbox_format % tuple(row[:7]) if no_kpts
+                    else line_format % tuple(row)
+                    for row, missing, no_kpts in zip(chunk, skip, short)
+                ]))
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+def round_keypoint_txt_values(rows, int_columns=(0, 1)):
+    """
+    回傳 rows 經 write_keypoint_txt 寫出、再以 parse_keypoint_txt 讀回後的值
+    (int_columns 向 0 截斷，其餘欄位等同 float(f"{v:.6f}"))，不必真的寫檔再讀回。
+
+    np.round(v, 6) 為 rint(v * 1e6) / 1e6：整數除以 1e6 是正確捨入的，
+    只有 v * 1e6 落在 .5 附近 (乘法誤差可能跨過進位點) 時才改用字串格式化決定。
+    """
+    rows = np.asarray(rows, dtype=np.float64)
+    rounded = np.round(rows, 6)
+    with np.errstate(invalid="ignore"):
+        scaled = rows * 1e6
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) <= 4 * np.abs(np.spacing(scaled))
+    for r, c in zip(*np.nonzero(near_half)):
+        rounded[r, c] = float("%.6f" % rows[r, c])
+    for i in int_columns:
+        rounded[:, i] = np.trunc(rows[:, i])
+    return rounded
+
+
+def save_keypoint_npz(path, frame_ids, detected, rows):
+    """
+    將 run_pose_estimation 的逐幀結果存成 .npz。
+    rows: (N, 6 + 3K)，每列為 [cls, x, y, w, h, conf, kpt_x, kpt_y, kpt_conf, ...]
+    """
+    frame_ids = np.asarray(frame_ids, dtype=np.int64)
+    detected = np.asarray(detected, dtype=bool)
+    rows = np.asarray(rows, dtype=np.float32).reshape(len(frame_ids), -1)
+
+    num_keypoints = (rows.shape[1] - 6) // 3 if rows.shape[1] > 6 else NUM_KEYPOINTS
+    cls = np.zeros(len(frame_ids), dtype=np.int16)
+    bbox = np.full((len(frame_ids), 5), np.nan, dtype=np.float32)
+    keypoints = np.full((len(frame_ids), num_keypoints, 3), np.nan, dtype=np.float32)
+
+    if rows.shape[1] > 6:
+        cls[detected] = rows[detected, 0].astype(np.int16)
+        bbox[detected] = rows[detected, 1:6]
+        keypoints[detected] = rows[detected, 6:].reshape(-1, num_keypoints, 3)
+
+    np.savez(
+        path,
+        frame_ids=frame_ids,
+        detected=detected,
+        cls=cls,
+        bbox=bbox,
+        keypoints=keypoints,
+    )
+    return path
+
+
+def load_keypoint_npz(path):
+    """讀取 .npz，回傳 dict (frame_ids, detected, cls, bbox, keypoints)。"""
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def keypoints_to_rows(data):
+    """
+    重建與 _raw.txt 相同的 28 欄版面 (N, 28) float64：
+    frame_id cls x_center y_center width height conf (kpt_x kpt_y kpt_conf)*7
+    未偵測到的幀與 process_keypoints_txt 相同，為 [frame_id, 0, NaN, ...]。
+    """
+    n = len(data["frame_ids"])
+    rows = np.full((n, 7 + data["keypoints"].shape[1] * 3), np.nan, dtype=np.float64)
+    rows[:, 0] = data["frame_ids"]
+    rows[:, 1] = data["cls"]
+    rows[:, 2:7] = data["bbox"]
+    rows[:, 7:] = data["keypoints"].reshape(n, -1)
+    return rows
+
+
+def load_keypoint_rows(path):
+    """直接從 .npz 讀出 28 欄陣列。"""
+    return keypoints_to_rows(load_keypoint_npz(path))
+
+
+def npz_to_txt(npz_path, txt_path):
+    """把 .npz 轉回 _raw.txt 文字格式 (與 run_pose_estimation 輸出的文字完全相同)。"""
+    return write_keypoint_txt(txt_path, load_keypoint_rows(npz_path), no_detection=True)
+
+
+# --- 記憶體映射存檔 (平滑後的 28 欄關鍵點) ---
+#
+# {name}.npy       (N, 28) float64，版面與平滑後 txt 相同
+# {name}.npy.json  schema 資訊 (版本、幀數、欄數、dtype)
+#
+# 多個 process (逐趟分析、渲染、重新辨識) 以 np.memmap 共用同一份檔案，
+# 不必各自解析 txt 並在記憶體中各留一份；長時間影片的常駐記憶體因此不隨影片長度增加。
+
+KEYPOINT_STORE_FORMAT = "swim-keypoints"
+KEYPOINT_STORE_VERSION = 1
+
+
+def keypoint_store_meta_path(path):
+    return path + ".json"
+
+
+def save_keypoint_store(path, rows):
+    """
+    將 (N, 28) 關鍵點陣列存成可記憶體映射的 .npy 與 schema 檔。
+    兩個檔案都先寫 .tmp 再 rename；schema 檔最後寫入，存在即代表 .npy 完整。
+    """
+    rows = np.ascontiguousarray(rows, dtype=np.float64)
+    if rows.ndim != 2 or rows.shape[1] != NUM_COLUMNS:
+        raise ValueError(f"Expected an (N, {NUM_COLUMNS}) keypoint array, got {rows.shape}")
+
+    meta = {
+        "format": KEYPOINT_STORE_FORMAT,
+        "schema_version": KEYPOINT_STORE_VERSION,
+        "frame_count": int(rows.shape[0]),
+        "columns": NUM_COLUMNS,
+        "dtype": "float64",
+    }
+    meta_path = keypoint_store_meta_path(path)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    tmp_meta_path = meta_path + ".tmp"
+    with open(tmp_meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, sort_keys=True)
+    os.replace(tmp_meta_path, meta_path)
+    return path
+
+
+def read_keypoint_store_meta(path):
+    """讀取並驗證 schema 檔；格式或版本不符時丟出 ValueError。"""
+    meta_path = keypoint_store_meta_path(path)
+    if not os.path.exists(meta_path):
+        raise ValueError(f"Keypoint store is missing its schema file: {meta_path}")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != KEYPOINT_STORE_FORMAT:
+        raise ValueError(f"Not a keypoint store: {path}")
+    if meta.get("schema_version") != KEYPOINT_STORE_VERSION:
+        raise ValueError(
+            f"Unsupported keypoint store version {meta.get('schema_version')} "
+            f"(expected {KEYPOINT_STORE_VERSION}): {path}"
+        )
+    return meta
+
+
+def open_keypoint_store(path, mmap_mode="r"):
+    """
+    以 np.memmap 開啟 save_keypoint_store 的 .npy (預設唯讀)，回傳 (N, 28) float64 陣列。
+    mmap_mode 與 np.load 相同："r" 唯讀、"r+" 可寫回檔案、"c" copy-on-write。
+    """
+    meta = read_keypoint_store_meta(path)
+    rows = np.load(path, mmap_mode=mmap_mode)
+    if rows.dtype != np.float64 or rows.ndim != 2 or rows.shape[1] != meta["columns"]:
+        raise ValueError(f"Keypoint store layout does not match its schema: {path}")
+    if rows.shape[0] != meta["frame_count"]:
+        raise ValueError(
+            f"Keypoint store has {rows.shape[0]} frames but its schema records "
+            f"{meta['frame_count']}: {path}"
+        )
+    return rows
+
+
+# --- 壓縮封存檔 (.kpz，長期保存大量 session 用) ---
+#
+# np.savez_compressed 的 zip 容器，內容:
+# - schema:          JSON 字串 (格式名稱、版本、幀數、28 欄名稱、各欄小數位數、整數型別)
+# - frame_id_deltas: (N,) int64，frame_id 的差分
+# - cls:             (N,) int32
+# - values:          其餘 26 欄以定點整數 (round(v * 10**decimals)) 儲存；沿時間差分後
+#                    依位元組重新排列 (byte shuffle)，zlib 對平滑軌跡的壓縮率因此大幅提高
+# - missing:         (26, N) NaN 位置 (np.packbits)
+# 預設 decimals 全為 6 (KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS)，與 txt 數值完全相同；
+# 封存檔是長期保存的唯一副本 (txt 轉換後可刪除)，之後重新分析的結果必須與原 txt 相同，因此預設無損。
+# 需要更小的檔案時明確指定較少位數 (pack --compact：座標 2 位、信心度 3 位，
+# 誤差 <= 0.005 px / 0.0005)；精度記錄在 schema 內，讀取這類有損封存檔時會記錄警告。
+#
+# 實測 20000 幀的平滑後 txt (5.5 MB，約 5% no detection)：
+#   無損 (6/6 位)      1.39 MB  約 4x
+#   --compact (2/3 位) 0.74 MB  約 7.5x
+# 信心度幾乎沒有時間相關性，是壓縮後剩下的主要部分；座標 6 位小數的最後幾位同樣接近雜訊。
+
+KEYPOINT_ARCHIVE_FORMAT = "swim-keypoint-archive"
+KEYPOINT_ARCHIVE_VERSION = 1
+KEYPOINT_ARCHIVE_SUFFIX = ".kpz"
+# txt 以 6 位小數寫出，6 位即可無損保存
+KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS = 6
+# pack --compact 的有損精度：座標 0.01 px、信心度 0.001 (捨入誤差為其一半)
+KEYPOINT_ARCHIVE_COMPACT_DECIMALS = 2
+KEYPOINT_ARCHIVE_COMPACT_CONF_DECIMALS = 3
+CONF_COLUMNS = (6,) + tuple(7 + 3 * k + 2 for k in range(NUM_KEYPOINTS))
+
+
+def _value_decimals(decimals, conf_decimals):
+    return [conf_decimals if i in CONF_COLUMNS else decimals for i in range(2, NUM_COLUMNS)]
+
+
+def _shuffle_bytes(values):
+    """(C, N) 整數 -> (C, itemsize, N) uint8：同一位元組位置的資料放在一起。"""
+    values = np.ascontiguousarray(values)
+    planes = values.view(np.uint8).reshape(*values.shape, values.itemsize)
+    shuffled = np.empty((values.shape[0], values.itemsize, values.shape[1]), dtype=np.uint8)
+    for k in range(values.itemsize):  # 逐位元組平面複製，比整塊 transpose 快
+        shuffled[:, k] = planes[:, :, k]
+    return shuffled
+
+
+def _unshuffle_bytes(shuffled, dtype):
+    dtype = np.dtype(dtype)
+    values = np.empty((shuffled.shape[0], shuffled.shape[2]), dtype=dtype)
+    planes = values.view(np.uint8).reshape(*values.shape, dtype.itemsize)
+    for k in range(dtype.itemsize):
+        planes[:, :, k] = shuffled[:, k]
+    return values
+
+
+def save_keypoint_archive(
+    path,
+    rows,
+    decimals=KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS,
+    conf_decimals=KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS,
+):
+    """
+    將 (N, 28) 關鍵點陣列存成壓縮封存檔 (先寫 .tmp 再 rename)，回傳 path。
+    decimals / conf_decimals: 座標 (BBOX 與關鍵點 xy) 與信心度保留的小數位數 (0 ~ 6)；
+    預設 6 位為無損 (與 txt 數值相同，約為 txt 的 1/4)，較少位數檔案較小但會捨入
+    (誤差 <= 0.5 * 10**-decimals；2 / 3 位約為 txt 的 1/7.5，見上方實測)。
+    """
+    rows = np.asarray(rows, dtype=np.float64)
+    if rows.ndim != 2 or rows.shape[1] != NUM_COLUMNS:
+        raise ValueError(f"Expected an (N, {NUM_COLUMNS}) keypoint array, got {rows.shape}")
+    if np.isnan(rows[:, :2]).any():
+        raise ValueError("frame_id / class columns must not contain NaN")
+    if not (0 <= decimals <= 6 and 0 <= conf_decimals <= 6):
+        raise ValueError("decimals must be between 0 and 6")
+
+    value_decimals = _value_decimals(decimals, conf_decimals)
+    scale = 10.0 ** np.array(value_decimals, dtype=np.float64)[:, None]
+    quantized = np.round(rows[:, 2:].T * scale)
+    missing = np.isnan(quantized)
+
+    # 缺值沿用前一個有效值 (開頭為 0)，差分後缺口不會變成兩次大跳動
+    positions = np.where(missing, 0, np.arange(quantized.shape[1]))
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    filled = np.take_along_axis(quantized, positions, axis=1)
+    filled[np.isnan(filled)] = 0
+    deltas = np.diff(filled.astype(np.int64), axis=1, prepend=0)
+    value_dtype = np.int32
+    if deltas.size and np.abs(deltas).max() > np.iinfo(np.int32).max:
+        value_dtype = np.int64
+
+    schema = {
+        "format": KEYPOINT_ARCHIVE_FORMAT,
+        "schema_version": KEYPOINT_ARCHIVE_VERSION,
+        "frame_count": int(rows.shape[0]),
+        "columns": KEYPOINT_COLUMN_NAMES,
+        "decimals": dict(zip(KEYPOINT_COLUMN_NAMES[2:], value_decimals)),
+        "value_dtype": np.dtype(value_dtype).name,
+    }
+    frame_ids = rows[:, 0].astype(np.int64)
+
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                schema=np.array(json.dumps(schema, sort_keys=True)),
+                frame_id_deltas=np.diff(frame_ids, prepend=0),
+                cls=rows[:, 1].astype(np.int32),
+                values=_shuffle_bytes(deltas.astype(value_dtype)),
+                missing=np.packbits(missing),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+def _check_archive_schema(schema, path):
+    if schema.get("format") != KEYPOINT_ARCHIVE_FORMAT:
+        raise ValueError(f"Not a keypoint archive: {path}")
+    if schema.get("schema_version") != KEYPOINT_ARCHIVE_VERSION:
+        raise ValueError(
+            f"Unsupported keypoint archive version {schema.get('schema_version')} "
+            f"(expected {KEYPOINT_ARCHIVE_VERSION}): {path}"
+        )
+    if schema.get("columns") != KEYPOINT_COLUMN_NAMES:
+        raise ValueError(f"Keypoint archive columns do not match the 28-column layout: {path}")
+    return schema
+
+
+def read_keypoint_archive_schema(path):
+    """只讀取並驗證封存檔的 schema；格式、版本或欄位不符時丟出 ValueError。"""
+    with np.load(path, allow_pickle=False) as data:
+        if "schema" not in data.files:
+            raise ValueError(f"Keypoint archive is missing its schema: {path}")
+        return _check_archive_schema(json.loads(str(data["schema"])), path)
+
+
+def load_keypoint_archive(path):
+    """
+    讀取封存檔，回傳 (N, 28) float64 陣列 (版面與平滑後 txt 相同)。
+    以少於 6 位小數存的有損封存檔會記錄警告。
+    陣列為欄優先 (Fortran order)：逐欄解碼不必再轉置，取單一欄位 (rows[:, i]) 也是連續記憶體。
+    """
+    with np.load(path, allow_pickle=False) as data:
+        if "schema" not in data.files:
+            raise ValueError(f"Keypoint archive is missing its schema: {path}")
+        schema = _check_archive_schema(json.loads(str(data["schema"])), path)
+        frame_ids = np.cumsum(data["frame_id_deltas"])
+        cls = data["cls"]
+        deltas = _unshuffle_bytes(data["values"], np.dtype(schema["value_dtype"]))
+        packed_missing = data["missing"]
+
+    n = schema["frame_count"]
+    num_values = NUM_COLUMNS - 2
+    if len(frame_ids) != n or deltas.shape != (num_values, n):
+        raise ValueError(f"Keypoint archive content does not match its schema: {path}")
+    missing = np.unpackbits(packed_missing, count=num_values * n).reshape(num_values, n).astype(bool)
+
+    decimals = [schema["decimals"][name] for name in KEYPOINT_COLUMN_NAMES[2:]]
+    if min(decimals) < KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS:
+        logging.warning(
+            f"Keypoint archive {path} was saved with reduced precision "
+            f"({min(decimals)} decimals); values differ from the original txt"
+        )
+    scale = 10.0 ** np.array(decimals, dtype=np.float64)[:, None]
+
+    columns = np.empty((NUM_COLUMNS, n), dtype=np.float64)
+    columns[0] = frame_ids
+    columns[1] = cls
+    np.divide(np.cumsum(deltas, axis=1, dtype=np.int64), scale, out=columns[2:])
+    columns[2:][missing] = np.nan
+    return columns.T
+
+
+def txt_to_keypoint_archive(
+    txt_path,
+    archive_path=None,
+    decimals=KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS,
+    conf_decimals=KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS,
+):
+    """關鍵點 txt (_raw.txt 或平滑後 txt) 轉成封存檔，預設存在同一位置的 {base}.kpz。"""
+    if archive_path is None:
+        archive_path = os.path.splitext(txt_path)[0] + KEYPOINT_ARCHIVE_SUFFIX
+    return save_keypoint_archive(archive_path, parse_keypoint_txt(txt_path), decimals, conf_decimals)
+
+
+def keypoint_archive_to_txt(archive_path, txt_path=None):
+    """
+    封存檔轉回關鍵點 txt (預設 {base}.txt)；未偵測到的幀寫成 "<frame> no detection"。
+    無損 (預設 6 位小數) 的封存檔轉回後，parse_keypoint_txt 讀到的數值與原始 txt 完全相同。
+    """
+    if txt_path is None:
+        txt_path = os.path.splitext(archive_path)[0] + ".txt"
+    return write_keypoint_txt(txt_path, load_keypoint_archive(archive_path), no_detection=True)
+
+
+def _archive_report(txt_paths, decimals, conf_decimals):
+    """pack：逐檔轉換並比較 txt / 封存檔的大小與讀取時間。"""
+    import time
+
+    totals = {"txt_bytes": 0, "archive_bytes": 0, "txt_seconds": 0.0, "archive_seconds": 0.0}
+    for txt_path in txt_paths:
+        start = time.perf_counter()
+        rows = parse_keypoint_txt(txt_path)
+        totals["txt_seconds"] += time.perf_counter() - start
+
+        archive_path = os.path.splitext(txt_path)[0] + KEYPOINT_ARCHIVE_SUFFIX
+        save_keypoint_archive(archive_path, rows, decimals, conf_decimals)
+        start = time.perf_counter()
+        load_keypoint_archive(archive_path)
+        totals["archive_seconds"] += time.perf_counter() - start
+
+        totals["txt_bytes"] += os.path.getsize(txt_path)
+        totals["archive_bytes"] += os.path.getsize(archive_path)
+        print(f"✅ {archive_path} ({len(rows)} 幀)")
+
+    if txt_paths and totals["archive_bytes"]:
+        print(
+            f"\n{len(txt_paths)} 個檔案: 大小 {totals['txt_bytes'] / 1e6:.1f} MB -> "
+            f"{totals['archive_bytes'] / 1e6:.1f} MB ({totals['txt_bytes'] / totals['archive_bytes']:.1f}x), "
+            f"讀取 {totals['txt_seconds']:.2f}s -> {totals['archive_seconds']:.2f}s "
+            f"({totals['txt_seconds'] / max(totals['archive_seconds'], 1e-9):.1f}x)"
+        )
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Convert keypoint txt files to/from .kpz archives")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_pack = sub.add_parser("pack", help="txt -> .kpz (files or folders)")
+    p_pack.add_argument("paths", nargs="+")
+    p_pack.add_argument(
+        "--compact", action="store_true",
+        help=(
+            f"lossy, about half the lossless size: {KEYPOINT_ARCHIVE_COMPACT_DECIMALS} coordinate / "
+            f"{KEYPOINT_ARCHIVE_COMPACT_CONF_DECIMALS} confidence decimals"
+        ),
+    )
+    p_pack.add_argument(
+        "--decimals", type=int, default=None,
+        help="coordinate decimals (default 6 = lossless; fewer = smaller, lossy archive)",
+    )
+    p_pack.add_argument(
+        "--conf-decimals", type=int, default=None,
+        help="confidence decimals (default 6 = lossless; fewer = smaller, lossy archive)",
+    )
+    p_unpack = sub.add_parser("unpack", help=".kpz -> txt")
+    p_unpack.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    suffix = ".txt" if args.command == "pack" else KEYPOINT_ARCHIVE_SUFFIX
+    files = []
+    for path in args.paths:
+        files += sorted(glob.glob(os.path.join(path, "*" + suffix))) if os.path.isdir(path) else [path]
+
+    if args.command == "pack":
+        decimals, conf_decimals = KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS, KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS
+        if args.compact:
+            decimals = KEYPOINT_ARCHIVE_COMPACT_DECIMALS
+            conf_decimals = KEYPOINT_ARCHIVE_COMPACT_CONF_DECIMALS
+        if args.decimals is not None:
+            decimals = args.decimals
+        if args.conf_decimals is not None:
+            conf_decimals = args.conf_decimals
+        _archive_report(files, decimals, conf_decimals)
+    else:
+        for archive_path in files:
+            print(f"✅ {keypoint_archive_to_txt(archive_path)}")
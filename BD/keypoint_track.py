@@ -0,0 +1,258 @@
+# BD/keypoint_track.py
+import math
+
+import numpy as np
+import pandas as pd
+
+from BD.keypoint_io import (
+    KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS,
+    KEYPOINT_ARCHIVE_SUFFIX,
+    NUM_COLUMNS,
+    NUM_KEYPOINTS,
+    load_keypoint_archive,
+    open_keypoint_store,
+    parse_keypoint_txt,
+    save_keypoint_archive,
+    save_keypoint_store,
+)
+
+"""
+平滑後關鍵點檔 (data/keypoints/{base_name}.txt) 的記憶體版本。
+
+orchestrator 在 Step 2 之後只解析一次，再把同一個 KeypointTrack 傳給各分析模組，
+不再由每個模組各自開檔、逐行 split。原本接收 txt 路徑的函式仍可傳路徑
+(內部以 load_keypoint_track 轉換)，也可以直接傳 KeypointTrack。
+
+rows 與 txt 相同的 28 欄版面 (N, 28)：
+frame_id cls x_center y_center width height conf (kpt_x kpt_y kpt_conf)*7
+以 float64 保存，數值與原本逐行 float() 解析完全相同，下游門檻判斷結果不變。
+
+逐趟分析以 frame_id 區間取資料：track[s:e] / track.between(s, e) 透過 FrameIndex
+直接換算成列位置，回傳共用記憶體的 view，成本只與該趟長度有關，不必每趟掃描整支影片。
+
+track.save_store(path) / KeypointTrack.from_store(path) 以記憶體映射的 .npy 保存與開啟
+(格式見 BD.keypoint_io)。從存檔開啟的 track (及其切片) pickle 時只傳檔案路徑與列範圍，
+送到 process pool 的 worker 後重新映射同一份檔案，不會複製整份陣列。
+長期保存則用 track.save_archive(path) / KeypointTrack.from_archive(path) 的壓縮封存檔 (.kpz)。
+"""
+
+# 關鍵點順序 (kp1 ~ kp7)，x 欄位 = 7 + 3 * index
+JOINTS = ("head", "shoulder", "elbow", "wrist", "hip", "knee", "ankle")
+
+BBOX_COLUMNS = {"cls": 1, "x_center": 2, "y_center": 3, "width": 4, "height": 5, "conf": 6}
+
+
+def joint_column(joint, axis="x"):
+    """回傳關節在 28 欄版面中的欄位索引，例如 joint_column("hip", "y") == 20。"""
+    offset = {"x": 0, "y": 1, "conf": 2}[axis]
+    return 7 + 3 * JOINTS.index(joint) + offset
+
+
+class FrameIndex:
+    """
+    frame_id -> 列位置的索引。
+
+    frame_id 遞增 (平滑後 txt 的正常情況) 時預先建好位移表，rows(start, end) 為 O(1)
+    並回傳 slice；frame_id 跨度遠大於列數時改用二分搜尋；未排序時退回逐列比對。
+    """
+
+    def __init__(self, frame_ids):
+        frame_ids = np.asarray(frame_ids, dtype=np.int64)
+        self.size = len(frame_ids)
+        self.is_sorted = bool(np.all(frame_ids[1:] >= frame_ids[:-1]))
+        self._frame_ids = frame_ids
+        self._offsets = None
+        self._first = 0
+        if self.is_sorted and self.size:
+            self._first = int(frame_ids[0])
+            span = int(frame_ids[-1]) - self._first + 1
+            if span <= 4 * self.size + 1024:
+                # _offsets[k] = frame_id < first + k 的列數
+                self._offsets = np.searchsorted(
+                    frame_ids, np.arange(self._first, self._first + span + 1), side="left"
+                )
+
+    def _offset(self, frame_id):
+        """frame_id 小於 frame_id 參數的列數 (即第一個 >= frame_id 的列位置)。"""
+        if self._offsets is None:
+            return int(np.searchsorted(self._frame_ids, frame_id, side="left"))
+        k = frame_id - self._first
+        if k <= 0:
+            return 0
+        if k >= len(self._offsets):
+            return self.size
+        return int(self._offsets[k])
+
+    def rows(self, start=None, end=None):
+        """
+        frame_id 落在 [start, end] (含兩端，None 表示不限) 的列；
+        frame_id 遞增時回傳 slice (可直接用於 ndarray 或 DataFrame.iloc)，否則回傳位置陣列。
+        """
+        lo = -math.inf if start is None else start
+        hi = math.inf if end is None else end
+        if lo != lo or hi != hi:
+            return slice(0, 0)  # NaN 邊界：與 (frame >= start) & (frame <= end) 相同，沒有任何列
+        if not self.is_sorted:
+            return np.flatnonzero((self._frame_ids >= lo) & (self._frame_ids <= hi))
+        if hi < lo:
+            return slice(0, 0)
+        a = 0 if start is None else self._offset(math.ceil(start))
+        b = self.size if end is None else self._offset(math.floor(end) + 1)
+        return slice(a, max(a, b))
+
+
+class KeypointTrack:
+    """
+    一支影片的逐幀關鍵點 (欄式 NumPy 陣列)。
+
+    - track.frame_ids: (N,) int64
+    - track.column(i): 第 i 欄 (與 txt 的欄位編號相同)
+    - track.x("hip") / track.y("wrist") / track.conf("knee"): 關節座標
+    - track.x_center / y_center / width / height: BBOX 欄位
+    - track[s:e]: frame_id 在 [s, e) 的子集 (view)；track.between(s, e) 含兩端
+    - track.index: FrameIndex，用於對齊同一份 track 建立的 DataFrame (df.iloc[track.index.rows(s, e)])
+    """
+
+    def __init__(self, rows, source_path=None):
+        rows = np.asanyarray(rows, dtype=np.float64)
+        if rows.ndim != 2 or rows.shape[1] < NUM_COLUMNS:
+            raise ValueError(f"Expected an (N, {NUM_COLUMNS}) keypoint array, got {rows.shape}")
+        self.rows = rows
+        self.frame_ids = rows[:, 0].astype(np.int64)
+        self.source_path = source_path
+        self._index = None
+        self._store = None  # (path, mmap_mode, start, stop)：從 .npy 存檔映射時的來源
+
+    @classmethod
+    def _view(cls, parent, rows):
+        """以 parent 的列子集 (slice 為 view，位置陣列為複本) 建立 KeypointTrack，不重新轉型。"""
+        track = cls.__new__(cls)
+        track.rows = parent.rows[rows]
+        track.frame_ids = parent.frame_ids[rows]
+        track.source_path = parent.source_path
+        track._index = None
+        track._store = None
+        if parent._store is not None and isinstance(rows, slice):
+            path, mmap_mode, start, _ = parent._store
+            first, last, _ = rows.indices(len(parent))
+            track._store = (path, mmap_mode, start + first, start + max(first, last))
+        return track
+
+    @classmethod
+    def from_txt(cls, path):
+        # 欄位不足的列略過 (與原本各分析模組逐行讀取時相同)，"no detection" 幀保留為 NaN
+        return cls(parse_keypoint_txt(path, expected_cols=NUM_COLUMNS), source_path=path)
+
+    @classmethod
+    def from_store(cls, path, mmap_mode="r"):
+        """以記憶體映射開啟 save_store 的 .npy (預設唯讀)。"""
+        track = cls(open_keypoint_store(path, mmap_mode), source_path=path)
+        track._store = (path, mmap_mode, 0, len(track))
+        return track
+
+    def save_store(self, path):
+        """存成可記憶體映射的 .npy (附 schema 檔)，回傳 path。"""
+        return save_keypoint_store(path, self.rows)
+
+    @classmethod
+    def from_archive(cls, path):
+        return cls(load_keypoint_archive(path), source_path=path)
+
+    def save_archive(
+        self,
+        path,
+        decimals=KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS,
+        conf_decimals=KEYPOINT_ARCHIVE_LOSSLESS_DECIMALS,
+    ):
+        """存成壓縮封存檔 .kpz (見 BD.keypoint_io.save_keypoint_archive；預設無損)，回傳 path。"""
+        return save_keypoint_archive(path, self.rows, decimals, conf_decimals)
+
+    def __reduce_ex__(self, protocol):
+        if self._store is None:
+            return super().__reduce_ex__(protocol)
+        return (_open_store_rows, self._store)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = FrameIndex(self.frame_ids)
+        return self._index
+
+    def __getitem__(self, key):
+        """track[s:e]：frame_id 在 [s, e) 的子集 (以 frame_id 而非列位置切片)。"""
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError("KeypointTrack only supports frame_id slices, e.g. track[start:end]")
+        end = None if key.stop is None else key.stop - 1
+        return KeypointTrack._view(self, self.index.rows(key.start, end))
+
+    def column(self, index):
+        return self.rows[:, index]
+
+    def x(self, joint):
+        return self.rows[:, joint_column(joint, "x")]
+
+    def y(self, joint):
+        return self.rows[:, joint_column(joint, "y")]
+
+    def conf(self, joint):
+        return self.rows[:, joint_column(joint, "conf")]
+
+    @property
+    def x_center(self):
+        return self.rows[:, BBOX_COLUMNS["x_center"]]
+
+    @property
+    def y_center(self):
+        return self.rows[:, BBOX_COLUMNS["y_center"]]
+
+    @property
+    def width(self):
+        return self.rows[:, BBOX_COLUMNS["width"]]
+
+    @property
+    def height(self):
+        return self.rows[:, BBOX_COLUMNS["height"]]
+
+    def between(self, start, end):
+        """frame_id 落在 [start, end] (含兩端) 的子集。"""
+        return KeypointTrack._view(self, self.index.rows(start, end))
+
+    def to_frame(self, columns):
+        """
+        依 {欄名: 欄位索引} 建立 DataFrame (第一欄固定為 int64 的 frame_id)，
+        供原本以 DataFrame 運算的模組使用。
+        """
+        data = {"frame_id": self.frame_ids}
+        for name, index in columns.items():
+            data[name] = self.rows[:, index]
+        return pd.DataFrame(data)
+
+    def records(self, columns):
+        """依欄位索引回傳 [(frame_id, v1, v2, ...), ...] (Python int / float)。"""
+        values = [self.rows[:, index].tolist() for index in columns]
+        return list(zip(self.frame_ids.tolist(), *values))
+
+
+def _open_store_rows(path, mmap_mode, start, stop):
+    """pickle 還原用：重新映射存檔並取 [start, stop) 列。"""
+    track = KeypointTrack.from_store(path, mmap_mode)
+    if (start, stop) == (0, len(track)):
+        return track
+    return KeypointTrack._view(track, slice(start, stop))
+
+
+def load_keypoint_track(track_or_path):
+    """
+    已是 KeypointTrack 則原樣回傳；.npy 路徑以記憶體映射開啟，.kpz 讀取封存檔，
+    其他路徑視為 txt 讀入。
+    """
+    if isinstance(track_or_path, KeypointTrack):
+        return track_or_path
+    if str(track_or_path).endswith(".npy"):
+        return KeypointTrack.from_store(track_or_path)
+    if str(track_or_path).endswith(KEYPOINT_ARCHIVE_SUFFIX):
+        return KeypointTrack.from_archive(track_or_path)
+    return KeypointTrack.from_txt(track_or_path)
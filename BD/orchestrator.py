@@ -9,7 +9,9 @@ logging.basicConfig(
 )
 
 from BD.pose_estimator import run_pose_estimation
-from BD.txt_base import process_keypoints_txt
+from BD.video_info import probe_video
+from BD.keypoint_track import KeypointTrack
+from BD.txt_base import PendingWrites, smooth_keypoints
 from BD.diving_analyzer_track_angles import analyze_diving_phase
 from BD.stroke_style_recognizer import analyze_stroke
 
@@ -25,8 +27,7 @@ from BD.stroke_analysis.backstroke_butterfly_freestyle_stroke_stage import (
 
 
 from BD.split_speed_analyzer import analyze_split_times
-from BD.video_postprocessor import overlay_results_on_video
-from BD.focus_tracking_view import export_focus_only_video
+from BD.video_postprocessor import render_focus_and_overlay
 
 import subprocess
 import logging
@@ -36,6 +37,30 @@ import logging
 FFMPEG_EXECUTABLE_PATH = "/usr/bin/ffmpeg"
 # ------------------------------------
 
+# 姿態估計每次送進 YOLO 的幀數 (CPU 主機上批次推論可攤平每次呼叫的固定開銷)
+POSE_BATCH_SIZE = int(os.getenv("POSE_BATCH_SIZE", "8"))
+# 解碼 / 推論 / 寫檔三段管線化 (設為 "0" 可改回單執行緒)
+POSE_PIPELINED = os.getenv("POSE_PIPELINED", "1") == "1"
+# 自適應跳幀：平穩游泳時每 N 幀推論一次，其餘內插 (預設 "1" = 每幀都推論)
+POSE_FRAME_STRIDE = int(os.getenv("POSE_FRAME_STRIDE", "1"))
+# 追蹤 ROI 裁切推論：只對泳者周圍小區域推論 (設為 "1" 啟用)
+POSE_ROI_CROP = os.getenv("POSE_ROI_CROP", "0") == "1"
+# 推論解析度：POSE_IMGSZ 交給 YOLO (空字串 = 模型預設)，POSE_DOWNSCALE 為推論前縮小比例
+# 設定前先以 python -m BD.pose_resolution_report 比較誤差與速度
+POSE_IMGSZ = int(os.getenv("POSE_IMGSZ")) if os.getenv("POSE_IMGSZ") else None
+POSE_DOWNSCALE = float(os.getenv("POSE_DOWNSCALE", "1.0"))
+# 單一影片的姿態估計切成 N 段，由 N 個子程序平行推論 (預設 "1" = 單程序)
+POSE_WORKERS = int(os.getenv("POSE_WORKERS", "1"))
+# 每 N 幀把新完成的幀附加成一個 checkpoint 分段 (不重寫整段結果)，
+# worker 重啟後同一支影片可從中斷處續跑 ("0" = 關閉；僅單程序)
+POSE_CHECKPOINT_EVERY = int(os.getenv("POSE_CHECKPOINT_EVERY", "1000"))
+# 姿態估計逐幀進度回報間隔 (秒)；進度換算成整體 10% → 30% 區間
+POSE_PROGRESS_INTERVAL = float(os.getenv("POSE_PROGRESS_INTERVAL", "2.0"))
+# 軌跡疊加影片右上角是否嵌入追焦小畫面 (子母畫面)
+RENDER_PIP = os.getenv("RENDER_PIP", "0") == "1"
+# 另存可記憶體映射的 data/keypoints/{base_name}.npy，分析階段改以唯讀映射共用該檔
+KEYPOINT_STORE = os.getenv("KEYPOINT_STORE", "0") == "1"
+
 
 def transcode_to_h264(input_avi_path, output_mp4_path, ffmpeg_path):
     """
@@ -115,6 +140,12 @@ def run_full_analysis(
 
     base_name = os.path.splitext(os.path.basename(video_path))[0]
 
+    # FPS / 寬高 / 總幀數只探測一次，明確傳給各階段 (不再各自開檔)
+    video_info = probe_video(video_path)
+    logging.info(
+        f"Video info: {video_info.width}x{video_info.height} @ {video_info.fps:.2f}fps, {video_info.frame_count} frames"
+    )
+
     # Step 1: Pose Estimation
     print("[ORCHESTRATOR] 🔹 Step 1/7: Running Pose Estimation (YOLO)...", flush=True)
     if status_callback: status_callback(10, "Capturing body pose...")
@@ -123,8 +154,38 @@ def run_full_analysis(
     # run_pose_estimation saves to output_dir with filename {base_name}_raw.txt
     # We direct it to keypoints_dir.
     # User requested NO intermediate video for pose estimation step.
+    def pose_progress(frames_done, total_frames, fps, eta_seconds):
+        if not status_callback:
+            return
+        fraction = frames_done / total_frames if total_frames else 0.0
+        status_callback(
+            10 + int(20 * min(fraction, 1.0)),
+            f"Capturing body pose... {frames_done}/{total_frames} frames",
+            {
+                "stage": "pose_estimation",
+                "frames_done": frames_done,
+                "total_frames": total_frames,
+                "fps": round(fps, 2),
+                "eta_seconds": None if eta_seconds is None else round(eta_seconds, 1),
+            },
+        )
+
     video_out_pose, txt_out = run_pose_estimation(
-        pose_model_path, video_path, keypoints_dir, save_video=False
+        pose_model_path,
+        video_path,
+        keypoints_dir,
+        save_video=False,
+        batch_size=POSE_BATCH_SIZE,
+        pipelined=POSE_PIPELINED,
+        frame_stride=POSE_FRAME_STRIDE,
+        roi_crop=POSE_ROI_CROP,
+        imgsz=POSE_IMGSZ,
+        downscale=POSE_DOWNSCALE,
+        num_workers=POSE_WORKERS,
+        checkpoint_every=POSE_CHECKPOINT_EVERY if POSE_WORKERS == 1 else 0,
+        progress_callback=pose_progress,
+        progress_interval=POSE_PROGRESS_INTERVAL,
+        video_info=video_info,
     )
     logging.info(f"Raw Keypoints TXT generated at: {txt_out}")
 
@@ -143,11 +204,13 @@ def run_full_analysis(
     phase_output_path = os.path.join(phase_frames_dir, phase_output_filename)
     # -----------------------
 
-    # Execute smoothing -> Save to smoothed_txt_path (keypoints dir)
-    df = process_keypoints_txt(
-        txt_out, save_final_output=True, final_output=smoothed_txt_path
+    # Execute smoothing in memory; smoothed_txt_path (keypoints dir) is written in the
+    # background while the analysis steps below run on the returned array
+    keypoint_writes = PendingWrites()
+    smoothed_rows = smooth_keypoints(
+        txt_out, final_output=smoothed_txt_path, writes=keypoint_writes
     )
-    logging.info(f"Final smoothed data saved at: {smoothed_txt_path}")
+    logging.info(f"Final smoothed data will be saved at: {smoothed_txt_path}")
 
     # Cleanup Raw Output if needed (User requseted "不需要存" for the raw output)
     if txt_out and os.path.exists(txt_out):
@@ -162,6 +225,15 @@ def run_full_analysis(
     # So we use `smoothed_txt_path`.
     final_output_path = smoothed_txt_path 
 
+    # Every analysis stage below shares this track (no re-read of smoothed_txt_path)
+    keypoint_track = KeypointTrack(smoothed_rows, source_path=smoothed_txt_path)
+    if KEYPOINT_STORE:
+        # Memory-mapped copy: workers that receive the track re-map this file instead of copying it
+        keypoint_store_path = os.path.join(keypoints_dir, f"{base_name}.npy")
+        keypoint_track.save_store(keypoint_store_path)
+        keypoint_track = KeypointTrack.from_store(keypoint_store_path)
+        logging.info(f"Keypoint store saved at: {keypoint_store_path}")
+
     # Step 3: Underwater Dive and Kick Analysis (Get all results dict)
     if status_callback: status_callback(45, "Calculating diving metrics...")
     logging.info(
@@ -171,7 +243,7 @@ def run_full_analysis(
     # 1. Receive full output dictionary from analyze_diving_phase
     # waterline_y = 190
     diving_analysis_result = analyze_diving_phase(
-        video_path, final_output_path  # keypoints_txt_path
+        video_path, keypoint_track, video_info=video_info  # keypoints_txt_path
     )
     kick_angle_fig_1 = diving_analysis_result.get("kick_angle_fig_1")
     kick_angle_fig_2 = diving_analysis_result.get("kick_angle_fig_2")
@@ -202,7 +274,7 @@ def run_full_analysis(
     if status_callback: status_callback(60, "Recognizing stroke style...")
     logging.info("Step 4/7: Executing stroke style recognition...")
     try:
-        stroke_label_int = analyze_stroke(video_path, final_output_path, style_model_path)
+        stroke_label_int = analyze_stroke(video_path, keypoint_track, style_model_path)
     except Exception as e:
         print(f"[ORCHESTRATOR] ⚠️ Stroke Recognition Failed: {e}", flush=True)
         # Default to Freestyle to prevent pipeline halt if strictly needed, or just let error bubble up?
@@ -232,29 +304,10 @@ def run_full_analysis(
         phase_frames_dict = {}
         data_dict = {}
         
-        # Pre-read file for data dictionary construction (efficiency)
-        raw_lines = []
-        try:
-            with open(final_output_path, 'r') as f:
-                raw_lines = f.readlines()
-        except FileNotFoundError:
-            logging.error(f"Cannot read {final_output_path}")
-
-        def parse_bs_line(line):
-             parts = line.strip().split()
-             if len(parts) > 20:
-                 try:
-                     frame = int(parts[0])
-                     # Format: (frame, col10, col11, col13, col14, col16, col17, hip_x)
-                     return (frame, float(parts[10]), float(parts[11]), float(parts[13]), 
-                             float(parts[14]), float(parts[16]), float(parts[17]), float(parts[19]))
-                 except: return None
-             return None
-
-        parsed_data_map = {}
-        for line in raw_lines:
-             d = parse_bs_line(line)
-             if d: parsed_data_map[d[0]] = d
+        # Data dictionary for plotting: (frame, col10, col11, col13, col14, col16, col17, hip_x)
+        parsed_data_map = {
+            r[0]: r for r in keypoint_track.records([10, 11, 13, 14, 16, 17, 19])
+        }
 
         if laps_data:
             # Flexible Analysis using laps_data
@@ -280,7 +333,7 @@ def run_full_analysis(
 
                 # Run Process Range from Stage file
                 (frames, _, _, _, _, _, _, p_starts, p_ends, r_ends) = \
-                    stroke_stage_bs.process_range(final_output_path, swim_seg, slope_change)
+                    stroke_stage_bs.process_range(keypoint_track, swim_seg, slope_change)
                 
                 phase_frames_dict[key] = {
                     "propulsion_starts": p_starts,
@@ -303,7 +356,7 @@ def run_full_analysis(
             # Analyze Range 1 (Outbound -> neg2pos)
             if range1[0] is not None and range1[1] is not None and range1[1] > range1[0]:
                 (frames1, *_, p_starts1, p_ends1, r_ends1) = \
-                    stroke_stage_bs.process_range(final_output_path, range1, "neg2pos")
+                    stroke_stage_bs.process_range(keypoint_track, range1, "neg2pos")
                 phase_frames_dict["range1"] = {
                     "propulsion_starts": p_starts1, "propulsion_ends": p_ends1, "recovery_ends": r_ends1
                 }
@@ -316,7 +369,7 @@ def run_full_analysis(
             # Analyze Range 2 (Inbound -> pos2neg)
             if range2[0] is not None and range2[1] is not None and range2[1] > range2[0]:
                 (frames2, *_, p_starts2, p_ends2, r_ends2) = \
-                    stroke_stage_bs.process_range(final_output_path, range2, "pos2neg")
+                    stroke_stage_bs.process_range(keypoint_track, range2, "pos2neg")
                 phase_frames_dict["range2"] = {
                     "propulsion_starts": p_starts2, "propulsion_ends": p_ends2, "recovery_ends": r_ends2
                 }
@@ -399,11 +452,12 @@ def run_full_analysis(
         # Pass laps_data for flexible segment analysis
         laps_data = diving_analysis_result.get("laps_data")
         analysis_output = stroke_stage_bbfs.run_backstroke_butterfly_analysis(
-            txt_path=final_output_path,
+            txt_path=keypoint_track,
             video_path=video_path,
             waterline_y=waterline_y,
             laps_data=laps_data,
-            output_txt_path=phase_output_path # <--- Pass the Phase Frames output path
+            output_txt_path=phase_output_path, # <--- Pass the Phase Frames output path
+            video_info=video_info,
         )
 
         if analysis_output["status"] == "success":
@@ -480,7 +534,7 @@ def run_full_analysis(
                          
                          # Check if this key exists in results (it should)
                          if key in full_phase_regions:
-                             seg_data = extract_columns_for_segment(final_output_path, s, e)
+                             seg_data = extract_columns_for_segment(keypoint_track, s, e)
                              # regions is actually the full dict returned by plot_phase_on_col11_col17
                              full_res_dict = full_phase_regions[key]
                              
@@ -508,7 +562,7 @@ def run_full_analysis(
                  # Fallback old logic if laps_data missing
                  range1 = (e1, s2)
                  range2 = (e2, analysis_end_frame)
-                 data_bbfs = extract_columns_in_range(final_output_path, range1, range2)
+                 data_bbfs = extract_columns_in_range(keypoint_track, range1, range2)
                  for r_key in ["range1", "range2"]:
                     dataset = data_bbfs.get(r_key, [])
                     regions = full_phase_regions.get(r_key, {})
@@ -547,10 +601,8 @@ def run_full_analysis(
     # Step 6: Get FPS/Width and Calculate Split Times
     logging.info("Step 6/7: Calculating split times and speed metrics...")
 
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    cap.release()
+    fps = video_info.fps
+    width = video_info.width
 
     # Calibration definitions (assumed values)
     d15m_x0 = width * 0.4
@@ -559,7 +611,7 @@ def run_full_analysis(
     start_frame = s1  # Usually the start of the first dive segment
 
     passed, total_time, split_breakdown, lap_durations = analyze_split_times(
-        final_output_path, start_frame, fps, d15m_x0, d25m_x0, d50m_x0, laps_data=laps_data
+        keypoint_track, start_frame, fps, d15m_x0, d25m_x0, d50m_x0, laps_data=laps_data
     )
     
     avg_speed = 0.0
@@ -719,9 +771,6 @@ def run_full_analysis(
     focus_video_path = os.path.join(processed_dir, f"{base_name}_focus.mp4")
     # -----------------------------------------------------
 
-    export_focus_only_video(video_path, final_output_path, focus_video_path)
-    logging.info(f"Focus video generated at: {focus_video_path}")
-
     # Output processed video path
     # --- Naming: {base_name}_trajectory.avi in processed_dir (interim) ---
     processed_avi_path = os.path.join(processed_dir, f"{base_name}_trajectory.avi")
@@ -732,8 +781,10 @@ def run_full_analysis(
     final_mp4_path = os.path.join(processed_dir, f"{base_name}_trajectory.mp4")
     # ------------------------------------------------------------
 
-    overlay_results_on_video(
+    # 一次解碼同時寫出追焦影片與軌跡疊加影片 (不再各自解碼整支影片)
+    processed_avi_path, _ = render_focus_and_overlay(
         video_path,
+        keypoint_track,
         analysis_results={
             "stroke_frames": stroke_result.get("stroke_frames", []),
             "df_hip_trajectory": hip_data_for_overlay,
@@ -747,8 +798,10 @@ def run_full_analysis(
             "fps": fps,
             "line_positions": {"15m": d15m_x0, "25m": d25m_x0, "50m": d50m_x0},
         },
-        focus_video_path=focus_video_path,
+        focus_output_path=focus_video_path,
+        picture_in_picture=RENDER_PIP,
     )
+    logging.info(f"Focus video generated at: {focus_video_path}")
     # --- 🎯 修正點 B: 執行 FFMPEG 轉碼 ---
 
     # 轉碼 AVI 成 MP4 (帶 H.264 編碼，保證瀏覽器兼容)
@@ -782,6 +835,10 @@ def run_full_analysis(
     )
     print(f"\n[ORCHESTRATOR] ✅ ANALYSIS COMPLETE! Video saved to: {final_processed_video_path}\n", flush=True)
 
+    # Smoothed keypoints txt must be on disk before results point at it
+    keypoint_writes.wait()
+    logging.info(f"Final smoothed data saved at: {smoothed_txt_path}")
+
     # --- Resource Cleanup ---
     try:
         import gc
@@ -0,0 +1,153 @@
+# BD/pose_backends.py
+import argparse
+import os
+import time
+
+import numpy as np
+from ultralytics import YOLO
+
+"""
+姿態模型推論後端：PyTorch (Ultralytics .pt)、ONNX Runtime、OpenVINO (CPU)。
+
+三種後端都透過 Ultralytics 載入 (YOLO 會依副檔名自動選用 onnxruntime / openvino)，
+呼叫方式與回傳的 Results 完全相同，因此 pose_estimator 與下游模組不需區分後端。
+匯出檔放在 .pt 旁邊：
+- torch:    best_1.pt
+- onnx:     best_1.onnx
+- openvino: best_1_openvino_model/
+
+用法:
+python -m BD.pose_backends export data/models/best_1.pt --backends onnx openvino
+python -m BD.pose_backends benchmark data/models/best_1.pt video.mp4 --backends torch onnx openvino
+"""
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+# 預設後端 (每個 worker 以環境變數選擇；需先執行 export)
+DEFAULT_POSE_BACKEND = os.getenv("POSE_BACKEND", "torch")
+
+
+def backend_model_path(model_path, backend=None):
+    """回傳 .pt 權重在指定後端對應的模型路徑。"""
+    backend = backend or DEFAULT_POSE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown pose backend '{backend}', expected one of {BACKENDS}")
+
+    base, _ = os.path.splitext(model_path)
+    if backend == "onnx":
+        return base + ".onnx"
+    if backend == "openvino":
+        return base + "_openvino_model"
+    return model_path
+
+
+def resolve_backend_path(model_path, backend=None):
+    """同 backend_model_path，但匯出檔不存在時提示先執行 export。"""
+    path = backend_model_path(model_path, backend)
+    if path != model_path and not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found; run `python -m BD.pose_backends export {model_path} "
+            f"--backends {backend or DEFAULT_POSE_BACKEND}` first"
+        )
+    return path
+
+
+def export_pose_model(model_path, backends=("onnx", "openvino"), imgsz=640):
+    """
+    把 .pt 權重匯出成其他後端格式 (放在 .pt 旁邊)。
+    以 dynamic=True 匯出，讓批次推論與不同 imgsz 都能使用。
+    回傳 {backend: 匯出路徑}。
+    """
+    exported = {}
+    for backend in backends:
+        if backend == "torch":
+            continue
+        target = backend_model_path(model_path, backend)
+        path = YOLO(model_path).export(format=backend, imgsz=imgsz, dynamic=True, half=False)
+        # Ultralytics 預設就輸出在 .pt 旁邊；名稱不同時以實際回傳為準
+        exported[backend] = path or target
+        print(f"✅ Exported {backend}: {exported[backend]}")
+    return exported
+
+
+def benchmark_backends(
+    model_path,
+    video_path,
+    backends=BACKENDS,
+    max_frames=300,
+    batch_size=8,
+    tolerance=1.0,
+):
+    """
+    同一段影片以各後端推論，量測每秒處理幀數，
+    並與 torch 後端比較偵測一致率與關鍵點最大像素誤差。
+    """
+    # 延後匯入：pose_estimator → pose_model_registry 會反過來匯入本模組
+    from BD.pose_estimator import _full_frame_predictor, _iter_poses
+    from BD.pose_model_registry import warm_up_pose_model
+    from BD.pose_resolution_report import _read_frames
+
+    frames = _read_frames(video_path, max_frames)
+    if not frames:
+        raise ValueError(f"No frames read from {video_path}")
+    height, width = frames[0].shape[:2]
+
+    results = {}
+    for backend in backends:
+        model = warm_up_pose_model(model_path, frame_size=(width, height), backend=backend)
+        predict = _full_frame_predictor(model)
+        start = time.perf_counter()
+        poses = list(_iter_poses(predict, frames, batch_size))
+        elapsed = time.perf_counter() - start
+        results[backend] = (poses, len(frames) / elapsed if elapsed > 0 else float("nan"))
+
+    ref_backend = "torch" if "torch" in results else backends[0]
+    ref_poses, _ = results[ref_backend]
+
+    print(f"{'backend':>10} {'fps':>8} {'agree%':>7} {'max_px':>8} {'max_conf':>9}  ok")
+    for backend, (poses, fps) in results.items():
+        agree = np.mean([det == ref_det for (det, _), (ref_det, _) in zip(poses, ref_poses)])
+        max_px, max_conf = 0.0, 0.0
+        for (det, row), (ref_det, ref_row) in zip(poses, ref_poses):
+            if det and ref_det:
+                kpts = row[6:].reshape(-1, 3)
+                ref_kpts = ref_row[6:].reshape(-1, 3)
+                max_px = max(max_px, float(np.abs(kpts[:, :2] - ref_kpts[:, :2]).max()))
+                max_conf = max(max_conf, float(np.abs(kpts[:, 2] - ref_kpts[:, 2]).max()))
+        ok = agree == 1.0 and max_px <= tolerance
+        print(
+            f"{backend:>10} {fps:>8.2f} {agree * 100:>7.1f} {max_px:>8.3f} {max_conf:>9.4f}  "
+            f"{'✅' if ok else '❌'}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pose model backends: export / benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="convert a .pt model to other backends")
+    p_export.add_argument("model_path")
+    p_export.add_argument("--backends", nargs="+", default=["onnx", "openvino"], choices=BACKENDS)
+    p_export.add_argument("--imgsz", type=int, default=640)
+
+    p_bench = sub.add_parser("benchmark", help="compare backends on a video")
+    p_bench.add_argument("model_path")
+    p_bench.add_argument("video_path")
+    p_bench.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    p_bench.add_argument("--max-frames", type=int, default=300)
+    p_bench.add_argument("--batch-size", type=int, default=8)
+    p_bench.add_argument("--tolerance", type=float, default=1.0, help="max keypoint deviation (px)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_pose_model(args.model_path, args.backends, args.imgsz)
+    else:
+        benchmark_backends(
+            args.model_path,
+            args.video_path,
+            args.backends,
+            max_frames=args.max_frames,
+            batch_size=args.batch_size,
+            tolerance=args.tolerance,
+        )
@@ -1,234 +1,910 @@
 import torch
-from ultralytics import YOLO
 import cv2
 import os
+import json
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
+from BD.pose_model_registry import get_pose_model
+from BD.skeleton_renderer import render_skeleton_video
+from BD.video_info import probe_video
+from BD.video_source import VideoSource
+from BD.keypoint_io import NUM_KEYPOINTS, load_keypoint_npz, save_keypoint_npz
+
+# --- 自適應跳幀 (frame_stride > 1) 的事件判斷門檻 ---
+# BBOX 中心 y 每幀移動超過畫面高度的此比例 → 視為入水等快速動作
+STRIDE_Y_SPEED_RATIO = 0.004
+# BBOX 距離畫面左右邊緣小於畫面寬度的此比例 → 視為觸牆
+STRIDE_EDGE_MARGIN_RATIO = 0.05
+# 臀部 x 每幀位移需超過此像素才判斷方向 (避免靜止時的抖動被當成轉身)
+STRIDE_MIN_HIP_DX = 1.0
+# --- 追蹤 ROI 裁切推論 (roi_crop=True) ---
+# 以前一幀 BBOX 為中心裁切，四周各加上 BBOX 寬/高的此倍數作為緩衝
+ROI_PADDING_RATIO = 1.0
+# 裁切區域的最小邊長 (像素)，與 YOLO 預設輸入 640 相同
+ROI_MIN_SIZE = 640
+# 裁切內偵測信心度低於此值，改回整張畫面重新偵測
+ROI_MIN_CONF = 0.5
+# BBOX 距離裁切邊緣小於此像素 → 泳者可能已離開裁切範圍，改回整張畫面
+ROI_EDGE_MARGIN = 8
+
+# --- 多程序分段推論 (num_workers > 1) ---
+# 子程序啟動方式：預設 spawn，避免 fork 已載入 torch / 模型的父程序
+POSE_WORKER_START_METHOD = os.getenv("POSE_WORKER_START_METHOD", "spawn")
+
+# 臀部關鍵點 (第 5 點) 在 row 中的 x, y 索引
+_HIP_X, _HIP_Y = 6 + 3 * 4, 6 + 3 * 4 + 1
+
+
+def _result_row(result):
+    """
+    取出單張影像信心度最高的 BBOX 與其關鍵點，串成一列 tensor
+    [cls, x_center, y_center, width, height, conf, kpt_x, kpt_y, kpt_conf, ...]。
+    沒有 BBOX 時回傳 None (未偵測到)；該 BBOX 沒有關鍵點 (keypoints 為 None 或空) 時
+    只回傳前 6 個值，與逐幀版相同寫成只有 BBOX 的一列。
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return None
+
+    # 多個 BBOX 時挑信心度最高者（留在原裝置上，不急著 numpy）
+    best_idx = int(boxes.conf.argmax())
+    parts = [
+        boxes.cls[best_idx : best_idx + 1],
+        boxes.xywh[best_idx],
+        boxes.conf[best_idx : best_idx + 1],
+    ]
 
-def run_pose_estimation(
-    model_path: str,
-    video_path: str,
-    output_dir: str,
-    save_video: bool = True,
-    save_txt: bool = True,
-):
+    keypoints = result.keypoints
+    if keypoints is not None and len(keypoints.xy) > best_idx:
+        kpt_xy = keypoints.xy[best_idx]
+        kpt_conf = keypoints.conf
+        if kpt_conf is not None:
+            kpt_conf = kpt_conf[best_idx]
+        else:
+            kpt_conf = torch.zeros_like(kpt_xy[:, 0])
+        parts.append(torch.cat([kpt_xy, kpt_conf.unsqueeze(-1)], dim=-1).flatten())
+
+    return torch.cat([p.float() for p in parts])
+
+
+def _results_to_numpy(results):
     """
-    對影片進行姿態估計，輸出帶骨架的影片與預測結果 txt。
+    將一批 YOLO 結果整理成 NumPy，整批只做一次 tensor → NumPy 轉換。
+
+    每張影像只保留信心度最高的 BBOX，回傳:
+    - detected: (B,) bool，該幀是否有偵測到
+    - rows: (B, 6 + 3K) float32，每列為
+      [cls, x_center, y_center, width, height, conf, kpt_x, kpt_y, kpt_conf, ...]
+      未偵測到的幀為 NaN；有 BBOX 但沒有關鍵點的幀，關鍵點欄位為 NaN
+      (_format_txt_row 寫成只有 BBOX 的一列)
+    同一批可混合有偵測、沒有偵測與沒有關鍵點的影像，結果與逐幀推論相同。
     """
+    detected = np.zeros(len(results), dtype=bool)
+    picked = []
+
+    for i, result in enumerate(results):
+        row = _result_row(result)
+        if row is None:
+            continue
+        detected[i] = True
+        picked.append(row)
+
+    if not picked:
+        return detected, np.full((len(results), 0), np.nan, dtype=np.float32)
+
+    widths = {row.shape[0] for row in picked} - {6}
+    if len(widths) > 1:
+        raise ValueError(f"Pose results have different numbers of keypoints: {sorted(widths)}")
+    width = widths.pop() if widths else 6 + 3 * NUM_KEYPOINTS
+    # 沒有關鍵點的列補 NaN 後整批一起搬到 CPU
+    picked = torch.stack([
+        row if row.shape[0] == width
+        else torch.cat([row, row.new_full((width - row.shape[0],), float("nan"))])
+        for row in picked
+    ]).cpu().numpy()
+    rows = np.full((len(results), width), np.nan, dtype=np.float32)
+    rows[detected] = picked
+    return detected, rows
+
+
+def _format_txt_row(frame_id, row):
+    """
+    依 _raw.txt 格式輸出一列：
+    frame_id cls x_center y_center width height conf (kpt_x kpt_y kpt_conf)*
+    關鍵點欄位全為 NaN (該 BBOX 沒有關鍵點) 時只輸出 BBOX。
+    """
+    cls, x_center, y_center, width, height, conf = row[:6]
+    keypoints = row[6:]
+    if np.isnan(keypoints).all():
+        keypoints = keypoints[:0]
+    keypoints_line = ""
+    for kpt_x, kpt_y, kpt_conf in keypoints.reshape(-1, 3):
+        keypoints_line += f" {kpt_x:.6f} {kpt_y:.6f} {kpt_conf:.6f}"
 
-    os.makedirs(output_dir, exist_ok=True)
-    model = YOLO(model_path)
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise IOError(f"Cannot open video file: {video_path}")
-
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    print(f"🎬 影片 {os.path.basename(video_path)} 總幀數: {total_frames}")
+    return f"{frame_id} {int(cls)} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f} {conf:.6f}{keypoints_line}\n"
 
-    # --- 確保輸出影片名稱是 _1.mp4 ---
 
-    base_name, ext = os.path.splitext(os.path.basename(video_path))
-    output_video_name = base_name + "_1" + ext
-    output_video_path = os.path.join(output_dir, output_video_name)
-    # output_video_path = None
+def _full_frame_predictor(model, imgsz=None, downscale=1.0):
+    """
+    整張畫面推論：predict(batch_frames) -> (detected, rows)。
+    imgsz 直接交給 YOLO；downscale < 1 時先縮小影格再推論，
+    回傳的 BBOX 與關鍵點都換算回原始解析度座標。
+    """
+    kwargs = {} if imgsz is None else {"imgsz": imgsz}
+
+    def predict(batch_frames):
+        if downscale != 1.0:
+            batch_frames = [
+                cv2.resize(f, None, fx=downscale, fy=downscale, interpolation=cv2.INTER_AREA)
+                for f in batch_frames
+            ]
+        # 整批推論，結果整批轉成 NumPy
+        results = model(batch_frames if len(batch_frames) > 1 else batch_frames[0], **kwargs)
+        detected, rows = _results_to_numpy(results)
+        if downscale != 1.0 and rows.shape[1] > 0:
+            rows[:, 1:5] /= downscale
+            kpts = rows[:, 6:].reshape(len(rows), -1, 3)
+            kpts[:, :, :2] /= downscale
+        return detected, rows
+
+    return predict
+
+
+class _RoiPredictor:
+    """
+    追蹤 ROI 裁切推論：以上一次偵測到的 BBOX 為中心裁出小區域送進模型，
+    再把 BBOX 與關鍵點平移回整張畫面座標。
+    沒有追蹤目標、信心度過低或泳者貼近裁切邊緣時，該幀改用整張畫面重新偵測。
+    """
 
-    if save_video:
-        output_video_name = base_name + "_1" + ext
-        output_video_path = os.path.join(output_dir, output_video_name)
-        # fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        try:
-            fourcc = cv2.VideoWriter_fourcc(*"XVID")
-        except:
-            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        out = cv2.VideoWriter(
-            output_video_path, fourcc, fps, (frame_width, frame_height)
+    def __init__(self, model, frame_size, imgsz=None, downscale=1.0):
+        self.full_frame = _full_frame_predictor(model, imgsz, downscale)
+        self.frame_width, self.frame_height = frame_size
+        self.last_row = None  # 最近一次偵測到的 row (整張畫面座標)
+
+    def _crop_box(self):
+        _, xc, yc, w, h = self.last_row[:5]
+        crop_w = min(self.frame_width, max(ROI_MIN_SIZE, w * (1 + 2 * ROI_PADDING_RATIO)))
+        crop_h = min(self.frame_height, max(ROI_MIN_SIZE, h * (1 + 2 * ROI_PADDING_RATIO)))
+        x0 = int(np.clip(xc - crop_w / 2, 0, self.frame_width - crop_w))
+        y0 = int(np.clip(yc - crop_h / 2, 0, self.frame_height - crop_h))
+        return x0, y0, x0 + int(crop_w), y0 + int(crop_h)
+
+    def _needs_full_frame(self, det, row, box):
+        if not det or row[5] < ROI_MIN_CONF:
+            return True
+        x0, y0, x1, y1 = box
+        _, xc, yc, w, h = row[:5]
+        # 裁切貼齊畫面邊界的那一側不算離開
+        return (
+            (x0 > 0 and xc - w / 2 - x0 < ROI_EDGE_MARGIN)
+            or (x1 < self.frame_width and x1 - (xc + w / 2) < ROI_EDGE_MARGIN)
+            or (y0 > 0 and yc - h / 2 - y0 < ROI_EDGE_MARGIN)
+            or (y1 < self.frame_height and y1 - (yc + h / 2) < ROI_EDGE_MARGIN)
         )
-        if not out.isOpened():
-            print("[警告] run_pose_estimation 影片寫入器初始化失敗，將跳過輸出影片。")
-            # 如果初始化失敗，將 out 設為 None，避免後續的 out.write(frame) 出錯
-            out = None
-            save_video = False
-    else:
-        out = None
 
-    output_txt_path = None
+    def __call__(self, batch_frames):
+        if self.last_row is None:
+            detected, rows = self.full_frame(batch_frames)
+        else:
+            # 同一批共用一個裁切框，讓各張輸入尺寸相同可一起推論
+            box = self._crop_box()
+            x0, y0, x1, y1 = box
+            crops = [np.ascontiguousarray(f[y0:y1, x0:x1]) for f in batch_frames]
+            detected, rows = self.full_frame(crops)
+            rows = rows.copy()
+            if rows.shape[1] > 0:
+                # 平移回整張畫面座標；(0, 0) 代表未偵測到的關鍵點，保持不變
+                rows[:, 1] += x0
+                rows[:, 2] += y0
+                kpts = rows[:, 6:].reshape(len(rows), -1, 3)
+                visible = (kpts[:, :, 0] != 0) | (kpts[:, :, 1] != 0)
+                kpts[:, :, 0] += np.where(visible, x0, 0)
+                kpts[:, :, 1] += np.where(visible, y0, 0)
+
+            redo = [
+                i
+                for i, (det, row) in enumerate(zip(detected, rows))
+                if self._needs_full_frame(det, row, box)
+            ]
+            if redo:
+                redo_detected, redo_rows = self.full_frame([batch_frames[i] for i in redo])
+                if rows.shape[1] == 0 and redo_rows.shape[1] > 0:
+                    rows = np.full((len(batch_frames), redo_rows.shape[1]), np.nan, dtype=np.float32)
+                detected = detected.copy()
+                for i, det, row in zip(redo, redo_detected, redo_rows):
+                    detected[i] = det
+                    if det:
+                        rows[i] = row
+
+        # 以本批最後一幀更新追蹤目標；漏偵測時下一批回到整張畫面
+        self.last_row = rows[-1].copy() if detected[-1] else None
+        return detected, rows
+
+
+def _iter_poses(predict, frames, batch_size):
+    """每一幀都推論，依序產生 (detected, row)。"""
+    for batch_frames in _iter_batches(frames, batch_size):
+        detected, rows = predict(batch_frames)
+        yield from zip(detected, rows)
+
+
+def _infer_frames(predict, frames, batch_size):
+    """對一串幀推論，回傳每幀的 (detected, row) list。"""
+    return list(_iter_poses(predict, frames, batch_size))
+
+
+class _StrideSegment:
+    """兩個錨點幀之間的一段：起訖錨點的推論結果與中間尚未推論的幀。"""
+
+    def __init__(self, start, gap_frames, end):
+        self.start = start  # (detected, row)
+        self.gap_frames = gap_frames
+        self.end = end
+        self.dense = False
+        self.hip_dx = None  # 臀部 x 每幀位移，無法判斷時為 None
+
+
+def _needs_dense(segment, frame_size):
+    """判斷這段是否有快速事件 (入水、觸牆) 或偵測不完整，需要逐幀推論。"""
+    (det_a, row_a), (det_b, row_b) = segment.start, segment.end
+    if not (det_a and det_b):
+        return True
+    # 錨點只有 BBOX、沒有關鍵點：無法內插關鍵點
+    if np.isnan(row_a[6:]).all() or np.isnan(row_b[6:]).all():
+        return True
+
+    frame_width, frame_height = frame_size
+    span = len(segment.gap_frames) + 1
+
+    # 入水：BBOX 中心 y 快速變化
+    if abs(row_b[2] - row_a[2]) / span > STRIDE_Y_SPEED_RATIO * frame_height:
+        return True
+
+    # 觸牆：任一錨點的 BBOX 貼近畫面左右邊緣
+    margin = STRIDE_EDGE_MARGIN_RATIO * frame_width
+    for row in (row_a, row_b):
+        left = row[1] - row[3] / 2
+        right = row[1] + row[3] / 2
+        if left < margin or right > frame_width - margin:
+            return True
+
+    return False
+
+
+def _interpolate_gap(segment):
+    """在起訖錨點之間對 BBOX 與關鍵點做線性內插。"""
+    (_, row_a), (_, row_b) = segment.start, segment.end
+    span = len(segment.gap_frames) + 1
+    poses = []
+    for i in range(1, span):
+        t = i / span
+        row = (row_a + (row_b - row_a) * t).astype(np.float32)
+        row[0] = row_a[0]  # 類別不內插
+        poses.append((True, row))
+    return poses
+
+
+def _iter_poses_strided(predict, frames, batch_size, frame_stride, frame_size):
+    """
+    自適應跳幀：平穩游泳時每 frame_stride 幀只推論一幀 (錨點)，
+    中間的幀以前後錨點線性內插；遇到入水、轉身 (臀部 x 反向)、觸牆或漏偵測時，
+    該段改為逐幀推論。
 
-    if save_txt:
-        # Save as _raw.txt to distinguish from final smoothed output
-        output_txt_path = os.path.join(output_dir, f"{base_name}_raw.txt")
-        f_txt = open(output_txt_path, "w", encoding="utf-8")
+    為了在轉身時把反向點前後兩段都改成逐幀，輸出會延遲一段 (最多暫存約
+    2 * frame_stride 幀)。
+    """
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return
+
+    prev_anchor = _infer_frames(predict, [first], 1)[0]
+    yield prev_anchor
+
+    pending = None
+    while True:
+        gap_frames = []
+        anchor_frame = None
+        for frame in frames:
+            if len(gap_frames) < frame_stride - 1:
+                gap_frames.append(frame)
+            else:
+                anchor_frame = frame
+                break
+
+        if anchor_frame is None:
+            # 影片結尾不足一段：剩下的幀直接推論
+            if pending is not None:
+                yield from _emit_segment(predict, pending, batch_size)
+            yield from _infer_frames(predict, gap_frames, batch_size)
+            return
+
+        anchor = _infer_frames(predict, [anchor_frame], 1)[0]
+        segment = _StrideSegment(prev_anchor, gap_frames, anchor)
+        segment.dense = _needs_dense(segment, frame_size)
+        if not segment.dense:
+            segment.hip_dx = (anchor[1][_HIP_X] - prev_anchor[1][_HIP_X]) / (
+                len(gap_frames) + 1
+            )
+
+        # 轉身：臀部 x 移動方向反轉 → 反向點前後兩段都逐幀推論
+        if (
+            pending is not None
+            and pending.hip_dx is not None
+            and segment.hip_dx is not None
+            and abs(pending.hip_dx) >= STRIDE_MIN_HIP_DX
+            and abs(segment.hip_dx) >= STRIDE_MIN_HIP_DX
+            and np.sign(pending.hip_dx) != np.sign(segment.hip_dx)
+        ):
+            pending.dense = True
+            segment.dense = True
+
+        if pending is not None:
+            yield from _emit_segment(predict, pending, batch_size)
+        pending = segment
+        prev_anchor = anchor
+
+
+def _emit_segment(predict, segment, batch_size):
+    """輸出一段的中間幀 (逐幀推論或內插) 與其結尾錨點。"""
+    if segment.dense:
+        yield from _infer_frames(predict, segment.gap_frames, batch_size)
     else:
-        f_txt = None
+        yield from _interpolate_gap(segment)
+    yield segment.end
 
-    skeleton_pairs = [(1, 2), (2, 3), (1, 4), (4, 5), (5, 6)]
-    colors = [
-        (255, 0, 0),
-        (0, 255, 0),
-        (0, 0, 255),
-        (255, 255, 0),
-        (255, 0, 255),
-        (0, 255, 255),
-    ]
 
-    frame_id = 0
+# 管線各階段之間傳遞的結束訊號
+_STOP = object()
+
+
+def _frame_hold(batch_size, frame_stride):
+    """推論端同時保留的最多幀數 (VideoSource 的 buffer 需保證這些幀不被覆寫)。"""
+    if frame_stride > 1:
+        # 自適應跳幀：待輸出的一段 + 正在讀的一段 + 錨點
+        return 2 * frame_stride + batch_size
+    return batch_size
+
+
+def _iter_batches(frames, batch_size):
+    """把幀序列切成長度 batch_size 的批次 (最後一批可能較短)。"""
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _stack_track(detected, rows):
+    """
+    把逐幀 (detected, row) 疊成陣列：frame_ids (N,), detected (N,), rows (N, 6 + 3K)。
+    未偵測到的幀 (row 為 None) 填 NaN。
+    """
+    detected = np.array(detected, dtype=bool)
+    width = next((row.shape[0] for row in rows if row is not None), 6 + 3 * NUM_KEYPOINTS)
+    stacked = np.full((len(rows), width), np.nan, dtype=np.float32)
+    for i, row in enumerate(rows):
+        if row is not None:
+            stacked[i] = row
+    return np.arange(len(detected), dtype=np.int64), detected, stacked
+
+
+def _video_signature(video_path, total_frames):
+    st = os.stat(video_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "total_frames": total_frames}
+
+
+def _checkpoint_part_path(checkpoint_dir, start):
+    return os.path.join(checkpoint_dir, f"part{start:09d}.npz")
+
+
+def _reset_checkpoint(checkpoint_dir, meta):
+    """清掉舊的 checkpoint 資料夾並寫入本次的 meta.json。"""
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    os.makedirs(checkpoint_dir)
+    with open(os.path.join(checkpoint_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, sort_keys=True)
+
+
+def _save_checkpoint_part(checkpoint_dir, start, detected, rows):
+    """
+    把 [start, start + len(detected)) 幀另存成一個分段檔 (只寫新增的幀，不重寫之前的結果)。
+    先寫 .tmp 再 rename，中途當機不會留下半個檔案。
+    """
+    _, detected, rows = _stack_track(detected, rows)
+    path = _checkpoint_part_path(checkpoint_dir, start)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, detected=detected, rows=rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _load_checkpoint(checkpoint_dir, meta):
+    """
+    依序讀取 checkpoint 分段；影片或推論設定與 meta 不同時回傳 None。
+    分段不連續或損毀時只採用其之前連續完整的部分，之後的分段刪除 (續跑時重新寫出)。
+    回傳 (detected list, rows list)，未偵測到的幀 row 為 None。
+    """
+    meta_path = os.path.join(checkpoint_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            # 以 JSON 來回轉換後比較 (tuple 會存成 list)
+            if json.load(f) != json.loads(json.dumps(meta)):
+                print(f"⚠️ Checkpoint 與目前影片或設定不符，重新開始: {checkpoint_dir}")
+                return None
+    except Exception as e:
+        print(f"⚠️ Checkpoint 無法讀取，重新開始: {checkpoint_dir} ({e})")
+        return None
+
+    detected, rows = [], []
     while True:
-        ret, frame = cap.read()
-        if not ret:
+        path = _checkpoint_part_path(checkpoint_dir, len(detected))
+        if not os.path.exists(path):
             break
+        try:
+            with np.load(path) as data:
+                part_detected = data["detected"].tolist()
+                part_rows = [row if det else None for det, row in zip(part_detected, data["rows"])]
+        except Exception as e:
+            print(f"⚠️ Checkpoint 分段無法讀取，從第 {len(detected)} 幀重新推論: {path} ({e})")
+            break
+        if not part_detected:
+            break
+        detected += part_detected
+        rows += part_rows
 
-        results = model(frame)
-        result = results[0]
+    for name in os.listdir(checkpoint_dir):
+        if name.startswith("part") and name.endswith(".npz") and int(name[4:-4]) >= len(detected):
+            os.remove(os.path.join(checkpoint_dir, name))
+    return detected, rows
 
-        if result.keypoints is not None:
 
-            # 先取 keypoints（此時為 numpy）
-            keypoints = (
-                result.keypoints.xy.cpu().numpy()
-                if torch.cuda.is_available()
-                else result.keypoints.xy.numpy()
+class _ProgressReporter:
+    """
+    推論進度回報：每 interval 秒 (以及最後一幀) 呼叫
+    callback(frames_done, total_frames, fps, eta_seconds)。
+    fps 以本次執行實際處理的幀數計算 (不含 checkpoint 續跑前已完成的幀)。
+    """
+
+    def __init__(self, callback, total_frames, interval=1.0, start_frame=0):
+        self.callback = callback
+        self.total_frames = total_frames
+        self.interval = interval
+        self.start_frame = start_frame
+        self.start_time = time.perf_counter()
+        self.last_report = None
+
+    def update(self, frames_done, force=False):
+        now = time.perf_counter()
+        if not force and self.last_report is not None and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+
+        elapsed = now - self.start_time
+        processed = frames_done - self.start_frame
+        fps = processed / elapsed if elapsed > 0 and processed > 0 else 0.0
+        if fps > 0 and self.total_frames > 0:
+            eta = max(0.0, (self.total_frames - frames_done) / fps)
+        else:
+            eta = None
+        self.callback(frames_done, self.total_frames, fps, eta)
+
+
+class _PoseWriter:
+    """
+    姿態估計的輸出階段：寫入 _raw.txt。
+    collect=True 時另外在記憶體保留逐幀結果，推論結束後交給骨架渲染器或存成 .npz。
+    設定 checkpoint_dir 時每 checkpoint_every 幀把上次 checkpoint 之後新增的幀
+    寫成一個分段檔 (I/O 與影片長度成線性)。
+    """
+
+    def __init__(
+        self, f_txt, total_frames, collect=False,
+        checkpoint_dir=None, checkpoint_every=0,
+    ):
+        self.f_txt = f_txt
+        self.total_frames = total_frames
+        self.collect = collect or checkpoint_dir is not None
+        self.detected = []
+        self.rows = []
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        self.checkpointed = 0  # 已寫入 checkpoint 分段的幀數
+        self.progress = None  # _ProgressReporter
+
+    def write(self, frame_id, det, row):
+        if self.collect:
+            self.detected.append(bool(det))
+            self.rows.append(row if det else None)
+
+        if self.f_txt is not None:
+            if not det:
+                self.f_txt.write(f"{frame_id} no detection\n")
+            else:
+                self.f_txt.write(_format_txt_row(frame_id, row))
+
+        if frame_id % 50 == 0:
+            print(f"➡️ 已處理 {frame_id}/{self.total_frames} 幀")
+
+        if self.progress is not None:
+            self.progress.update(frame_id + 1)
+
+        if self.checkpoint_dir is not None and (frame_id + 1) % self.checkpoint_every == 0:
+            start = self.checkpointed
+            _save_checkpoint_part(
+                self.checkpoint_dir, start, self.detected[start:], self.rows[start:]
             )
+            self.checkpointed = len(self.detected)
 
-            # 先取 keypoints_conf（此時為 Tensor）
-            keypoints_conf = result.keypoints.conf
+    def replay(self, detected, rows):
+        """續跑時把 checkpoint 內已完成的幀重新寫出 (不重寫 checkpoint)。"""
+        checkpoint_dir, self.checkpoint_dir = self.checkpoint_dir, None
+        for frame_id, (det, row) in enumerate(zip(detected, rows)):
+            self.write(frame_id, det, row)
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpointed = len(self.detected)
 
-            # 如果有多個 BBOX，先挑最佳的 best_idx
-            if result.boxes is not None:
-                confs = (
-                    result.boxes.conf.cpu().numpy()
-                    if torch.cuda.is_available()
-                    else result.boxes.conf.numpy()
-                )
+    def track_arrays(self):
+        """回傳 (frame_ids (N,), detected (N,), rows (N, 6 + 3K))，未偵測到的幀為 NaN。"""
+        return _stack_track(self.detected, self.rows)
 
-                if len(confs) > 1:
-                    best_idx = np.argmax(confs)
-                    keypoints = keypoints[best_idx : best_idx + 1]
-                    keypoints_conf = keypoints_conf[
-                        best_idx : best_idx + 1
-                    ]  # <--還是 Tensor，不急著 numpy
-
-            # 這裡才做 numpy 轉換（安全，不會出錯）
-            if keypoints_conf is not None:
-                keypoints_conf = (
-                    keypoints_conf.cpu().numpy()
-                    if torch.cuda.is_available()
-                    else keypoints_conf.numpy()
-                )
-            else:
-                keypoints_conf = np.zeros_like(keypoints[..., 0])
+    def keypoint_arrays(self):
+        """回傳有偵測到的幀 (frame_ids (N,), keypoints (N, K, 3))。"""
+        frame_ids, detected, rows = self.track_arrays()
+        num_keypoints = (rows.shape[1] - 6) // 3
+        return frame_ids[detected], rows[detected, 6:].reshape(-1, num_keypoints, 3)
 
-            # 畫關鍵點與骨架
-            for keypoint, keypoint_conf in zip(keypoints, keypoints_conf):
+    def close(self):
+        if self.f_txt is not None:
+            self.f_txt.close()
 
-                for i, (x, y, conf) in enumerate(
-                    zip(keypoint[:, 0], keypoint[:, 1], keypoint_conf)
-                ):
 
-                    if x > 0 and y > 0:
-                        color = colors[i % len(colors)]
-                        cv2.circle(frame, (int(x), int(y)), 4, color, -1)
+class _ThreadedPoseWriter:
+    """
+    在背景執行緒執行 _PoseWriter，與推論重疊。
+    佇列滿時 write() 會阻塞 (背壓)；寫入端出錯時，下一次 write()/close() 會拋出該錯誤。
+    """
 
-                for i, j in skeleton_pairs:
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.error = None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name="pose-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            if self.error is not None:
+                # 已出錯：繼續取出佇列內容以免推論端卡住
+                continue
+            try:
+                self.writer.write(*item)
+            except BaseException as e:
+                self.error = e
+
+    def write(self, frame_id, det, row):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((frame_id, det, row))
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.writer.close()
+        if self.error is not None:
+            raise self.error
+
+
+def _pose_chunk_worker(task):
+    """
+    子程序：對 [start, end) 幀推論，結果存成部分 .npz (frame_id 為全片編號)。
+    end 為 None 時讀到影片結尾。
+    """
+    torch.set_num_threads(task["torch_threads"])
+    model = get_pose_model(task["model_path"], task["backend"])
+    source = VideoSource(
+        task["video_path"], hold=_frame_hold(task["batch_size"], task["frame_stride"])
+    )
+    frames = source.frames(task["start"], task["end"])
 
-                    if 0 <= i < len(keypoint) and 0 <= j < len(keypoint):
-                        x1, y1 = keypoint[i]
-                        x2, y2 = keypoint[j]
-                        if x1 > 0 and y1 > 0 and x2 > 0 and y2 > 0:
+    if task["roi_crop"]:
+        predict = _RoiPredictor(model, task["frame_size"], task["imgsz"], task["downscale"])
+    else:
+        predict = _full_frame_predictor(model, task["imgsz"], task["downscale"])
 
-                            cv2.line(
-                                frame,
-                                (int(x1), int(y1)),
-                                (int(x2), int(y2)),
-                                (255, 0, 0),
-                                2,
-                            )
+    if task["frame_stride"] > 1:
+        poses = _iter_poses_strided(
+            predict, frames, task["batch_size"], task["frame_stride"], task["frame_size"]
+        )
+    else:
+        poses = _iter_poses(predict, frames, task["batch_size"])
 
-        if save_video:
-            out.write(frame)
+    detected, rows = [], []
+    try:
+        for det, row in poses:
+            detected.append(bool(det))
+            rows.append(row if det else None)
+    finally:
+        source.release()
 
-        if save_txt:
-            if result.boxes is None or len(result.boxes) == 0:
-                f_txt.write(f"{frame_id} no detection\n")
-            else:
+    frame_ids, detected, rows = _stack_track(detected, rows)
+    save_keypoint_npz(task["part_path"], frame_ids + task["start"], detected, rows)
+    return task["part_path"]
 
-                xywh = (
-                    result.boxes.xywh.cpu().numpy()
-                    if torch.cuda.is_available()
-                    else result.boxes.xywh.numpy()
-                )
 
-                confs = (
-                    result.boxes.conf.cpu().numpy()
-                    if torch.cuda.is_available()
-                    else result.boxes.conf.numpy()
-                )
+def _iter_poses_parallel(video_path, output_dir, total_frames, num_workers, task_args):
+    """
+    把影片切成 num_workers 段交給子程序推論，依幀順序合併部分結果並產生 (detected, row)。
+    最後一段讀到影片結尾，因此總幀數與逐幀讀取相同，不依賴 CAP_PROP_FRAME_COUNT 的準確度。
+    """
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    parts_dir = tempfile.mkdtemp(prefix=f".{base_name}_parts_", dir=output_dir)
+    chunk = -(-total_frames // num_workers)
+    torch_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    tasks = []
+    for k in range(num_workers):
+        start = k * chunk
+        end = None if k == num_workers - 1 else (k + 1) * chunk
+        tasks.append(
+            dict(
+                task_args,
+                video_path=video_path,
+                start=start,
+                end=end,
+                part_path=os.path.join(parts_dir, f"part{k:03d}.npz"),
+                torch_threads=torch_threads,
+            )
+        )
 
-                classes = (
-                    result.boxes.cls.cpu().numpy()
-                    if torch.cuda.is_available()
-                    else result.boxes.cls.numpy()
+    executor = ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context(POSE_WORKER_START_METHOD),
+    )
+    try:
+        futures = [executor.submit(_pose_chunk_worker, task) for task in tasks]
+        next_frame = 0
+        for future in futures:
+            part = load_keypoint_npz(future.result())
+            if len(part["frame_ids"]) and part["frame_ids"][0] != next_frame:
+                raise RuntimeError(
+                    f"Pose chunk starts at frame {part['frame_ids'][0]}, expected {next_frame}"
                 )
+            next_frame += len(part["frame_ids"])
+
+            rows = np.concatenate(
+                [
+                    part["cls"][:, None].astype(np.float32),
+                    part["bbox"],
+                    part["keypoints"].reshape(len(part["frame_ids"]), -1),
+                ],
+                axis=1,
+            )
+            yield from zip(part["detected"], rows)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(parts_dir, ignore_errors=True)
 
-                keypoints = None
-                keypoints_conf = None
-                if result.keypoints is not None:
-
-                    keypoints = (
-                        result.keypoints.xy.cpu().numpy()
-                        if torch.cuda.is_available()
-                        else result.keypoints.xy.numpy()
-                    )
-
-                    keypoints_conf = (
-                        result.keypoints.conf.cpu().numpy()
-                        if torch.cuda.is_available()
-                        else result.keypoints.conf.numpy()
-                    )
-                if len(confs) > 1:
-                    best_idx = np.argmax(confs)
-                    xywh = xywh[best_idx : best_idx + 1]
-                    confs = confs[best_idx : best_idx + 1]
-                    classes = classes[best_idx : best_idx + 1]
-
-                    if keypoints is not None:
-                        keypoints = keypoints[best_idx : best_idx + 1]
-                        keypoints_conf = keypoints_conf[best_idx : best_idx + 1]
-
-                for i, (box_xywh, conf, cls) in enumerate(zip(xywh, confs, classes)):
-                    x_center, y_center, width, height = box_xywh
-                    keypoints_line = ""
-
-                    if (
-                        keypoints is not None
-                        and keypoints_conf is not None
-                        and i < len(keypoints)
-                    ):
-
-                        keypoint_data = keypoints[i]
-                        keypoint_conf_data = keypoints_conf[i]
-
-                        for (kpt_x, kpt_y), kpt_conf in zip(
-                            keypoint_data, keypoint_conf_data
-                        ):
-
-                            keypoints_line += f" {kpt_x:.6f} {kpt_y:.6f} {kpt_conf:.6f}"
-
-                    f_txt.write(
-                        f"{frame_id} {int(cls)} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f} {conf:.6f}{keypoints_line}\n"
-                    )
 
-        if frame_id % 50 == 0:
-            print(f"➡️ 已處理 {frame_id}/{total_frames} 幀")
+def run_pose_estimation(
+    model_path: str,
+    video_path: str,
+    output_dir: str,
+    save_video: bool = True,
+    save_txt: bool = True,
+    save_npz: bool = False,
+    batch_size: int = 1,
+    pipelined: bool = False,
+    queue_size: int = 16,
+    frame_stride: int = 1,
+    roi_crop: bool = False,
+    imgsz=None,
+    downscale: float = 1.0,
+    backend: str = None,
+    num_workers: int = 1,
+    checkpoint_every: int = 0,
+    progress_callback=None,
+    progress_interval: float = 1.0,
+    video_info=None,
+):
+    """
+    對影片進行姿態估計，輸出帶骨架的影片與預測結果 txt。
 
-        frame_id += 1
+    save_npz: 是否另存二進位結果 {base_name}_raw.npz (格式見 BD.keypoint_io)，
+    可搭配或取代 _raw.txt；BD.keypoint_io.load_keypoint_rows 可還原 28 欄版面。
+    回傳 (骨架影片路徑, 關鍵點檔路徑)；關鍵點檔在有 txt 時為 _raw.txt，否則為 _raw.npz。
+
+    save_video: 是否輸出骨架影片。骨架不在推論迴圈中繪製，而是推論結束後
+    由 BD.skeleton_renderer 依關鍵點陣列重新讀影片渲染；False 時完全不畫。
+
+    batch_size: 一次送進模型的幀數。大於 1 時累積 N 幀後一次推論，
+    輸出的 _raw.txt 與逐幀推論完全相同。
+    pipelined: 是否以「解碼執行緒 → 推論 → 寫出執行緒」三段管線執行，
+    讓影片解碼與文字輸出和推論重疊。queue_size 為各段之間佇列的上限幀數。
+    frame_stride: 大於 1 時啟用自適應跳幀，平穩游泳時每 frame_stride 幀推論一次、
+    中間幀以關鍵點線性內插；入水、轉身、觸牆附近自動改回逐幀推論。
+    roi_crop: 以前一幀 BBOX 周圍的小區域推論，關鍵點換算回整張畫面座標；
+    信心度下降或泳者離開裁切範圍時改回整張畫面重新偵測。
+    imgsz: YOLO 推論輸入尺寸 (None 使用模型預設)。
+    downscale: 推論前先把影格縮小的比例 (例如 0.5)，關鍵點會換算回原始座標，
+    下游模組不需任何修改。可用 BD.pose_resolution_report 比較各設定的誤差與速度。
+    backend: torch / onnx / openvino (None 時使用環境變數 POSE_BACKEND，見 BD.pose_backends)。
+    num_workers: 大於 1 時把影片切成 num_workers 段，各由一個子程序 seek 到該段推論並寫出
+    部分結果，主程序依幀順序合併；frame_id 編號與輸出內容和單程序執行相同。
+    checkpoint_every: 大於 0 時每 N 幀把新完成的幀原子寫入 {base_name}_raw.ckpt/ 下的分段檔
+    (只附加新分段，不重寫已存的結果)；同一影片、同樣設定再次執行時會從 checkpoint 的
+    下一幀繼續，完成後刪除 checkpoint。預設 0 = 不寫 checkpoint。
+    (僅適用單程序；自適應跳幀與 ROI 追蹤會從續跑點重新開始。)
+    progress_callback: 每 progress_interval 秒及結束時呼叫
+    progress_callback(frames_done, total_frames, fps, eta_seconds)；eta 無法估計時為 None。
+    video_info: 已探測的 BD.video_info.VideoInfo (None 時自動 probe_video)。
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    batch_size = max(1, int(batch_size))
+    queue_size = max(1, int(queue_size))
+    frame_stride = max(1, int(frame_stride))
+
+    video_info = video_info or probe_video(video_path)
+    frame_size = video_info.frame_size
+    total_frames = video_info.frame_count
+    print(f"🎬 影片 {os.path.basename(video_path)} 總幀數: {total_frames}")
+
+    num_workers = max(1, min(int(num_workers), total_frames))
+    if not 0 < downscale <= 1:
+        raise ValueError(f"downscale must be in (0, 1], got {downscale}")
+
+    # --- 確保輸出影片名稱是 _1.mp4 ---
+
+    base_name, ext = os.path.splitext(os.path.basename(video_path))
+    output_video_name = base_name + "_1" + ext
+    output_video_path = os.path.join(output_dir, output_video_name)
+
+    output_txt_path = None
 
-    cap.release()
-    if save_video:
-        out.release()
     if save_txt:
-        f_txt.close()
+        # Save as _raw.txt to distinguish from final smoothed output
+        output_txt_path = os.path.join(output_dir, f"{base_name}_raw.txt")
+        f_txt = open(output_txt_path, "w", encoding="utf-8")
+    else:
+        f_txt = None
+
+    checkpoint_dir = None
+    resumed = None
+    if checkpoint_every > 0:
+        if num_workers > 1:
+            print("⚠️ checkpoint_every 僅支援單程序執行，本次不寫 checkpoint。")
+        else:
+            checkpoint_dir = os.path.join(output_dir, f"{base_name}_raw.ckpt")
+            checkpoint_meta = {
+                "video": _video_signature(video_path, total_frames),
+                "model_path": os.path.abspath(model_path),
+                "backend": backend,
+                "imgsz": imgsz,
+                "downscale": downscale,
+                "frame_stride": frame_stride,
+                "roi_crop": roi_crop,
+            }
+            resumed = _load_checkpoint(checkpoint_dir, checkpoint_meta)
+            if resumed is None:
+                _reset_checkpoint(checkpoint_dir, checkpoint_meta)
+
+    # 推論迴圈不畫骨架；需要骨架影片時才保留關鍵點，結束後另外渲染
+    pose_writer = _PoseWriter(
+        f_txt,
+        total_frames,
+        collect=save_video or save_npz,
+        checkpoint_dir=checkpoint_dir,
+        checkpoint_every=checkpoint_every,
+    )
+
+    start_frame = 0
+    if resumed is not None:
+        start_frame = len(resumed[0])
+        print(f"⏩ 從 checkpoint 繼續：第 {start_frame}/{total_frames} 幀")
+        pose_writer.replay(*resumed)
+
+    if progress_callback is not None:
+        pose_writer.progress = _ProgressReporter(
+            progress_callback, total_frames, progress_interval, start_frame
+        )
+
+    writer = pose_writer
+    if pipelined:
+        writer = _ThreadedPoseWriter(writer, queue_size)
+
+    if num_workers > 1:
+        # 各子程序自行開檔解碼，主程序只負責合併與寫出
+        source = None
+        frames = None
+        poses = _iter_poses_parallel(
+            video_path,
+            output_dir,
+            total_frames,
+            num_workers,
+            dict(
+                model_path=model_path,
+                backend=backend,
+                batch_size=batch_size,
+                frame_stride=frame_stride,
+                roi_crop=roi_crop,
+                imgsz=imgsz,
+                downscale=downscale,
+                frame_size=frame_size,
+            ),
+        )
+    else:
+        # 同一個 worker 內共用已載入 (且已暖機) 的模型
+        model = get_pose_model(model_path, backend)
+        # pipelined 時由 VideoSource 的背景執行緒解碼，最多預先解碼 queue_size 幀
+        source = VideoSource(
+            video_path,
+            threaded=pipelined,
+            prefetch=queue_size,
+            hold=_frame_hold(batch_size, frame_stride),
+        )
+        frames = source.frames(start_frame)
+
+        if roi_crop:
+            predict = _RoiPredictor(model, frame_size, imgsz, downscale)
+        else:
+            predict = _full_frame_predictor(model, imgsz, downscale)
+
+        if frame_stride > 1:
+            poses = _iter_poses_strided(predict, frames, batch_size, frame_stride, frame_size)
+        else:
+            poses = _iter_poses(predict, frames, batch_size)
+
+    frames_done = start_frame
+    try:
+        for frame_id, (det, row) in enumerate(poses, start=start_frame):
+            writer.write(frame_id, det, row)
+            frames_done = frame_id + 1
+    finally:
+        poses.close()
+        if frames is not None:
+            frames.close()
+        writer.close()
+        if source is not None:
+            source.release()
+
+    if pose_writer.progress is not None:
+        # 實際幀數可能與 CAP_PROP_FRAME_COUNT 不同，結束時以實際值回報
+        pose_writer.progress.total_frames = frames_done
+        pose_writer.progress.update(frames_done, force=True)
+
+    # 全部完成才移除 checkpoint；中途出錯時保留以便續跑
+    if checkpoint_dir is not None:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    output_npz_path = None
+    if save_npz:
+        output_npz_path = os.path.join(output_dir, f"{base_name}_raw.npz")
+        save_keypoint_npz(output_npz_path, *pose_writer.track_arrays())
+        print(f"📦 Keypoint arrays saved to: {output_npz_path}")
+
+    if save_video:
+        frame_ids, keypoints = pose_writer.keypoint_arrays()
+        if render_skeleton_video(video_path, frame_ids, keypoints, output_video_path) is None:
+            save_video = False
 
     print(f"📄 Prediction saved to: {output_txt_path}" if save_txt else "No txt saved.")
 
@@ -239,7 +915,7 @@ def run_pose_estimation(
     )
 
     return output_video_path if save_video else None, (
-        output_txt_path if save_txt else None
+        output_txt_path if save_txt else output_npz_path
     )
 
 
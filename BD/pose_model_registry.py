@@ -0,0 +1,118 @@
+# BD/pose_model_registry.py
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from ultralytics import YOLO
+
+from BD.pose_backends import DEFAULT_POSE_BACKEND, resolve_backend_path
+
+"""
+姿態模型登錄表：每個 worker process 只載入一次權重，所有分析工作共用同一個實例。
+
+- 以權重檔的絕對路徑 + 修改時間 + 檔案大小當作 key，
+  POSE_MODEL_PATH 指向新檔案或權重被覆蓋時會自動重新載入。
+- backend 可選 torch / onnx / openvino (預設為環境變數 POSE_BACKEND)，
+  非 torch 後端載入 .pt 旁邊的匯出檔 (見 BD/pose_backends.py)。
+- 最多保留 MAX_CACHED_MODELS 個模型，超過時淘汰最久未使用者。
+- Ultralytics 的 predictor 不是執行緒安全的，因此推論時以鎖序列化
+  (FastAPI 透過 asyncio.to_thread 可能同時跑多個分析工作)。
+"""
+
+MAX_CACHED_MODELS = 2
+
+_registry_lock = threading.Lock()
+_models = OrderedDict()  # abs_path -> (signature, SharedPoseModel)
+
+
+class SharedPoseModel:
+    """
+    包裝共用的 YOLO 模型；呼叫方式與 YOLO 相同，推論期間持有鎖。
+    """
+
+    def __init__(self, model, model_path, backend="torch"):
+        self.model = model
+        self.model_path = model_path
+        self.backend = backend
+        self.warmed_up = False
+        self._lock = threading.Lock()
+
+    def __call__(self, source, **kwargs):
+        with self._lock:
+            return self.model(source, **kwargs)
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        # 例如 Ultralytics 內建名稱 (yolov8n-pose.pt) 尚未下載
+        return None
+
+
+def get_pose_model(model_path: str, backend: str = None) -> SharedPoseModel:
+    """
+    取得 model_path 在指定後端的共用模型，必要時才載入。
+    """
+    backend = backend or DEFAULT_POSE_BACKEND
+    model_path = resolve_backend_path(model_path, backend)
+    key = os.path.abspath(model_path)
+    signature = _file_signature(key)
+
+    with _registry_lock:
+        cached = _models.get(key)
+        if cached is not None and cached[0] == signature:
+            _models.move_to_end(key)
+            return cached[1]
+
+        if cached is not None:
+            logging.info(f"Pose weights changed on disk, reloading: {model_path}")
+        else:
+            logging.info(f"Loading pose model: {model_path}")
+
+        if backend == "torch":
+            model = YOLO(model_path)
+        else:
+            # 匯出檔沒有完整 metadata 時需明確指定 task
+            model = YOLO(model_path, task="pose")
+        shared = SharedPoseModel(model, model_path, backend)
+        _models[key] = (signature, shared)
+        _models.move_to_end(key)
+
+        while len(_models) > MAX_CACHED_MODELS:
+            old_key, _ = _models.popitem(last=False)
+            logging.info(f"Evicted pose model from registry: {old_key}")
+
+        return shared
+
+
+def warm_up_pose_model(
+    model_path: str, frame_size=(3840, 2160), backend: str = None
+) -> SharedPoseModel:
+    """
+    載入模型並用一張全黑假幀推論一次，讓第一個分析工作不必付暖機成本。
+    frame_size: (width, height)，預設與泳池 4K 影片相同。
+    """
+    shared = get_pose_model(model_path, backend)
+    if not shared.warmed_up:
+        width, height = frame_size
+        dummy = np.zeros((height, width, 3), dtype=np.uint8)
+        shared(dummy, verbose=False)
+        shared.warmed_up = True
+        logging.info(f"Pose model warmed up: {model_path}")
+    return shared
+
+
+def loaded_pose_models():
+    """回傳目前已載入的權重檔路徑 (健康檢查用)。"""
+    with _registry_lock:
+        return [shared.model_path for _, shared in _models.values()]
+
+
+def clear_pose_models():
+    """清空登錄表 (例如測試或手動釋放記憶體)。"""
+    with _registry_lock:
+        _models.clear()
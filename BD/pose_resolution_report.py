@@ -0,0 +1,152 @@
+# BD/pose_resolution_report.py
+import argparse
+import time
+
+import numpy as np
+
+from BD.pose_estimator import _full_frame_predictor, _iter_poses
+from BD.pose_model_registry import get_pose_model
+from BD.video_source import VideoSource
+
+"""
+推論解析度報告：同一段影片以不同 imgsz / downscale 推論，
+與全解析度結果比較每個關鍵點的像素誤差，並量測每秒處理幀數。
+
+用法:
+python -m BD.pose_resolution_report <model.pt> <video.mp4> --imgsz 1280 960 640 --downscale 1 0.5
+"""
+
+
+def _read_frames(video_path, max_frames):
+    # 各設定重複使用同一批幀，因此不重用 buffer
+    with VideoSource(video_path, reuse_buffers=False) as source:
+        return list(source.frames(0, max_frames or None))
+
+
+def _run_setting(model, frames, imgsz, downscale, batch_size):
+    """回傳 (detected (N,), keypoints (N, K, 3), fps)。"""
+    predict = _full_frame_predictor(model, imgsz, downscale)
+    start = time.perf_counter()
+    poses = list(_iter_poses(predict, frames, batch_size))
+    elapsed = time.perf_counter() - start
+
+    detected = np.array([det for det, _ in poses], dtype=bool)
+    width = max((row.shape[0] for det, row in poses if det), default=6)
+    keypoints = np.full((len(poses), (width - 6) // 3, 3), np.nan, dtype=np.float32)
+    for i, (det, row) in enumerate(poses):
+        if det:
+            keypoints[i] = row[6:].reshape(-1, 3)
+    return detected, keypoints, len(frames) / elapsed if elapsed > 0 else float("nan")
+
+
+def _keypoint_deviation(ref_detected, ref_kpts, detected, kpts):
+    """兩組都偵測到的幀上，每個關鍵點與參考結果的像素距離。"""
+    both = ref_detected & detected
+    if not both.any():
+        return None
+    return np.linalg.norm(kpts[both, :, :2] - ref_kpts[both, :, :2], axis=-1)
+
+
+def resolution_report(
+    model_path,
+    video_path,
+    imgsz_list=(1280, 960, 640),
+    downscale_list=(1.0,),
+    max_frames=300,
+    batch_size=8,
+):
+    """
+    以影片原始長邊 (對齊 32) 當作全解析度參考，逐一測試各設定。
+    回傳每個設定一筆 dict：imgsz, downscale, fps, detection_rate,
+    agreement (與參考同時偵測到的比例), 以及每個關鍵點的 mean/p95 像素誤差。
+    """
+    model = get_pose_model(model_path)
+    frames = _read_frames(video_path, max_frames)
+    if not frames:
+        raise ValueError(f"No frames read from {video_path}")
+
+    height, width = frames[0].shape[:2]
+    full_imgsz = int(np.ceil(max(width, height) / 32) * 32)
+
+    # 先暖機，避免第一個設定吃到模型載入成本
+    model(frames[0], verbose=False)
+
+    ref_detected, ref_kpts, ref_fps = _run_setting(model, frames, full_imgsz, 1.0, batch_size)
+
+    report = [
+        {
+            "imgsz": full_imgsz,
+            "downscale": 1.0,
+            "fps": ref_fps,
+            "detection_rate": float(ref_detected.mean()),
+            "agreement": 1.0,
+            "mean_px": [0.0] * ref_kpts.shape[1],
+            "p95_px": [0.0] * ref_kpts.shape[1],
+        }
+    ]
+
+    for downscale in downscale_list:
+        for imgsz in imgsz_list:
+            if imgsz == full_imgsz and downscale == 1.0:
+                continue
+            detected, kpts, fps = _run_setting(model, frames, imgsz, downscale, batch_size)
+            entry = {
+                "imgsz": imgsz,
+                "downscale": downscale,
+                "fps": fps,
+                "detection_rate": float(detected.mean()),
+                "agreement": float((detected == ref_detected).mean()),
+                "mean_px": None,
+                "p95_px": None,
+            }
+            dev = _keypoint_deviation(ref_detected, ref_kpts, detected, kpts)
+            if dev is not None:
+                entry["mean_px"] = np.nanmean(dev, axis=0).tolist()
+                entry["p95_px"] = np.nanpercentile(dev, 95, axis=0).tolist()
+            report.append(entry)
+
+    return report
+
+
+def print_report(report):
+    keypoint_names = [f"kp{i}" for i in range(1, len(report[0]["mean_px"]) + 1)]
+    header = f"{'imgsz':>6} {'scale':>6} {'fps':>7} {'det%':>6} {'agree%':>7}  " + " ".join(
+        f"{name:>7}" for name in keypoint_names
+    )
+    print(header)
+    print("-" * len(header))
+    for entry in report:
+        if entry["mean_px"] is None:
+            devs = " ".join(f"{'-':>7}" for _ in keypoint_names)
+        else:
+            devs = " ".join(
+                f"{m:>3.1f}/{p:<3.1f}".rjust(7)
+                for m, p in zip(entry["mean_px"], entry["p95_px"])
+            )
+        print(
+            f"{entry['imgsz']:>6} {entry['downscale']:>6.2f} {entry['fps']:>7.2f} "
+            f"{entry['detection_rate'] * 100:>6.1f} {entry['agreement'] * 100:>7.1f}  {devs}"
+        )
+    print("(關鍵點欄位為 平均/P95 像素誤差，相對於第一列全解析度結果)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pose inference resolution accuracy/speed report")
+    parser.add_argument("model_path")
+    parser.add_argument("video_path")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[1280, 960, 640])
+    parser.add_argument("--downscale", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    print_report(
+        resolution_report(
+            args.model_path,
+            args.video_path,
+            imgsz_list=args.imgsz,
+            downscale_list=args.downscale,
+            max_frames=args.max_frames,
+            batch_size=args.batch_size,
+        )
+    )
@@ -0,0 +1,152 @@
+# BD/result_cache.py
+import hashlib
+import logging
+import os
+import pickle
+import threading
+
+import numpy as np
+
+"""
+後端用的磁碟結果快取 (取代 Streamlit 的 st.cache_data)。
+
+- 鍵由呼叫端以 content_hash(...) 從輸入內容 (影像、關鍵點陣列、參數) 算出，
+  與檔案路徑無關：同一份上傳重新分析時，即使輸出資料夾不同也會命中。
+- 每筆結果 pickle 成 {cache_dir}/{key}.pkl (先寫 .tmp 再 rename)，多個 worker 程序共用同一資料夾。
+- LRU：命中時更新檔案 mtime；寫入後總大小超過 max_bytes 時從最久未使用的項目開始刪除。
+- stats() 回傳本程序的命中 / 未命中 / 淘汰次數與目前快取大小。
+"""
+
+CACHE_SUFFIX = ".pkl"
+
+
+def content_hash(*parts):
+    """
+    以 SHA-256 計算內容雜湊；parts 可為 ndarray (含 dtype 與 shape)、bytes、str 或其他可 repr 的參數。
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(f"ndarray:{part.dtype.str}:{part.shape}".encode())
+            digest.update(np.ascontiguousarray(part).data)
+        elif isinstance(part, (bytes, bytearray, memoryview)):
+            digest.update(b"bytes:")
+            digest.update(part)
+        else:
+            digest.update(f"{type(part).__name__}:{part!r}".encode())
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class DiskResultCache:
+    def __init__(self, cache_dir, max_bytes, name="result"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.name = name
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def get(self, key):
+        """回傳快取的結果；沒有或檔案損毀時回傳 None。"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)  # LRU：標記為最近使用
+        except FileNotFoundError:
+            value = None
+        except Exception as e:
+            logging.warning(f"[{self.name} cache] Dropping unreadable entry {path}: {e}")
+            self._remove(path)
+            value = None
+
+        with self._lock:
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def _entries(self):
+        """[(mtime, size, path), ...]，由最久未使用排到最近使用。"""
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue  # 其他程序剛刪除
+            entries.append((st.st_mtime_ns, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        # 至少保留剛寫入 (最近使用) 的一筆
+        for _, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+                with self._lock:
+                    self._evictions += 1
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+        with self._lock:
+            self._hits = self._misses = self._evictions = 0
+
+    def hit_rate(self):
+        """本程序的命中率 (只用記憶體內的計數，不掃描快取資料夾)。"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return self._hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """統計與目前快取大小 (會列出整個快取資料夾，供 /health 等低頻呼叫)。"""
+        entries = self._entries()
+        with self._lock:
+            hits, misses, evictions = self._hits, self._misses, self._evictions
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": self.hit_rate(),
+            "evictions": evictions,
+            "entries": len(entries),
+            "size_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
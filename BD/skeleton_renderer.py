@@ -0,0 +1,125 @@
+# BD/skeleton_renderer.py
+import os
+import sys
+import cv2
+import numpy as np
+
+from BD.keypoint_io import parse_keypoint_txt
+from BD.video_source import VideoSource
+
+"""
+骨架影片渲染：與姿態估計的推論迴圈分開。
+只依賴原影片與已存的關鍵點陣列，因此可以在推論後、稍後或另一個 process 執行，
+沒有人要看骨架影片時 (例如 orchestrator 的 save_video=False) 完全不需要跑。
+"""
+
+SKELETON_PAIRS = [(1, 2), (2, 3), (1, 4), (4, 5), (5, 6)]
+KEYPOINT_COLORS = [
+    (255, 0, 0),
+    (0, 255, 0),
+    (0, 0, 255),
+    (255, 255, 0),
+    (255, 0, 255),
+    (0, 255, 255),
+]
+
+
+def draw_skeleton(frame, keypoint):
+    """
+    在 frame 上畫出一位泳者的關鍵點與骨架。
+    keypoint: (K, 3) 陣列，每列為 [x, y, conf]
+    """
+    for i, (x, y, _) in enumerate(keypoint):
+        if x > 0 and y > 0:
+            color = KEYPOINT_COLORS[i % len(KEYPOINT_COLORS)]
+            cv2.circle(frame, (int(x), int(y)), 4, color, -1)
+
+    for i, j in SKELETON_PAIRS:
+        if 0 <= i < len(keypoint) and 0 <= j < len(keypoint):
+            x1, y1 = keypoint[i, :2]
+            x2, y2 = keypoint[j, :2]
+            if x1 > 0 and y1 > 0 and x2 > 0 and y2 > 0:
+                cv2.line(
+                    frame,
+                    (int(x1), int(y1)),
+                    (int(x2), int(y2)),
+                    (255, 0, 0),
+                    2,
+                )
+
+
+def load_keypoints_from_txt(txt_path):
+    """
+    從 _raw.txt (或平滑後 txt) 讀出有偵測到的幀。
+    回傳 frame_ids (N,) 與 keypoints (N, K, 3)。
+    """
+    rows = parse_keypoint_txt(txt_path)
+    # 未偵測到的幀 (no detection) 與欄位不足的列 BBOX 為 NaN
+    detected = ~np.isnan(rows[:, 1:7]).any(axis=1)
+    if not detected.any():
+        return np.empty(0, dtype=np.int64), np.empty((0, 0, 3), dtype=np.float32)
+    rows = rows[detected]
+    return rows[:, 0].astype(np.int64), rows[:, 7:].astype(np.float32).reshape(len(rows), -1, 3)
+
+
+def render_skeleton_video(video_path, frame_ids, keypoints, output_video_path):
+    """
+    依已存的關鍵點陣列，在原影片上畫骨架並輸出影片。
+
+    參數:
+    - frame_ids: (N,) 有關鍵點的幀號
+    - keypoints: (N, K, 3) 對應的 [x, y, conf]
+    - output_video_path: 輸出影片路徑
+
+    回傳:
+    - 輸出影片路徑；影片寫入器初始化失敗時回傳 None
+    """
+    source = VideoSource(video_path, threaded=True)
+    frame_width, frame_height, fps = source.width, source.height, source.fps
+
+    try:
+        fourcc = cv2.VideoWriter_fourcc(*"XVID")
+    except:
+        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))
+    if not out.isOpened():
+        print("[警告] render_skeleton_video 影片寫入器初始化失敗，將跳過輸出影片。")
+        source.release()
+        return None
+
+    row_of_frame = {int(f): i for i, f in enumerate(frame_ids)}
+
+    try:
+        for frame_id, frame in enumerate(source):
+            idx = row_of_frame.get(frame_id)
+            if idx is not None:
+                draw_skeleton(frame, keypoints[idx])
+
+            out.write(frame)
+    finally:
+        source.release()
+        out.release()
+    return output_video_path
+
+
+def render_skeleton_video_from_txt(video_path, txt_path, output_video_path):
+    """直接從關鍵點 txt 產生骨架影片 (供事後或其他 process 呼叫)。"""
+    frame_ids, keypoints = load_keypoints_from_txt(txt_path)
+    return render_skeleton_video(video_path, frame_ids, keypoints, output_video_path)
+
+
+if __name__ == "__main__":
+    # python -m BD.skeleton_renderer <video> <keypoints_txt> [output_video]
+    if len(sys.argv) < 3:
+        print("usage: python -m BD.skeleton_renderer <video> <keypoints_txt> [output_video]")
+        sys.exit(1)
+
+    video_path, txt_path = sys.argv[1], sys.argv[2]
+    if len(sys.argv) > 3:
+        output_video_path = sys.argv[3]
+    else:
+        base_name, ext = os.path.splitext(video_path)
+        output_video_path = base_name + "_1" + ext
+
+    result = render_skeleton_video_from_txt(video_path, txt_path, output_video_path)
+    print(f"🎞 Skeleton video saved to: {result}" if result else "No video saved.")
@@ -1,6 +1,7 @@
-import pandas as pd
 import logging
 
+from BD.keypoint_track import load_keypoint_track
+
 def analyze_split_times(txt_path, start_frame, fps, d15m_x0, d25m_x0, d50m_x0, laps_data=None):
     """
     傳入追蹤txt路徑與起始frame、fps與距離線位置，
@@ -18,15 +19,11 @@ def analyze_split_times(txt_path, start_frame, fps, d15m_x0, d25m_x0, d50m_x0, l
     )
 
     try:
-        # 讀取數據
-        df = pd.read_csv(txt_path, sep=r"\s+", header=None)
+        # 讀取數據 (txt_path 可為 txt 路徑或已載入的 KeypointTrack)
         # 選擇所需欄位: 0=frame, 2=bbox_x, 4=bbox_w, 16=wrist_x
-        if df.shape[1] > 16:
-            df = df[[0, 2, 4, 16]]
-            df.columns = ["frame", "bbox_x", "bbox_w", "wrist_x"]
-        else:
-            logging.error(f"❌ TXT file format unexpected. Columns: {df.shape[1]}")
-            return {"15m": None, "25m": None, "50m": None}, None
+        df = load_keypoint_track(txt_path).to_frame(
+            {"bbox_x": 2, "bbox_w": 4, "wrist_x": 16}
+        ).rename(columns={"frame_id": "frame"})
 
         # 過濾起始幀
         df = df[df["frame"] >= start_frame].reset_index(drop=True)
@@ -4,29 +4,19 @@ import pandas as pd
 import numpy as np
 from scipy.ndimage import uniform_filter1d
 
+from BD.keypoint_track import load_keypoint_track
+from BD.video_info import probe_video
+from BD.video_source import read_frame
+
 
 def read_txt(path):
-    data = []
-    with open(path, "r") as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) > 20:
-                try:
-                    frame_id = int(parts[0])
-                    x_center = float(parts[2])
-                    width = float(parts[4])
-                    head_y = float(parts[8])
-                    data.append((frame_id, x_center, width, head_y))
-                except:
-                    continue
-    return pd.DataFrame(data, columns=["frame_id", "x_center", "width", "head_y"])
+    """path 可為 txt 路徑或已載入的 KeypointTrack。"""
+    return load_keypoint_track(path).to_frame({"x_center": 2, "width": 4, "head_y": 8})
 
 
 def detect_waterline_y(video_path, lower_blue=(80, 50, 50), upper_blue=(140, 255, 255)):
-    cap = cv2.VideoCapture(video_path)
-    ret, frame = cap.read()
-    cap.release()
-    if not ret:
+    frame = read_frame(video_path)
+    if frame is None:
         raise RuntimeError("無法讀取影片")
 
     hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
@@ -81,15 +71,14 @@ def find_touch_frame(df, video_width):
     return None
 
 
-def extract_stroke_segments(txt_path, video_path, waterline_y):
+def extract_stroke_segments(txt_path, video_path, waterline_y, video_info=None):
     df = read_txt(txt_path)
 
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    try:
+        video_info = video_info or probe_video(video_path)
+    except IOError:
         raise RuntimeError(f"無法開啟影片: {video_path}")
-
-    v_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    cap.release()
+    v_width = video_info.width
 
     (s1, e1), (s2, e2) = find_submerged_segments(df, waterline_y)
     touch_frame = find_touch_frame(df, v_width)
@@ -97,30 +86,19 @@ def extract_stroke_segments(txt_path, video_path, waterline_y):
     return e1, s2, e2, touch_frame, waterline_y
 
 
+# 划手分析使用的欄位：肩 x/y、腕 x/y、髖 x
+STROKE_COLUMNS = [10, 11, 16, 17, 19]
+
+
 def extract_columns_in_range(txt_path, range1, range2):
-    def parse_line(line):
-        parts = line.strip().split()
-        if len(parts) > 17:
-            frame_id = int(parts[0])
-            col10 = float(parts[10])
-            col11 = float(parts[11])
-            col16 = float(parts[16])
-            col17 = float(parts[17])
-            col19 = float(parts[19])
-            return frame_id, col10, col11, col16, col17, col19
-        return None
-
-    range1_data = []
-    range2_data = []
-    with open(txt_path, "r") as f:
-        for line in f:
-            parsed = parse_line(line)
-            if parsed:
-                frame_id, col10, col11, col16, col17, col19 = parsed
-                if range1[0] <= frame_id <= range1[1]:
-                    range1_data.append((frame_id, col10, col11, col16, col17, col19))
-                elif range2[0] <= frame_id <= range2[1]:
-                    range2_data.append((frame_id, col10, col11, col16, col17, col19))
+    track = load_keypoint_track(txt_path)
+    range1_data = track.between(range1[0], range1[1]).records(STROKE_COLUMNS)
+    # 與 range1 重疊的幀只歸 range1
+    range2_data = [
+        row
+        for row in track.between(range2[0], range2[1]).records(STROKE_COLUMNS)
+        if not range1[0] <= row[0] <= range1[1]
+    ]
     return {"range1": range1_data, "range2": range2_data}
 
 
@@ -188,38 +166,22 @@ from .backstroke_butterfly_freestyle_stroke_phase_plot import (
 
 def extract_columns_for_segment(txt_path, start, end):
     """
-    擷取指定區間 [start, end] 內的數據
+    擷取指定區間 [start, end] 內的數據 (txt_path 可為 KeypointTrack)
     """
-    def parse_line(line):
-        parts = line.strip().split()
-        if len(parts) > 17:
-            frame_id = int(parts[0])
-            col10 = float(parts[10])
-            col11 = float(parts[11])
-            col16 = float(parts[16])
-            col17 = float(parts[17])
-            col19 = float(parts[19])
-            return frame_id, col10, col11, col16, col17, col19
-        return None
-
-    segment_data = []
-    with open(txt_path, "r") as f:
-        for line in f:
-            parsed = parse_line(line)
-            if parsed:
-                frame_id = parsed[0]
-                if start <= frame_id <= end:
-                    segment_data.append(parsed)
-    return segment_data
+    return load_keypoint_track(txt_path).between(start, end).records(STROKE_COLUMNS)
 
 def run_backstroke_butterfly_analysis(
-    txt_path: str, video_path: str, waterline_y: float, laps_data: list = None, output_txt_path: str = None
+    txt_path: str, video_path: str, waterline_y: float, laps_data: list = None, output_txt_path: str = None,
+    video_info=None,
 ):
     """
     執行仰式/蝶式的分析流程：
     支援新的 laps_data (彈性分趟) 或舊的自動偵測 (extract_stroke_segments)。
     output_txt_path: 指定輸出相位資訊的 TXT 檔案路徑。
+    video_info: 已探測的 BD.video_info.VideoInfo (None 時需要時才 probe_video)。
+    txt_path 可為 txt 路徑或已載入的 KeypointTrack (各分趟共用同一份)。
     """
+    track = load_keypoint_track(txt_path)
     data = {}
     analysis_end_frame = 0
 
@@ -234,7 +196,7 @@ def run_backstroke_butterfly_analysis(
                 s, e = swim_seg
                 key = f"lap{idx}_{trend}"
                 # 擷取該段落的數據
-                seg_data = extract_columns_for_segment(txt_path, s, e)
+                seg_data = extract_columns_for_segment(track, s, e)
                 if seg_data:
                     data[key] = seg_data
                     analysis_end_frame = max(analysis_end_frame, e)
@@ -247,7 +209,7 @@ def run_backstroke_butterfly_analysis(
         # 舊邏輯：自動偵測 2 段
         # 確保 extract_stroke_segments 已經被定義在上面或導入
         e1, s2, e2, touch_frame, waterline_y = extract_stroke_segments(
-            txt_path, video_path, waterline_y
+            track, video_path, waterline_y, video_info
         )
     
         if None in (e1, s2, e2):  # 這裡我們只需要檢查 e1, s2, e2 是否有效
@@ -257,9 +219,7 @@ def run_backstroke_butterfly_analysis(
             # --- 修正點：定義分析終點 ---
         if touch_frame is None:
             # 如果沒有偵測到觸牆，獲取影片的總幀數作為分析終點
-            cap = cv2.VideoCapture(video_path)
-            last_frame = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            cap.release()
+            last_frame = (video_info or probe_video(video_path)).frame_count
             analysis_end_frame = last_frame - 5  # 使用影片最後5幀
             print("偵測不到觸牆幀，使用影片最後一幀作為分析終點。")
         else:
@@ -270,7 +230,7 @@ def run_backstroke_butterfly_analysis(
     
         # 擷取所需欄位數據
         # 舊 extract_columns_in_range 返回 {"range1": ..., "range2": ...}
-        data = extract_columns_in_range(txt_path, range1, range2)
+        data = extract_columns_in_range(track, range1, range2)
 
     # 找出划手階段交會點
     intersection_dict = plot_intersection_from_smoothed(data)
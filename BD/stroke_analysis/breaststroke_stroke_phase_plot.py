@@ -4,6 +4,8 @@ import matplotlib.pyplot as plt
 from scipy.ndimage import uniform_filter1d
 import streamlit as st
 
+from BD.keypoint_track import load_keypoint_track
+
 
 import json
 
@@ -22,34 +24,20 @@ class NumpyEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 def load_data_dict_from_txt(txt_path, range1, range2):
-    def parse_line(line):
-        parts = line.strip().split()
-        if len(parts) > 20:
-            try:
-                frame = int(parts[0])
-                col10 = float(parts[10])  # shoulder X
-                col11 = float(parts[11])  # shoulder Y
-                col13 = float(parts[13])  # elbow X
-                col14 = float(parts[14])  # elbow Y
-                col16 = float(parts[16])  # wrist X
-                col17 = float(parts[17])  # wrist Y
-                hip_x = float(parts[19])  # hip X
-                return frame, col10, col11, col13, col14, col16, col17, hip_x
-            except:
-                return None
-        return None
-
-    data_dict = {"range1": [], "range2": []}
-    with open(txt_path, "r") as f:
-        for line in f:
-            parsed = parse_line(line)
-            if parsed:
-                frame = parsed[0]
-                if range1[0] <= frame <= range1[1]:
-                    data_dict["range1"].append(parsed)
-                elif range2[0] <= frame <= range2[1]:
-                    data_dict["range2"].append(parsed)
-    return data_dict
+    """
+    txt_path 可為 txt 路徑或已載入的 KeypointTrack。
+    每筆為 (frame, 肩 x/y, 肘 x/y, 腕 x/y, 髖 x)。
+    """
+    track = load_keypoint_track(txt_path)
+    columns = [10, 11, 13, 14, 16, 17, 19]
+    range1_data = track.between(range1[0], range1[1]).records(columns)
+    # 與 range1 重疊的幀只歸 range1
+    range2_data = [
+        row
+        for row in track.between(range2[0], range2[1]).records(columns)
+        if not range1[0] <= row[0] <= range1[1]
+    ]
+    return {"range1": range1_data, "range2": range2_data}
 
 
 import json
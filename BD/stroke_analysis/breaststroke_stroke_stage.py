@@ -4,29 +4,19 @@ import cv2
 from scipy.ndimage import uniform_filter1d
 import pandas as pd
 
+from BD.keypoint_track import load_keypoint_track
+from BD.video_info import probe_video
+from BD.video_source import read_frame
+
 
 def read_txt(path):
-    data = []
-    with open(path, "r") as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) > 20:
-                try:
-                    frame_id = int(parts[0])
-                    x_center = float(parts[2])
-                    width = float(parts[4])
-                    head_y = float(parts[8])
-                    data.append((frame_id, x_center, width, head_y))
-                except:
-                    continue
-    return pd.DataFrame(data, columns=["frame_id", "x_center", "width", "head_y"])
+    """path 可為 txt 路徑或已載入的 KeypointTrack。"""
+    return load_keypoint_track(path).to_frame({"x_center": 2, "width": 4, "head_y": 8})
 
 
 def detect_waterline_y(video_path, lower_blue=(80, 50, 50), upper_blue=(140, 255, 255)):
-    cap = cv2.VideoCapture(video_path)
-    ret, frame = cap.read()
-    cap.release()
-    if not ret:
+    frame = read_frame(video_path)
+    if frame is None:
         raise RuntimeError("無法讀取影片")
 
     hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
@@ -91,24 +81,9 @@ def calculate_angle(A, B, C):
 
 
 def process_range(txt_path, frame_range, slope_change, smooth_size=5, min_frame_gap=30):
-    data = []
-    with open(txt_path, "r") as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) > 19:
-                frame_id = int(parts[0])
-                if frame_range[0] <= frame_id <= frame_range[1]:
-                    col7 = float(parts[7])
-                    col8 = float(parts[8])
-                    col10 = float(parts[10])
-                    col11 = float(parts[11])
-                    col13 = float(parts[13])
-                    col14 = float(parts[14])
-                    col16 = float(parts[16])
-                    col17 = float(parts[17])
-                    data.append(
-                        (frame_id, col7, col8, col10, col11, col13, col14, col16, col17)
-                    )
+    # (frame_id, 頭 x/y, 肩 x/y, 肘 x/y, 腕 x/y)；txt_path 可為 KeypointTrack
+    track = load_keypoint_track(txt_path).between(frame_range[0], frame_range[1])
+    data = track.records([7, 8, 10, 11, 13, 14, 16, 17])
 
     frames = np.array([d[0] for d in data])
     shoulder_xy = [(d[3], d[4]) for d in data]
@@ -189,15 +164,14 @@ def process_range(txt_path, frame_range, slope_change, smooth_size=5, min_frame_
     )
 
 
-def extract_stroke_segments(txt_path, video_path, waterline_y):
+def extract_stroke_segments(txt_path, video_path, waterline_y, video_info=None):
     df = read_txt(txt_path)
 
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    try:
+        video_info = video_info or probe_video(video_path)
+    except IOError:
         raise RuntimeError(f"無法開啟影片: {video_path}")
-
-    v_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    cap.release()
+    v_width = video_info.width
 
     (s1, e1), (s2, e2) = find_submerged_segments(df, waterline_y)
     touch_frame = find_touch_frame(df, v_width)
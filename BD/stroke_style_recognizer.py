@@ -4,27 +4,17 @@ import numpy as np
 import math
 from sklearn.preprocessing import StandardScaler
 from .diving_analyzer_track_angles import get_diving_swimming_segments
+from .keypoint_track import load_keypoint_track
 import joblib
 from collections import Counter
 
 
 def read_full_keypoints_txt(path, expected_cols=28):
     """
-    讀取完整骨架 txt，回傳 DataFrame
+    讀取完整骨架 txt (或 KeypointTrack)，回傳 DataFrame
     """
-    data = []
-    with open(path, "r") as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) >= expected_cols:
-                try:
-                    values = list(map(float, parts))
-                    frame_id = int(values[0])
-                    data.append([frame_id] + values[1:])
-                except:
-                    continue
-    col_names = ["frame_id"] + [f"col{i}" for i in range(1, expected_cols)]
-    return pd.DataFrame(data, columns=col_names)
+    track = load_keypoint_track(path)
+    return track.to_frame({f"col{i}": i for i in range(1, expected_cols)})
 
 
 def calculate_signed_angle(A, B, C):
@@ -75,8 +65,10 @@ def split_segments(video_path, keypoints_txt_path, laps_data=None):
     3. 計算潛泳段髖–膝–踝平均角度
     4. 游泳段再取出 7 個 y 座標並做標準化
     """
-    # 讀完整骨架 (需包含 col5 height)
-    df_full = read_full_keypoints_txt(keypoints_txt_path)
+    # 讀完整骨架 (需包含 col5 height)；df_full 與 track 逐列對齊，各段以 frame 索引切片
+    track = load_keypoint_track(keypoints_txt_path)
+    df_full = read_full_keypoints_txt(track)
+    frame_index = track.index
     
     # 準備容器
     df_diving_list = []
@@ -90,14 +82,14 @@ def split_segments(video_path, keypoints_txt_path, laps_data=None):
             if div_seg and div_seg[0] is not None:
                 s, e = div_seg
                 # 篩選並複製數據
-                d_part = df_full[(df_full["frame_id"] >= s) & (df_full["frame_id"] <= e)].copy()
+                d_part = df_full.iloc[frame_index.rows(s, e)].copy()
                 df_diving_list.append(d_part)
                 
             # 2. Swimming Segment
             swim_seg = lap.get("swimming_segment")
             if swim_seg and swim_seg[0] is not None:
                 s, e = swim_seg
-                s_part = df_full[(df_full["frame_id"] >= s) & (df_full["frame_id"] <= e)].copy()
+                s_part = df_full.iloc[frame_index.rows(s, e)].copy()
                 df_swimming_list.append(s_part)
     else:
         # Fallback: 使用舊邏輯 (只取第一趟)
@@ -113,11 +105,11 @@ def split_segments(video_path, keypoints_txt_path, laps_data=None):
         
         # 潛泳段 (s1~e1)
         if s1 < e1:
-            df_diving_list.append(df_full[(df_full["frame_id"] >= s1) & (df_full["frame_id"] <= e1)])
+            df_diving_list.append(df_full.iloc[frame_index.rows(s1, e1)])
             
         # 游泳段 (e1~s2)
         if e1 < s2:
-             df_swimming_list.append(df_full[(df_full["frame_id"] >= e1) & (df_full["frame_id"] <= s2)])
+             df_swimming_list.append(df_full.iloc[frame_index.rows(e1, s2)])
 
     # 合併數據
     if df_diving_list:
@@ -1,7 +1,140 @@
 # BD/txt_base.py
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
 
+from BD.keypoint_io import (
+    KEYPOINT_COLUMN_NAMES,
+    parse_keypoint_txt,
+    round_keypoint_txt_values,
+    write_keypoint_txt,
+)
+
+
+# 檢查異常值的關鍵點 xy 欄位 (0-indexed)
+OUTLIER_COLUMNS = [7, 8, 10, 11, 13, 14, 16, 17, 19, 20, 22, 23, 25, 26]
+# 平滑欄位（BBOX與7關鍵點）
+SMOOTH_COLUMNS = [2, 3, 4, 5, 7, 8, 10, 11, 13, 14, 16, 17, 19, 20, 22, 23, 25, 26]
+SMOOTH_WINDOW = 7
+
+
+class PendingWrites:
+    """
+    在背景執行緒依序寫出關鍵點 txt，讓計算 (或後續分析階段) 不必等檔案寫完。
+    wait() 等待全部寫完；寫檔時發生的例外會在 wait() 丟出。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="keypoint-writer")
+        self._futures = []
+
+    def submit(self, path, rows, message=None):
+        def _write():
+            write_keypoint_txt(path, rows)
+            if message:
+                print(message)
+            return path
+
+        self._futures.append(self._executor.submit(_write))
+
+    def wait(self):
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._futures = []
+            self._executor.shutdown(wait=True)
+
+
+def filter_keypoint_outliers(values):
+    """
+    關鍵點 xy 欄位的異常值過濾，values 為 (N, C) 陣列 (各欄獨立)，回傳新陣列：
+    1. 小於10設為 nan (假設是被填0的)
+    2. 與前一筆差值 > 50 設為 nan (以 1. 之後的值比較)
+    3. 與後一筆差值 > 50 設為 nan (以 2. 之後的值比較)
+    與逐欄 df.loc / diff 的結果相同。
+    """
+    values = np.array(values, dtype=np.float64)
+    values[values < 10] = np.nan
+
+    jump = np.zeros(values.shape, dtype=bool)
+    jump[1:] = np.abs(values[1:] - values[:-1]) > 50
+    values[jump] = np.nan
+
+    jump[:] = False
+    jump[:-1] = np.abs(values[:-1] - values[1:]) > 50
+    values[jump] = np.nan
+    return values
+
+
+def _write(writes, path, rows, message):
+    if writes is None:
+        write_keypoint_txt(path, rows)
+        print(message)
+    else:
+        writes.submit(path, rows, message)
+
+
+def smooth_keypoints(
+    input_txt,
+    filtered_output: str = None,
+    first_output: str = None,
+    final_output: str = None,
+    writes: PendingWrites = None,
+):
+    """
+    在記憶體中完成清理異常點、補值內插與平滑，直接回傳平滑後的 (N, 28) float64 陣列。
+    回傳值與寫出 final_output 後再讀回的數值相同 (round_keypoint_txt_values)，
+    下游分析使用陣列或 txt 結果一致。
+
+    參數:
+    - input_txt: 原始 keypoints txt 路徑，或已解析的 (N, 28) 陣列
+    - filtered_output / first_output / final_output: 各階段結果的輸出路徑 (None 則不輸出)；
+      只是輸出，不會再讀回來 (first_output 的 6 位小數取整仍套用在平滑前，結果與讀回相同)
+    - writes: PendingWrites 時各檔案在背景寫出 (呼叫端負責 wait())；None 時同步寫入
+    """
+    if isinstance(input_txt, np.ndarray):
+        rows = np.array(input_txt, dtype=np.float64)
+    else:
+        # 讀取資料 ("<frame> no detection" 列為 [frame, 0, NaN...])
+        rows = parse_keypoint_txt(input_txt)
+    df = pd.DataFrame(rows, columns=KEYPOINT_COLUMN_NAMES)
+
+    # === 儲存過濾異常值後的中繼檔案（可選）===
+    if filtered_output is not None:
+        _write(
+            writes,
+            filtered_output,
+            df.to_numpy(copy=True),
+            f"中繼檔儲存完成（過濾異常值後）: {filtered_output}",
+        )
+
+    # === 處理關鍵點xy欄位異常值 (14 欄一次處理) ===
+    df.iloc[:, OUTLIER_COLUMNS] = filter_keypoint_outliers(rows[:, OUTLIER_COLUMNS])
+
+    # === 補值內插 ===
+    df = df.interpolate(method="linear", limit_direction="both")
+
+    # === 儲存第一階段補值內插後的 TXT（可選）===
+    if first_output is not None:
+        _write(writes, first_output, df.to_numpy(copy=True), f"第一步清理完成，儲存為: {first_output}")
+
+    # === 平滑 (直接使用記憶體中的 df，不經由 first_output 讀回) ===
+    if first_output is not None:
+        # 原本平滑的是讀回的 first_output (6 位小數)，維持相同數值
+        df = pd.DataFrame(round_keypoint_txt_values(df.to_numpy(dtype=np.float64)))
+    df.columns = list(range(df.shape[1]))
+    for col in SMOOTH_COLUMNS:
+        df[col] = df[col].rolling(window=SMOOTH_WINDOW, min_periods=1, center=True).mean()
+    smoothed = round_keypoint_txt_values(df.to_numpy(dtype=np.float64))
+
+    # === 儲存第二階段平滑後的 TXT（可選）===
+    if final_output is not None:
+        _write(writes, final_output, smoothed, f"第二步平滑完成，儲存為: {final_output}")
+
+    return smoothed
+
 
 def process_keypoints_txt(
     input_txt: str,
@@ -13,8 +146,8 @@ def process_keypoints_txt(
     save_final_output: bool = True,
 ):
     """
-    讀取 keypoints txt，清理異常點，補值內插並平滑。
-    可選擇輸出各階段結果。
+    讀取 keypoints txt，清理異常點，補值內插並平滑 (見 smooth_keypoints)。
+    可選擇輸出各階段結果；各檔案在背景寫出，函式回傳前全部寫完。
 
     參數:
     - input_txt: 原始 keypoints txt 路徑
@@ -26,135 +159,23 @@ def process_keypoints_txt(
     - save_final_output: 是否儲存平滑後檔案
 
     回傳:
-    - 平滑後的 DataFrame
+    - 平滑後 txt 的路徑 (未儲存時為 None)
     """
-
-    # 讀取資料
-    with open(input_txt, "r") as f:
-        lines = f.readlines()
-
-    # 根據第一筆有資料的列決定欄位數量
-    num_columns = None
-    for line in lines:
-        if "no detection" not in line:
-            num_columns = len(line.strip().split())
-            break
-
-    data = []
-
-    # 處理每一行資料
-    for line in lines:
-        parts = line.strip().split()
-        if "no" in parts:
-            frame_id = int(parts[0])
-            row = [frame_id, 0] + [np.nan] * (num_columns - 2)
-        else:
-            row = []
-            for v in parts:
-                try:
-                    row.append(float(v))
-                except:
-                    row.append(v)
-        data.append(row)
-
-    df = pd.DataFrame(data)
-
-    # 建立欄位名稱
-    cols = ["frame_id", "class", "x_center", "y_center", "width", "height", "conf"]
-    for i in range(1, 8):
-        cols += [f"kp{i}_x", f"kp{i}_y", f"kp{i}_conf"]
-    df.columns = cols
-
-    # === 儲存過濾異常值後的中繼檔案（可選）===
-    if save_filtered and filtered_output is not None:
-        with open(filtered_output, "w") as f:
-            for _, row in df.iterrows():
-                row_str = " ".join(
-                    (
-                        str(int(v))
-                        if df.columns[i] in ["frame_id", "class"]
-                        else f"{v:.6f}"
-                    )
-                    for i, v in enumerate(row)
-                )
-                f.write(row_str + "\n")
-        print(f"中繼檔儲存完成（過濾異常值後）: {filtered_output}")
-
-    # === 處理關鍵點xy欄位異常值 ===
-    columns_to_check = [
-        7,
-        8,
-        10,
-        11,
-        13,
-        14,
-        16,
-        17,
-        19,
-        20,
-        22,
-        23,
-        25,
-        26,
-    ]  # 0-indexed
-    for col_idx in columns_to_check:
-        col_name = df.columns[col_idx]
-
-        # 1. 小於10設為 nan (假設是被填0的)
-        df.loc[df[col_name] < 10, col_name] = np.nan
-
-        # 2. 與前一筆差值 > 50 設為 nan
-        diff_prev = df[col_name].diff().abs()
-        df.loc[diff_prev > 50, col_name] = np.nan
-
-        # 3. 與後一筆差值 > 50 設為 nan
-        diff_next = df[col_name].diff(periods=-1).abs()
-        df.loc[diff_next > 50, col_name] = np.nan
-
-    # === 補值內插 ===
-    df = df.interpolate(method="linear", limit_direction="both")
-
-    # === 儲存第一階段補值內插後的 TXT（可選）===
-    if save_first_output and first_output is not None:
-        with open(first_output, "w") as f:
-            for _, row in df.iterrows():
-                row_str = " ".join(
-                    (
-                        str(int(v))
-                        if df.columns[i] in ["frame_id", "class"]
-                        else f"{v:.6f}"
-                    )
-                    for i, v in enumerate(row)
-                )
-                f.write(row_str + "\n")
-        print(f"第一步清理完成，儲存為: {first_output}")
-
-    # === 讀取補值內插後檔案，進行平滑 ===
-    if first_output is not None:
-        df = pd.read_csv(first_output, sep="\s+", header=None)
-        df.columns = list(range(df.shape[1]))
-    else:
-        # 若沒指定檔案，使用目前df
-        df.columns = list(range(df.shape[1]))
-
-    # 平滑欄位（BBOX與7關鍵點）
-    smooth_columns = [2, 3, 4, 5, 7, 8, 10, 11, 13, 14, 16, 17, 19, 20, 22, 23, 25, 26]
-    for col in smooth_columns:
-        df[col] = df[col].rolling(window=7, min_periods=1, center=True).mean()
-
-    # === 儲存第二階段平滑後的 TXT（可選）===
-    if save_final_output and final_output is not None:
-        with open(final_output, "w") as f:
-            for _, row in df.iterrows():
-                row_str = " ".join(
-                    str(int(val)) if i in [0, 1] else f"{val:.6f}"
-                    for i, val in enumerate(row)
-                )
-                f.write(row_str + "\n")
-        print(f"第二步平滑完成，儲存為: {final_output}")
-    else:
+    if not (save_final_output and final_output is not None):
         final_output = None  # 防呆
 
+    writes = PendingWrites()
+    try:
+        smooth_keypoints(
+            input_txt,
+            filtered_output=filtered_output if save_filtered else None,
+            first_output=first_output if save_first_output else None,
+            final_output=final_output,
+            writes=writes,
+        )
+    finally:
+        writes.wait()
+
     return final_output  # <<< 回傳檔案路徑給 orchestrator 或其他模組使用
 
 
@@ -167,27 +188,5 @@ def process_keypoints_txt(
 #     final_output=final_output,
 #     save_final_output=True
 # )
-# # DEMO
-# import os
-
-# def main():
-#     folder = r"D:\Kady\swimmer coco\kick_data\new\women"
-
-#     for fname in os.listdir(folder):
-#         if fname.endswith(".txt") and not fname.endswith(".n.txt"):
-#             input_txt = os.path.join(folder, fname)
-
-#             # 輸出命名：在原本檔名加上 "_1"
-#             base, ext = os.path.splitext(fname)
-#             final_output = os.path.join(folder, base + "_1.txt")
-
-#             print(f"🚀 處理檔案: {input_txt}")
-#             final_path = process_keypoints_txt(
-#                 input_txt=input_txt,
-#                 final_output=final_output,
-#                 save_final_output=True
-#             )
-#             print(f"✅ 輸出完成: {final_path}")
-
-# if __name__ == "__main__":
-#     main()
+# 整個資料夾批次平滑 (多程序、略過已是最新的輸出) 請改用:
+# python -m BD.batch_smooth <folder> --workers 8
@@ -0,0 +1,81 @@
+# BD/video_info.py
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import cv2
+
+"""
+影片基本資訊 (fps / 寬 / 高 / 總幀數) 的快取探測。
+
+一次上傳只需開檔一次：run_full_analysis 開頭呼叫 probe_video，
+再把回傳的 VideoInfo 明確傳給各階段，不必為了讀 FPS 或寬度重新開啟影片
+(4K 影片每次開啟都要解析容器並初始化解碼器)。
+快取以 (絕對路徑, mtime, 檔案大小) 為鍵，同名檔案被覆寫時會重新探測。
+"""
+
+# 最多保留幾支影片的資訊
+VIDEO_INFO_CACHE_SIZE = int(os.getenv("VIDEO_INFO_CACHE_SIZE", "64"))
+
+
+class VideoInfo(NamedTuple):
+    path: str
+    fps: float
+    width: int
+    height: int
+    frame_count: int
+
+    @property
+    def frame_size(self):
+        return (self.width, self.height)
+
+    @property
+    def duration(self):
+        """影片長度 (秒)；fps 無效時為 0。"""
+        return self.frame_count / self.fps if self.fps > 0 else 0.0
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cache_key(video_path):
+    st = os.stat(video_path)
+    return (os.path.abspath(video_path), st.st_mtime_ns, st.st_size)
+
+
+def probe_video(video_path):
+    """回傳影片的 VideoInfo；同一檔案 (路徑、mtime、大小不變) 只實際開檔一次。"""
+    key = _cache_key(video_path)
+    with _lock:
+        info = _cache.get(key)
+        if info is not None:
+            _cache.move_to_end(key)
+            return info
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise IOError(f"Cannot open video file: {video_path}")
+        info = VideoInfo(
+            path=video_path,
+            fps=cap.get(cv2.CAP_PROP_FPS),
+            width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            frame_count=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        )
+    finally:
+        cap.release()
+
+    with _lock:
+        _cache[key] = info
+        _cache.move_to_end(key)
+        while len(_cache) > VIDEO_INFO_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return info
+
+
+def clear_video_info_cache():
+    with _lock:
+        _cache.clear()
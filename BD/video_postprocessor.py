@@ -3,22 +3,15 @@ import os
 import pandas as pd  # 確保導入 pandas 以處理 hip data dataframe
 import logging
 
+from BD.focus_tracking_view import _FocusCropper
+from BD.video_source import VideoSource
 
-def overlay_results_on_video(
-    video_path, analysis_results, output_path, split_times=None, focus_video_path=None
-):
-    """根據分析結果將資訊畫在影片上。
-    analysis_results 必須包含 (用於軌跡):
-    'df_hip_trajectory': DataFrame (包含 frame_id, hip_x, hip_y)
-    'track_segment_start': int (軌跡繪製起始幀)
-    'track_segment_end': int (軌跡繪製結束幀)
-    """
+# 追焦小畫面疊加在主畫面右上角時的邊距 (px)
+PIP_MARGIN = 20
 
-    cap = cv2.VideoCapture(video_path)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
 
+def _open_overlay_writer(output_path, fps, frame_size):
+    """開啟疊加影片的 VideoWriter；H.264 失敗時改用 MJPG/AVI。回傳 (writer, 實際輸出路徑)。"""
     try:
         fourcc = cv2.VideoWriter_fourcc(*"H264")
         if fourcc == 0:
@@ -29,7 +22,7 @@ def overlay_results_on_video(
 
     try:
         # 優先使用傳入的 output_path (假設是 .mp4 或 .mov)
-        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+        out = cv2.VideoWriter(output_path, fourcc, fps, frame_size)
 
         if not out.isOpened():
             raise IOError("Initial VideoWriter failed. Forcing MJPG/AVI.")
@@ -46,99 +39,98 @@ def overlay_results_on_video(
         output_path = os.path.splitext(output_path)[0] + ".avi"
 
         # 3. 重新初始化 VideoWriter
-        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+        out = cv2.VideoWriter(output_path, fourcc, fps, frame_size)
 
         if not out.isOpened():
             print("[嚴重錯誤] MJPG/AVI 最終嘗試仍然失敗。")
             raise IOError("VideoWriter initialization failed. Cannot proceed.")
 
-    focus_cap = None
-    if focus_video_path is not None:
-        focus_cap = cv2.VideoCapture(focus_video_path)
-
-    frame_id = 0
-    active_labels = []
-
-    # --- 軌跡繪製初始化 ---
-    df_hip_data = analysis_results.get("df_hip_trajectory", pd.DataFrame())
-    track_start_frame = analysis_results.get("track_segment_start", 0)
-    track_end_frame = analysis_results.get("track_segment_end", 0)
+    return out, output_path
 
-    # 建立 Hip 座標查詢映射 (frame_id -> (x, y))
-    frame_to_hip = {
-        int(row["frame_id"]): (int(row["hip_x"]), int(row["hip_y"]))
-        for _, row in df_hip_data.iterrows()
-        if "hip_x" in row and "hip_y" in row
-    }
 
-    track_points = []  # 儲存歷史軌跡點
-    line_color = (0, 0, 255)  # 軌跡線顏色 (BGR: 紅色, 遵循原代碼)
-    line_thickness = 3
-    # --- 軌跡繪製初始化結束 ---
+class _TrajectoryOverlay:
+    """逐幀在主畫面上畫臀部軌跡 (及分段標記)；draw(frame, frame_id) 直接修改 frame。"""
 
     # 🎯 設置偏移量
     OFFSET_25M = 100  # 25m 虛線的額外左移偏移
     TEXT_OFFSET_LEFT = 350  # 文字在左側時的偏移量 (確保在線左邊)
     TEXT_OFFSET_RIGHT = 10  # 文字在右側時的偏移量 (確保在線右邊)
 
-    # 如果有傳入分段時間資料，準備標籤資料
-    time_labels_all = []
-    if split_times:
-        passed = split_times.get("passed", {})
-        start_frame = split_times.get("start_frame", 0)
-        line_positions = split_times.get("line_positions", {})
-        BASE_Y_OFFSET = height - 150
-
-        for k in ["15m", "25m", "50m"]:
-            if passed.get(k) is not None:
-                sec = (passed[k] - start_frame) / fps
-
-                # 🎯 恢復方向判斷，並統一將 15m/25m 設為 'right'，50m 設為 'left'
-                direction = "left" if k == "50m" else "right"
-
-                # 獲取 X 座標
-                x_pos = int(line_positions.get(k, 0))
-
-                # 🎯 關鍵修正 1：在初始化時對 25m 施加額外向左偏移 (虛線與文字一起移動)
-                if k == "25m":
-                    x_pos -= OFFSET_25M
-
-                time_labels_all.append(
-                    {
-                        "frame": passed[k],
-                        "label": f"{k}: {sec:.2f} sec",
-                        "x": x_pos,  # 使用調整後的 X 座標
-                        "y": BASE_Y_OFFSET,
-                        "direction": direction,
-                    }
-                )
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
+    def __init__(self, analysis_results, split_times, width, height, fps):
+        self.split_times = split_times
+        self.active_labels = []
+
+        # --- 軌跡繪製初始化 ---
+        df_hip_data = analysis_results.get("df_hip_trajectory", pd.DataFrame())
+        self.track_start_frame = analysis_results.get("track_segment_start", 0)
+        self.track_end_frame = analysis_results.get("track_segment_end", 0)
+
+        # 建立 Hip 座標查詢映射 (frame_id -> (x, y))
+        self.frame_to_hip = {
+            int(row["frame_id"]): (int(row["hip_x"]), int(row["hip_y"]))
+            for _, row in df_hip_data.iterrows()
+            if "hip_x" in row and "hip_y" in row
+        }
+
+        self.track_points = []  # 儲存歷史軌跡點
+        self.line_color = (0, 0, 255)  # 軌跡線顏色 (BGR: 紅色, 遵循原代碼)
+        self.line_thickness = 3
+        # --- 軌跡繪製初始化結束 ---
+
+        # 如果有傳入分段時間資料，準備標籤資料
+        self.time_labels_all = []
+        if split_times:
+            passed = split_times.get("passed", {})
+            start_frame = split_times.get("start_frame", 0)
+            line_positions = split_times.get("line_positions", {})
+            BASE_Y_OFFSET = height - 150
+
+            for k in ["15m", "25m", "50m"]:
+                if passed.get(k) is not None:
+                    sec = (passed[k] - start_frame) / fps
+
+                    # 🎯 恢復方向判斷，並統一將 15m/25m 設為 'right'，50m 設為 'left'
+                    direction = "left" if k == "50m" else "right"
+
+                    # 獲取 X 座標
+                    x_pos = int(line_positions.get(k, 0))
+
+                    # 🎯 關鍵修正 1：在初始化時對 25m 施加額外向左偏移 (虛線與文字一起移動)
+                    if k == "25m":
+                        x_pos -= self.OFFSET_25M
+
+                    self.time_labels_all.append(
+                        {
+                            "frame": passed[k],
+                            "label": f"{k}: {sec:.2f} sec",
+                            "x": x_pos,  # 使用調整後的 X 座標
+                            "y": BASE_Y_OFFSET,
+                            "direction": direction,
+                        }
+                    )
+
+    def draw(self, frame, frame_id):
         # 1. 軌跡點更新與繪製 (整合 draw_trajectory_on_video 的核心邏輯)
-        if frame_id in frame_to_hip:
-            x, y = frame_to_hip[frame_id]
+        if frame_id in self.frame_to_hip:
+            x, y = self.frame_to_hip[frame_id]
 
             # A. 判斷是否在潛泳繪製範圍內，並更新歷史點
-            if track_start_frame <= frame_id <= track_end_frame:
-                track_points.append((x, y))
+            if self.track_start_frame <= frame_id <= self.track_end_frame:
+                self.track_points.append((x, y))
 
             # B. 繪製軌跡線 (使用您指定的 cv2.line 逐點連接邏輯)
-            for i in range(len(track_points) - 1):
+            for i in range(len(self.track_points) - 1):
                 cv2.line(
                     frame,
-                    track_points[i],
-                    track_points[i + 1],
-                    line_color,
-                    line_thickness,
+                    self.track_points[i],
+                    self.track_points[i + 1],
+                    self.line_color,
+                    self.line_thickness,
                 )
 
         # 2. 畫虛線、時間文字、Stroke! 標記 (原有的疊加邏輯)
 
-        if split_times:
+        if self.split_times:
             pass
             # 1. 計算限制的 Y 座標範圍
             # height = frame.shape[0]  # 取得影片幀的實際高度 (例如 1080)
@@ -216,38 +208,122 @@ def overlay_results_on_video(
         #         2,
         #     )
 
-        # 3. 疊加追焦小影片 (自動適應尺寸並置於右上角)
-        # if focus_cap is not None:
-        #     ret_f, focus_frame = focus_cap.read()
-        #     if ret_f:
-        #         # 🎯 自動讀取追焦畫面的高度與寬度
-        #         # (這會是你設定的 height * 0.25 與 height * 0.5)
-        #         fh, fw, _ = focus_frame.shape
-
-        #         # 🎯 計算右上角位置
-        #         # x_offset: 總寬度 - 追焦寬度 - 邊距
-        #         # y_offset: 邊距
-        #         margin = 20
-        #         x_offset = width - fw - margin
-        #         y_offset = margin
-
-        #         # 💡 安全檢查：確保疊加區域不會超出主畫面邊界
-        #         if x_offset >= 0 and y_offset + fh <= height:
-        #             frame[y_offset : y_offset + fh, x_offset : x_offset + fw] = (
-        #                 focus_frame
-        #             )
-        #         else:
-        #             # 如果追焦畫面太大(這在 0.25 比例下通常不會發生)，可以縮小它
-        #             logging.warning(
-        #                 "Focus frame exceeds main video boundaries. Check scale."
-        #             )
+
+def _composite_pip(frame, focus_frame, margin=PIP_MARGIN):
+    """把追焦畫面貼到主畫面右上角 (直接修改 frame)。"""
+    # 🎯 自動讀取追焦畫面的高度與寬度
+    # (這會是你設定的 height * 0.25 與 height * 0.5)
+    fh, fw = focus_frame.shape[:2]
+    height, width = frame.shape[:2]
+
+    # 🎯 計算右上角位置
+    # x_offset: 總寬度 - 追焦寬度 - 邊距
+    # y_offset: 邊距
+    x_offset = width - fw - margin
+    y_offset = margin
+
+    # 💡 安全檢查：確保疊加區域不會超出主畫面邊界
+    if x_offset >= 0 and y_offset + fh <= height:
+        frame[y_offset : y_offset + fh, x_offset : x_offset + fw] = focus_frame
+    else:
+        # 如果追焦畫面太大(這在 0.25 比例下通常不會發生)，可以縮小它
+        logging.warning("Focus frame exceeds main video boundaries. Check scale.")
+
+
+def overlay_results_on_video(
+    video_path, analysis_results, output_path, split_times=None, focus_video_path=None
+):
+    """根據分析結果將資訊畫在影片上。
+    analysis_results 必須包含 (用於軌跡):
+    'df_hip_trajectory': DataFrame (包含 frame_id, hip_x, hip_y)
+    'track_segment_start': int (軌跡繪製起始幀)
+    'track_segment_end': int (軌跡繪製結束幀)
+
+    focus_video_path 保留以相容舊呼叫，已不再開啟；
+    需要同時輸出追焦影片或子母畫面時請用 render_focus_and_overlay (只解碼一次)。
+    """
+
+    source = VideoSource(video_path, threaded=True)
+    width, height, fps = source.width, source.height, source.fps
+
+    out, output_path = _open_overlay_writer(output_path, fps, (width, height))
+    overlay = _TrajectoryOverlay(analysis_results, split_times, width, height, fps)
+
+    frame_id = 0
+    while True:
+        ret, frame = source.read()
+        if not ret:
+            break
+
+        overlay.draw(frame, frame_id)
 
         out.write(frame)
         frame_id += 1
 
-    cap.release()
+    source.release()
     out.release()
-    if focus_cap is not None:
-        focus_cap.release()
 
     print(f"影片後製完成：{output_path}")
+    return output_path
+
+
+def render_focus_and_overlay(
+    video_path,
+    txt_path,
+    analysis_results,
+    output_path,
+    focus_output_path,
+    split_times=None,
+    picture_in_picture=False,
+    padding1=80,
+    padding2=80,
+):
+    """
+    一次解碼同時輸出追焦影片與軌跡疊加影片
+    (結果與 export_focus_only_video + overlay_results_on_video 分別執行相同)。
+
+    追焦畫面在畫軌跡之前從同一個 frame 裁切；
+    picture_in_picture=True 時再把該追焦畫面貼到疊加影片右上角。
+    回傳 (疊加影片實際路徑, 追焦影片路徑)；H.264 不可用時疊加影片會改存 .avi。
+    txt_path 可為關鍵點 txt 路徑或已載入的 KeypointTrack。
+    """
+    source = VideoSource(video_path, threaded=True)
+    width, height, fps = source.width, source.height, source.fps
+
+    cropper = _FocusCropper(txt_path, height, padding1, padding2)
+    focus_out = cv2.VideoWriter(
+        focus_output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, cropper.focus_size
+    )
+    out, output_path = _open_overlay_writer(output_path, fps, (width, height))
+    overlay = _TrajectoryOverlay(analysis_results, split_times, width, height, fps)
+
+    focus_done = False
+    frame_id = 0
+    try:
+        while True:
+            ret, frame = source.read()
+            if not ret:
+                break
+
+            focus_frame = None
+            if not focus_done:
+                focus_frame = cropper.render(frame)
+                if focus_frame is False:
+                    focus_done, focus_frame = True, None
+                elif focus_frame is not None:
+                    focus_out.write(focus_frame)
+
+            overlay.draw(frame, frame_id)
+            if picture_in_picture and focus_frame is not None:
+                _composite_pip(frame, focus_frame)
+
+            out.write(frame)
+            frame_id += 1
+    finally:
+        source.release()
+        focus_out.release()
+        out.release()
+
+    print(f"追焦影片輸出完成: {focus_output_path}, 尺寸: {cropper.focus_size}")
+    print(f"影片後製完成：{output_path}")
+    return output_path, focus_output_path
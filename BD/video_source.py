@@ -0,0 +1,337 @@
+# BD/video_source.py
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+try:
+    import av  # PyAV (選用)：多執行緒軟體解碼
+except ImportError:
+    av = None
+
+"""
+統一的影片讀取來源，取代各模組各自 cv2.VideoCapture + read() 的寫法。
+
+- 預先配置的 frame buffer 環 (ring)：OpenCV 直接解碼進既有陣列，逐幀不再配置新記憶體。
+  回傳的 frame 會在之後第 hold + 1 次讀取時被覆寫；需要長期保留請自行 .copy()，
+  或以 reuse_buffers=False 開啟 (每幀配置新陣列，行為與 cv2 相同)。
+- threaded=True 時以背景執行緒預先解碼 (最多 prefetch 幀)。
+- decoder="pyav" (或環境變數 VIDEO_DECODER=pyav) 使用 PyAV 多執行緒解碼；未安裝時退回 OpenCV。
+- seek(frame_index) 精準定位到指定幀。
+
+用法:
+    with VideoSource(video_path) as source:
+        for frame in source:
+            ...
+"""
+
+DEFAULT_DECODER = os.getenv("VIDEO_DECODER", "opencv")
+
+_STOP = object()
+
+
+class _OpenCVDecoder:
+    def __init__(self, path):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video file: {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self._pending = None  # seek 時為了驗證位置而先解出的幀
+
+    def read_into(self, buf):
+        """解碼下一幀到 buf (buf 為 None 時配置新陣列)；結尾回傳 None。"""
+        if self._pending is not None:
+            frame, self._pending = self._pending, None
+            if buf is None or buf.shape != frame.shape:
+                return frame
+            np.copyto(buf, frame)
+            return buf
+        ret, frame = self.cap.read(buf) if buf is not None else self.cap.read()
+        return frame if ret else None
+
+    def seek(self, index):
+        """
+        定位到第 index 幀 (與從頭逐幀讀取的編號相同)。
+        CAP_PROP_POS_FRAMES 讀回的是剛設定的值，無法判斷 seek 是否精確，
+        因此實際解出目標幀，以其時間戳 (CAP_PROP_POS_MSEC) 與 index / fps 比對；
+        不符 (關鍵幀不精確的編碼、時間戳異常) 時重開影片，從頭逐幀 grab 到目標幀。
+        """
+        self._pending = None
+        if index > 0 and self.fps > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = self.cap.read()
+            if ret:
+                frame_ms = 1000.0 / self.fps
+                if abs(self.cap.get(cv2.CAP_PROP_POS_MSEC) - index * frame_ms) < frame_ms / 2:
+                    self._pending = frame
+                    return
+
+        # 重開後逐幀 grab (不解出影像) 到目標幀
+        self.cap.release()
+        self.cap = cv2.VideoCapture(self.path)
+        for _ in range(index):
+            if not self.cap.grab():
+                break
+
+    def release(self):
+        self.cap.release()
+
+
+class _PyAVDecoder:
+    def __init__(self, path):
+        self.path = path
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        self.fps = float(self.stream.average_rate or 0)
+        self.width = self.stream.codec_context.width
+        self.height = self.stream.codec_context.height
+        self.frame_count = int(self.stream.frames or 0)
+        start = self.stream.start_time
+        self._start_sec = float(start * self.stream.time_base) if start is not None else 0.0
+        self._frames = self._decode_from(0)
+
+    def _decode_from(self, index):
+        """從目前位置解碼，丟棄第 index 幀之前的幀。"""
+        for frame in self.container.decode(self.stream):
+            if self.fps and round((frame.time - self._start_sec) * self.fps) < index:
+                continue
+            yield frame
+
+    def read_into(self, buf):
+        frame = next(self._frames, None)
+        if frame is None:
+            return None
+        image = frame.to_ndarray(format="bgr24")
+        if buf is None or buf.shape != image.shape:
+            return image
+        np.copyto(buf, image)
+        return buf
+
+    def seek(self, index):
+        # 先 seek 到目標之前的關鍵幀，再解碼丟棄到目標幀
+        seconds = self._start_sec + (index / self.fps if self.fps else 0.0)
+        self.container.seek(
+            int(seconds / self.stream.time_base), stream=self.stream, backward=True, any_frame=False
+        )
+        self._frames = self._decode_from(index)
+
+    def release(self):
+        self.container.close()
+
+
+class VideoSource:
+    """
+    參數:
+    - path: 影片路徑
+    - threaded: 是否以背景執行緒預先解碼
+    - prefetch: 背景執行緒最多預先解碼的幀數
+    - hold: 呼叫端同時保留的幀數 (例如批次推論的 batch_size)；
+      回傳的 frame 在之後 hold 次讀取內保證不被覆寫
+    - reuse_buffers: False 時每幀配置新陣列
+    - decoder: "opencv" 或 "pyav"
+    """
+
+    def __init__(
+        self,
+        path,
+        threaded=False,
+        prefetch=4,
+        hold=1,
+        reuse_buffers=True,
+        decoder=None,
+    ):
+        decoder = decoder or DEFAULT_DECODER
+        if decoder == "pyav" and av is not None:
+            self._decoder = _PyAVDecoder(path)
+        else:
+            self._decoder = _OpenCVDecoder(path)
+
+        self.path = path
+        self.fps = self._decoder.fps
+        self.width = self._decoder.width
+        self.height = self._decoder.height
+        self.frame_count = self._decoder.frame_count
+
+        self.threaded = threaded
+        self.prefetch = max(1, int(prefetch))
+        self.hold = max(1, int(hold))
+        self.reuse_buffers = reuse_buffers
+
+        # ring 大小：呼叫端保留的幀 + 預先解碼的幀 + 正在解碼的一幀
+        ring_size = self.hold + (self.prefetch if threaded else 0) + 1
+        self._ring = None
+        if reuse_buffers:
+            self._ring = [
+                np.empty((self.height, self.width, 3), dtype=np.uint8) for _ in range(ring_size)
+            ]
+        self._free = queue.Queue()
+        self._held = []  # 呼叫端目前保留中的 slot (依讀取順序)
+        self._next_frame = 0
+
+        self._ready = None
+        self._thread = None
+        self._stop_event = None
+        self._reset_slots()
+        if threaded:
+            self._start_thread()
+
+    # --- 內部 ---
+
+    def _reset_slots(self):
+        self._free = queue.Queue()
+        self._held = []
+        if self._ring is not None:
+            for i in range(len(self._ring)):
+                self._free.put(i)
+
+    def _acquire_slot(self):
+        """取得可寫入的 slot；背景執行緒被要求停止時回傳 None。"""
+        while True:
+            try:
+                return self._free.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop_event is not None and self._stop_event.is_set():
+                    return None
+
+    def _decode_one(self):
+        """解碼下一幀，回傳 (slot, frame)；結尾 (或被要求停止) 時回傳 None。"""
+        if self._ring is None:
+            frame = self._decoder.read_into(None)
+            return None if frame is None else (None, frame)
+
+        slot = self._acquire_slot()
+        if slot is None:
+            return None
+        frame = self._decoder.read_into(self._ring[slot])
+        if frame is None:
+            self._free.put(slot)
+            return None
+        if frame is not self._ring[slot]:
+            # 解碼器回傳了不同尺寸的陣列 (例如中途換解析度)：改存回 ring
+            self._ring[slot] = frame
+        return slot, frame
+
+    def _start_thread(self):
+        self._ready = queue.Queue(maxsize=self.prefetch)
+        self._stop_event = threading.Event()
+        stop_event, ready = self._stop_event, self._ready
+
+        def _put(item):
+            while not stop_event.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _run():
+            try:
+                while not stop_event.is_set():
+                    item = self._decode_one()
+                    if item is None:
+                        break
+                    if not _put(item):
+                        return
+            except BaseException as e:
+                _put(e)
+            _put(_STOP)
+
+        self._thread = threading.Thread(target=_run, name="video-decoder", daemon=True)
+        self._thread.start()
+
+    def _stop_thread(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    # --- 公開 API ---
+
+    def read(self):
+        """與 cv2.VideoCapture.read() 相同：回傳 (ret, frame)。"""
+        if self._ring is not None and len(self._held) >= self.hold:
+            self._free.put(self._held.pop(0))
+
+        if self.threaded:
+            if self._thread is None:
+                return False, None
+            item = self._ready.get()
+            if item is _STOP:
+                self._thread.join()
+                self._thread = None
+                return False, None
+            if isinstance(item, BaseException):
+                raise item
+        else:
+            item = self._decode_one()
+            if item is None:
+                return False, None
+
+        slot, frame = item
+        if slot is not None:
+            self._held.append(slot)
+        self._next_frame += 1
+        return True, frame
+
+    def __iter__(self):
+        while True:
+            ret, frame = self.read()
+            if not ret:
+                return
+            yield frame
+
+    def frames(self, start=0, end=None):
+        """依序產生 [start, end) 的幀 (end 為 None 時讀到結尾)。"""
+        if start != self._next_frame:
+            self.seek(start)
+        while end is None or self._next_frame < end:
+            ret, frame = self.read()
+            if not ret:
+                return
+            yield frame
+
+    def seek(self, index):
+        """
+        精準定位：下一次 read() 回傳第 index 幀 (0-based)。
+        seek 之前取得的 frame 之後可能被覆寫。
+        """
+        threaded = self._thread is not None
+        self._stop_thread()
+        self._reset_slots()
+        self._decoder.seek(index)
+        self._next_frame = index
+        if threaded or self.threaded:
+            self._start_thread()
+
+    @property
+    def position(self):
+        """下一次 read() 將回傳的幀號。"""
+        return self._next_frame
+
+    def release(self):
+        self._stop_thread()
+        self._decoder.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def read_frame(path, index=0):
+    """讀取單一幀 (預設第一幀)；讀不到時回傳 None。回傳的陣列可自由保留。"""
+    with VideoSource(path, reuse_buffers=False) as source:
+        if index:
+            source.seek(index)
+        ret, frame = source.read()
+    return frame if ret else None
@@ -19,6 +19,16 @@ class AnalysisUploadResponse(BaseModel):
     status_endpoint: str
 
 
+class StageProgress(BaseModel):
+    """目前步驟的逐幀進度 (目前由姿態估計回報)"""
+
+    stage: str  # "pose_estimation"
+    frames_done: int
+    total_frames: int
+    fps: float  # 每秒處理幀數
+    eta_seconds: Optional[float] = None  # 預估剩餘秒數
+
+
 class AnalysisStatusResponse(BaseModel):
     """分析狀態回應"""
 
@@ -28,6 +38,7 @@ class AnalysisStatusResponse(BaseModel):
     progress: Optional[int] = None  # 0-100
     error_message: Optional[str] = None
     current_step: Optional[str] = None # Added for detailed step tracking
+    stage_progress: Optional[StageProgress] = None  # 逐幀進度、處理速度與 ETA
 
 
 # ===== 分析結果 (細項) =====
@@ -0,0 +1,98 @@
+"""
+關鍵點 txt 解析效能比較：逐行 Python 解析 vs. BD.keypoint_io.parse_keypoint_txt。
+
+python bench_keypoint_parse.py [frames] [keypoints_txt]
+未指定 keypoints_txt 時產生一個含 5% no detection 的模擬 _raw.txt (預設 100000 幀)。
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from BD.keypoint_io import NUM_COLUMNS, _parse_keypoint_lines, parse_keypoint_txt
+
+
+def write_fake_raw_txt(path, frames, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(0, 4000, size=(frames, NUM_COLUMNS - 2))
+    missing = rng.random(frames) < 0.05
+    with open(path, "w", encoding="utf-8") as f:
+        for frame_id in range(frames):
+            if missing[frame_id]:
+                f.write(f"{frame_id} no detection\n")
+            else:
+                f.write(f"{frame_id} 0 " + " ".join(f"{v:.6f}" for v in values[frame_id]) + "\n")
+
+
+def previous_process_keypoints_parse(path):
+    """改版前 process_keypoints_txt 的讀檔方式 (逐行 try float + list of lists 建 DataFrame)。"""
+    with open(path, "r") as f:
+        lines = f.readlines()
+    num_columns = None
+    for line in lines:
+        if "no detection" not in line:
+            num_columns = len(line.strip().split())
+            break
+    data = []
+    for line in lines:
+        parts = line.strip().split()
+        if "no" in parts:
+            row = [int(parts[0]), 0] + [np.nan] * (num_columns - 2)
+        else:
+            row = []
+            for v in parts:
+                try:
+                    row.append(float(v))
+                except:
+                    row.append(v)
+        data.append(row)
+    return pd.DataFrame(data).to_numpy(dtype=np.float64)
+
+
+def _best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if len(sys.argv) > 2:
+            path = sys.argv[2]
+        else:
+            path = os.path.join(tmp_dir, "bench_raw.txt")
+            write_fake_raw_txt(path, frames)
+
+        def per_line():
+            with open(path, "r") as f:
+                return _parse_keypoint_lines(f.readlines())
+
+        timings = {
+            "previous process_keypoints_txt": _best_of(
+                lambda: previous_process_keypoints_parse(path), 3
+            ),
+            "per-line (_parse_keypoint_lines)": _best_of(per_line, 3),
+        }
+        t_new, new = _best_of(lambda: parse_keypoint_txt(path), 3)
+
+    identical = True
+    print(f"rows: {len(new)}")
+    for name, (elapsed, rows) in timings.items():
+        same = rows.shape == new.shape and np.array_equal(rows, new, equal_nan=True)
+        identical = identical and same
+        print(f"{name:34s} {elapsed * 1000:8.1f} ms  ({elapsed / t_new:.1f}x)  identical: {same}")
+    print(f"{'parse_keypoint_txt':34s} {t_new * 1000:8.1f} ms")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
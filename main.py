@@ -65,6 +65,25 @@ except ImportError as e:
     logging.error(f"無法導入 BD.orchestrator: {e}")
     run_full_analysis = None
 
+try:
+    from BD.pose_model_registry import warm_up_pose_model, loaded_pose_models
+except ImportError as e:
+    logging.error(f"無法導入 BD.pose_model_registry: {e}")
+    warm_up_pose_model = None
+    loaded_pose_models = None
+
+try:
+    from BD.video_info import probe_video
+except ImportError as e:
+    logging.error(f"無法導入 BD.video_info: {e}")
+    probe_video = None
+
+try:
+    from BD.diving_analyzer_track_angles import diving_phase_cache
+except ImportError as e:
+    logging.error(f"無法導入 BD.diving_analyzer_track_angles: {e}")
+    diving_phase_cache = None
+
 
 # ===== 設置與日誌 =====
 logging.basicConfig(
@@ -110,6 +129,23 @@ os.makedirs("data", exist_ok=True)
 # 掛載 /data 路徑以便前端訪問影片
 app.mount("/data", StaticFiles(directory="data"), name="data")
 
+# ===== 啟動時預先載入姿態模型 =====
+@app.on_event("startup")
+async def warm_up_pose_model_on_startup():
+    """
+    每個 worker process 啟動時載入 POSE_MODEL_PATH 並用假幀暖機一次，
+    之後所有分析工作共用同一個模型實例 (見 BD/pose_model_registry.py)。
+    權重檔不存在或載入失敗時只記錄警告，第一個分析工作會再嘗試載入。
+    """
+    if warm_up_pose_model is None:
+        return
+    try:
+        await asyncio.to_thread(warm_up_pose_model, POSE_MODEL_PATH)
+        logger.info(f"姿態模型已預載並暖機: {POSE_MODEL_PATH}")
+    except Exception as e:
+        logger.warning(f"姿態模型預載失敗 ({POSE_MODEL_PATH}): {e}")
+
+
 # ===== 狀態追蹤 (記憶體式，生產環境應改用 Redis/DB) =====
 analysis_db = {}
 # 結構: {
@@ -359,9 +395,16 @@ async def run_analysis_task(video_id: str, video_path: str) -> None:
         analysis_db[video_id]["progress"] = 5
 
         # 定義狀態回調函式
-        def status_callback(progress_value: int, message: str = ""):
+        def status_callback(progress_value: int, message: str = "", details: dict = None):
             if video_id in analysis_db:
                 analysis_db[video_id]["progress"] = min(int(progress_value), 99)
+                if details is not None:
+                    # 步驟內的逐幀進度 (處理幀數、fps、ETA)，頻繁更新，不寫 log
+                    analysis_db[video_id]["stage_progress"] = details
+                    if message:
+                        analysis_db[video_id]["current_step"] = message
+                    return
+                analysis_db[video_id].pop("stage_progress", None)
                 if message:
                     analysis_db[video_id]["current_step"] = message
                     
@@ -691,18 +734,18 @@ async def run_analysis_task(video_id: str, video_path: str) -> None:
             kaa = diving_analysis.get("kick_angle_analysis", {})
 
             # Retrieve Real FPS for accurate timing
+            # (run_full_analysis 已探測過影片並回傳 fps；否則查 VideoInfo 快取，不再重新開檔)
             real_fps = 30.0
             try:
-                # Attempt to get source video path from DB or results
-                source_video_path = analysis_db.get(video_id, {}).get("file_path")
-                if source_video_path and Path(source_video_path).exists():
-                    import cv2
-                    cap = cv2.VideoCapture(str(source_video_path))
-                    if cap.isOpened():
-                        fps_val = cap.get(cv2.CAP_PROP_FPS)
+                if (results.get("fps") or 0) > 0:
+                    real_fps = results["fps"]
+                else:
+                    # Attempt to get source video path from DB or results
+                    source_video_path = analysis_db.get(video_id, {}).get("file_path")
+                    if source_video_path and Path(source_video_path).exists() and probe_video is not None:
+                        fps_val = probe_video(str(source_video_path)).fps
                         if fps_val > 0:
                             real_fps = fps_val
-                    cap.release()
             except Exception as e:
                 logger.warning(f"Could not determine FPS from video, defaulting to 30.0: {e}")
 
@@ -811,6 +854,7 @@ async def run_analysis_task(video_id: str, video_path: str) -> None:
         analysis_db[video_id]["result"] = full_result
         analysis_db[video_id]["status"] = "completed"
         analysis_db[video_id]["progress"] = 100
+        analysis_db[video_id].pop("stage_progress", None)
         analysis_db[video_id]["completed_at"] = datetime.now().isoformat()
 
         logger.info(
@@ -823,6 +867,7 @@ async def run_analysis_task(video_id: str, video_path: str) -> None:
         analysis_db[video_id]["status"] = "failed"
         analysis_db[video_id]["error_message"] = str(e)
         analysis_db[video_id]["progress"] = 0
+        analysis_db[video_id].pop("stage_progress", None)
 
 
 # ===== API Endpoints =====
@@ -965,6 +1010,7 @@ async def get_analysis_status(video_id: str) -> AnalysisStatusResponse:
       - 回傳進度百分比 (0-100)
       - 回傳分析狀態 (processing / completed / failed)
       - 分析失敗時回傳錯誤訊息
+      - 姿態估計期間回傳 stage_progress：已處理幀數、總幀數、每秒幀數與 ETA
 
     HTTP 方法：GET
     端點：/analysis/{video_id}/status
@@ -977,8 +1023,16 @@ async def get_analysis_status(video_id: str) -> AnalysisStatusResponse:
         "video_id": "abc-123-def-456",
         "filename": "pool_video.mp4",
         "status": "processing",
-        "progress": 45,
-        "error_message": null
+        "progress": 18,
+        "error_message": null,
+        "current_step": "Capturing body pose... 1200/3000 frames",
+        "stage_progress": {
+          "stage": "pose_estimation",
+          "frames_done": 1200,
+          "total_frames": 3000,
+          "fps": 14.2,
+          "eta_seconds": 126.8
+        }
       }
 
     狀態值：
@@ -1010,6 +1064,7 @@ async def get_analysis_status(video_id: str) -> AnalysisStatusResponse:
         progress=info.get("progress"),
         error_message=info.get("error_message"),
         current_step=info.get("current_step"),
+        stage_progress=info.get("stage_progress"),
     )
 
 
@@ -1286,13 +1341,18 @@ async def health_check():
       {
         "status": "healthy",
         "timestamp": "2026-01-15T10:30:00",
-        "orchestrator_available": true
+        "orchestrator_available": true,
+        "pose_models_loaded": ["data/models/best_1.pt"],
+        "diving_phase_cache": {"hits": 3, "misses": 5, "hit_rate": 0.375, "evictions": 0,
+                               "entries": 5, "size_bytes": 1650000, "max_bytes": 536870912}
       }
 
     各欄位說明：
       - status: API 狀態 ("healthy" 或 "unhealthy")
       - timestamp: 檢查時間 (ISO 8601)
       - orchestrator_available: 後端分析模組是否可用 (true/false)
+      - pose_models_loaded: 本 worker 已預載的姿態模型權重
+      - diving_phase_cache: 入水分析磁碟快取的統計 (命中/未命中為本 worker 啟動後的次數)
 
     使用場景：
       - Kubernetes liveness probe
@@ -1319,6 +1379,8 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "orchestrator_available": run_full_analysis is not None,
+        "pose_models_loaded": loaded_pose_models() if loaded_pose_models else [],
+        "diving_phase_cache": diving_phase_cache.stats() if diving_phase_cache else None,
     }
 
 
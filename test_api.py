@@ -7,4 +7,29 @@ def test_read_root():
     response = client.get("/")
     assert response.status_code == 200
     # assert response.json() == {"message": "Hello, FastAPI!"}
-    print(response.json())
\ No newline at end of file
+    print(response.json())
+
+def test_analysis_status_reports_stage_progress():
+    from main import analysis_db
+
+    analysis_db["progress-test"] = {
+        "filename": "pool_video.mp4",
+        "status": "processing",
+        "progress": 18,
+        "current_step": "Capturing body pose... 1200/3000 frames",
+        "stage_progress": {
+            "stage": "pose_estimation",
+            "frames_done": 1200,
+            "total_frames": 3000,
+            "fps": 14.2,
+            "eta_seconds": 126.8,
+        },
+    }
+    try:
+        response = client.get("/analysis/progress-test/status")
+        assert response.status_code == 200
+        stage = response.json()["stage_progress"]
+        assert stage["frames_done"] == 1200
+        assert stage["eta_seconds"] == 126.8
+    finally:
+        del analysis_db["progress-test"]
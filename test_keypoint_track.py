@@ -0,0 +1,339 @@
+import json
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import warnings
+
+import numpy as np
+import pytest
+
+from BD.batch_smooth import batch_smooth, find_keypoint_files
+from BD.focus_tracking_view import get_max_bbox_size
+from BD.keypoint_io import (
+    CONF_COLUMNS,
+    KEYPOINT_ARCHIVE_COMPACT_CONF_DECIMALS,
+    KEYPOINT_ARCHIVE_COMPACT_DECIMALS,
+    _parse_keypoint_lines,
+    keypoint_archive_to_txt,
+    keypoint_store_meta_path,
+    load_keypoint_archive,
+    parse_keypoint_txt,
+    read_keypoint_archive_schema,
+    round_keypoint_txt_values,
+    save_keypoint_archive,
+    save_keypoint_store,
+    txt_to_keypoint_archive,
+    write_keypoint_txt,
+)
+from BD.keypoint_track import FrameIndex, KeypointTrack, joint_column, load_keypoint_track
+from BD.txt_base import process_keypoints_txt, smooth_keypoints
+
+
+def _write_txt(path):
+    lines = []
+    for frame_id in range(6):
+        if frame_id == 2:
+            lines.append(f"{frame_id} no detection")
+            continue
+        values = [0, 100.0 + frame_id, 50.0, 40.0, 20.0, 0.9]
+        values += [frame_id * 10.0 + k for k in range(21)]
+        lines.append(f"{frame_id} " + " ".join(f"{v:.6f}" for v in values))
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_keypoint_track_parses_txt(tmp_path):
+    path = tmp_path / "k.txt"
+    _write_txt(path)
+    track = KeypointTrack.from_txt(str(path))
+
+    assert len(track) == 6
+    assert track.frame_ids.tolist() == list(range(6))
+    assert track.x_center[1] == 101.0
+    assert joint_column("hip", "y") == 20
+    assert track.y("hip")[3] == 30.0 + 13
+    # no detection 的幀為 NaN
+    assert np.isnan(track.x("hip")[2])
+    assert load_keypoint_track(track) is track
+
+
+def test_keypoint_track_skips_short_rows(tmp_path):
+    full = " ".join(f"{v:.6f}" for v in np.linspace(11.5, 3999.25, 26))
+    path = tmp_path / "k.txt"
+    path.write_text("\n".join([
+        f"0 0 {full}",
+        "1 0 15.5 20.25",  # 欄位不足 (寫到一半的列)
+        "2 no detection",
+        f"3 0 nan {full[:-10]}",  # 28 個值，其中一個為 nan
+        f"4 0 {full} 1.0",
+        f"5 0 {' '.join(full.split()[:-1])}",  # 少一欄
+    ]) + "\n")
+
+    # 預設與逐行解析相同：欄位不足補 NaN
+    assert len(parse_keypoint_txt(str(path))) == 6
+    rows = parse_keypoint_txt(str(path), expected_cols=28)
+    np.testing.assert_array_equal(rows, _parse_keypoint_lines(path.read_text().splitlines(), expected_cols=28))
+
+    track = KeypointTrack.from_txt(str(path))
+    assert track.frame_ids.tolist() == [0, 2, 3, 4]
+    assert np.isnan(track.rows[1, 2:]).all()  # no detection 保留為 NaN
+    assert np.isnan(track.x_center[2]) and track.y_center[2] == 11.5
+    assert not np.isnan(track.rows[[0, 3]]).any()
+
+
+def test_keypoint_track_between_and_records(tmp_path):
+    path = tmp_path / "k.txt"
+    _write_txt(path)
+    track = KeypointTrack.from_txt(str(path))
+
+    part = track.between(3, 4)
+    assert part.frame_ids.tolist() == [3, 4]
+    assert part.records([19, 20]) == [(3, 42.0, 43.0), (4, 52.0, 53.0)]
+    df = part.to_frame({"hip_x": 19})
+    assert list(df.columns) == ["frame_id", "hip_x"]
+
+
+def test_frame_slices_match_mask_filter():
+    rng = np.random.default_rng(0)
+    frame_ids = np.sort(rng.choice(np.arange(10, 400), size=150, replace=False))
+    rows = np.zeros((len(frame_ids), 28))
+    rows[:, 0] = frame_ids
+    rows[:, 19] = rng.normal(size=len(frame_ids))
+    track = KeypointTrack(rows)
+
+    for start, end in [(0, 5), (10, 10), (37, 211), (200, 150), (390, 1000), (-5, 1000)]:
+        expected = frame_ids[(frame_ids >= start) & (frame_ids <= end)]
+        part = track.between(start, end)
+        assert part.frame_ids.tolist() == expected.tolist()
+        assert track[start:end + 1].frame_ids.tolist() == expected.tolist()
+
+    # NaN 邊界與逐列比對相同：沒有任何列
+    assert track.between(float("nan"), 200).frame_ids.tolist() == []
+
+    # 切片為 view，不複製資料
+    assert np.shares_memory(track[50:120].rows, track.rows)
+
+    # 未排序的 frame_id 仍回傳正確結果
+    shuffled = FrameIndex(frame_ids[::-1])
+    positions = shuffled.rows(37, 211)
+    assert sorted(frame_ids[::-1][positions].tolist()) == [
+        f for f in frame_ids.tolist() if 37 <= f <= 211
+    ]
+
+
+def test_keypoint_store_roundtrip_and_pickle(tmp_path):
+    txt_path = tmp_path / "k.txt"
+    _write_txt(txt_path)
+    track = KeypointTrack.from_txt(str(txt_path))
+
+    store_path = str(tmp_path / "k.npy")
+    track.save_store(store_path)
+    stored = load_keypoint_track(store_path)
+    np.testing.assert_array_equal(stored.rows, track.rows)
+    assert stored.frame_ids.tolist() == track.frame_ids.tolist()
+
+    # 預設唯讀
+    with pytest.raises(ValueError):
+        stored.rows[0, 2] = 1.0
+
+    # 存檔來源的切片 pickle 後重新映射同一份檔案
+    part = pickle.loads(pickle.dumps(stored[3:6]))
+    assert isinstance(part.rows, np.memmap)
+    np.testing.assert_array_equal(part.rows, track.between(3, 5).rows)
+
+
+def test_keypoint_store_rejects_other_versions(tmp_path):
+    store_path = str(tmp_path / "k.npy")
+    save_keypoint_store(store_path, np.zeros((4, 28)))
+    meta_path = keypoint_store_meta_path(store_path)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta["schema_version"] += 1
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+
+    with pytest.raises(ValueError):
+        KeypointTrack.from_store(store_path)
+
+
+def test_parse_keypoint_txt_matches_per_line_parse(tmp_path):
+    full = " ".join(f"{v:.6f}" for v in np.linspace(11.5, 3999.25, 26))
+    lines = [
+        f"0 0 {full}",
+        "1 no detection",
+        "",
+        "2 0 15.5 20.25",  # 欄位不足
+        f"3 0 {full} 1.0 2.0",  # 欄位過多
+        f"4 0 nan {full[:-9]}",
+        f"5 0 {full}",
+    ]
+    for extra in ([], ["6 0 0.1000000000000000055511151231257827"], ["7 0 1e-3 abc"]):
+        path = tmp_path / "k.txt"
+        text = "\n".join(lines + extra) + "\n"
+        path.write_text(text)
+        expected = _parse_keypoint_lines(text.splitlines())
+        rows = parse_keypoint_txt(str(path))
+        assert rows.shape == expected.shape
+        np.testing.assert_array_equal(rows, expected)
+
+
+def test_write_keypoint_txt_matches_row_formatting(tmp_path):
+    rows = np.random.default_rng(1).uniform(-5, 4000, size=(50, 28))
+    rows[:, 0] = np.arange(50)
+    rows[:, 1] = 0
+    rows[3, 2:] = np.nan
+    expected = "".join(
+        " ".join(str(int(v)) if i in (0, 1) else f"{v:.6f}" for i, v in enumerate(row)) + "\n"
+        for row in rows.tolist()
+    )
+
+    path = tmp_path / "out.txt"
+    write_keypoint_txt(str(path), rows)
+    assert path.read_text() == expected
+    assert not (tmp_path / "out.txt.tmp").exists()
+
+
+def test_smooth_keypoints_matches_written_txt(tmp_path):
+    rng = np.random.default_rng(2)
+    lines = []
+    for frame_id in range(120):
+        if frame_id % 17 == 5:
+            lines.append(f"{frame_id} no detection")
+            continue
+        values = [0] + (300 + rng.normal(scale=30, size=26)).tolist()
+        lines.append(f"{frame_id} " + " ".join(f"{v:.6f}" for v in values))
+    raw_path = tmp_path / "k_raw.txt"
+    raw_path.write_text("\n".join(lines) + "\n")
+
+    out_path = str(tmp_path / "k.txt")
+    smoothed = smooth_keypoints(str(raw_path), final_output=out_path)
+    np.testing.assert_array_equal(smoothed, parse_keypoint_txt(out_path))
+
+    final_path = process_keypoints_txt(str(raw_path), final_output=str(tmp_path / "k2.txt"))
+    assert (tmp_path / "k2.txt").read_text() == (tmp_path / "k.txt").read_text()
+    assert final_path == str(tmp_path / "k2.txt")
+
+def test_round_keypoint_txt_values_matches_txt_roundtrip(tmp_path):
+    rng = np.random.default_rng(3)
+    rows = rng.uniform(-5, 4000, size=(200, 28))
+    rows[:, 0] = np.arange(200)
+    rows[:, 1] = 0
+    rows[:50, 27] = (rng.integers(0, 10**6, 50) + 0.5) / 1e6  # 接近 .5 的進位點
+    rows = np.asfortranarray(rows)
+
+    path = str(tmp_path / "k.txt")
+    write_keypoint_txt(path, rows)
+    np.testing.assert_array_equal(round_keypoint_txt_values(rows), parse_keypoint_txt(path))
+
+
+def test_batch_smooth_skips_up_to_date_outputs(tmp_path):
+    for name in ("a.txt", "b.txt"):
+        _write_txt(tmp_path / name)
+    files = find_keypoint_files(str(tmp_path))
+    assert [os.path.basename(p) for p in files] == ["a.txt", "b.txt"]
+
+    stats = batch_smooth(files, workers=2)
+    assert (stats["processed"], stats["skipped"], stats["failed"]) == (2, 0, [])
+    expected = smooth_keypoints(str(tmp_path / "a.txt"))
+    np.testing.assert_array_equal(parse_keypoint_txt(str(tmp_path / "a_1.txt")), expected)
+
+    # 輸出已是最新：不重做；輸出檔本身不會被當成輸入
+    assert find_keypoint_files(str(tmp_path)) == files
+    stats = batch_smooth(files, workers=2)
+    assert (stats["processed"], stats["skipped"]) == (0, 2)
+
+
+def test_keypoint_archive_roundtrip(tmp_path, caplog):
+    txt_path = tmp_path / "k.txt"
+    _write_txt(txt_path)
+    rows = parse_keypoint_txt(str(txt_path))
+
+    # 預設 (6 位小數) 無損：數值完全相同，轉回的 txt 保留 no detection 列
+    archive_path = txt_to_keypoint_archive(str(txt_path), str(tmp_path / "exact.kpz"))
+    np.testing.assert_array_equal(load_keypoint_archive(archive_path), rows)
+    out_path = keypoint_archive_to_txt(archive_path, str(tmp_path / "back.txt"))
+    np.testing.assert_array_equal(parse_keypoint_txt(out_path), rows)
+    assert open(out_path).read().splitlines()[2] == "2 no detection"
+
+    noisy = rows.copy()
+    noisy[:, 2:] += np.random.default_rng(5).uniform(0, 1, size=noisy[:, 2:].shape)
+    noisy = round_keypoint_txt_values(noisy)  # 與平滑後 txt / KeypointTrack 相同的 6 位小數值
+    track = KeypointTrack(noisy)
+    stored = load_keypoint_track(track.save_archive(str(tmp_path / "k.kpz")))
+    assert stored.frame_ids.tolist() == track.frame_ids.tolist()
+    np.testing.assert_array_equal(stored.rows, noisy)
+
+    # 明確指定較少位數 (有損)：座標誤差 <= 0.005 px、信心度 <= 0.0005，NaN 位置不變，讀取時警告
+    lossy_path = track.save_archive(str(tmp_path / "lossy.kpz"), decimals=2, conf_decimals=3)
+    with caplog.at_level(logging.WARNING):
+        stored = load_keypoint_track(lossy_path)
+    assert "reduced precision" in caplog.text
+    error = np.abs(stored.rows - noisy)
+    np.testing.assert_array_equal(np.isnan(error), np.isnan(noisy))
+    assert np.nanmax(error[:, [7, 8, 19, 20]]) <= 0.005 + 1e-9
+    assert np.nanmax(error[:, [6, 9, 27]]) <= 0.0005 + 1e-9
+
+
+def test_pack_compact_is_explicit_and_bounded(tmp_path):
+    rng = np.random.default_rng(7)
+    n = 2000
+    rows = np.empty((n, 28))
+    rows[:, 0] = np.arange(n)
+    rows[:, 1] = 0
+    rows[:, 2:] = 300 + np.cumsum(rng.normal(scale=3, size=(n, 26)), axis=0)
+    rows[:, list(CONF_COLUMNS)] = rng.uniform(0.3, 1, size=(n, len(CONF_COLUMNS)))
+    rows[rng.random(n) < 0.05, 2:] = np.nan
+    rows = round_keypoint_txt_values(rows)
+    for name in ("exact", "compact"):
+        os.makedirs(tmp_path / name)
+        write_keypoint_txt(str(tmp_path / name / "k.txt"), rows, no_detection=True)
+
+    def pack(*args):
+        subprocess.run(
+            [sys.executable, "-m", "BD.keypoint_io", "pack", *args],
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True, capture_output=True,
+        )
+
+    pack(str(tmp_path / "exact"))
+    pack("--compact", str(tmp_path / "compact"))
+    exact = str(tmp_path / "exact" / "k.kpz")
+    compact = str(tmp_path / "compact" / "k.kpz")
+
+    # 預設無損；--compact 才捨入，誤差不超過最後一位的一半，檔案約為無損的一半
+    np.testing.assert_array_equal(load_keypoint_archive(exact), rows)
+    assert read_keypoint_archive_schema(compact)["decimals"]["kp5_x"] == KEYPOINT_ARCHIVE_COMPACT_DECIMALS
+    error = np.abs(load_keypoint_archive(compact) - rows)
+    np.testing.assert_array_equal(np.isnan(error), np.isnan(rows))
+    conf = list(CONF_COLUMNS)
+    coords = [c for c in range(2, 28) if c not in CONF_COLUMNS]
+    assert np.nanmax(error[:, coords]) <= 0.5 * 10.0 ** -KEYPOINT_ARCHIVE_COMPACT_DECIMALS + 1e-9
+    assert np.nanmax(error[:, conf]) <= 0.5 * 10.0 ** -KEYPOINT_ARCHIVE_COMPACT_CONF_DECIMALS + 1e-9
+    assert os.path.getsize(compact) < 0.7 * os.path.getsize(exact)
+
+
+def test_keypoint_archive_rejects_other_versions(tmp_path):
+    path = str(tmp_path / "k.kpz")
+    save_keypoint_archive(path, np.zeros((4, 28)))
+    with np.load(path) as data:
+        content = {key: data[key] for key in data.files}
+    schema = json.loads(str(content["schema"]))
+    schema["schema_version"] += 1
+    content["schema"] = np.array(json.dumps(schema))
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **content)
+
+    with pytest.raises(ValueError):
+        load_keypoint_archive(path)
+
+
+def test_get_max_bbox_size_skips_missing_boxes():
+    rows = np.full((4, 28), np.nan)
+    rows[:, 0] = np.arange(4)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        # 整段都沒有 BBOX：只回傳 padding
+        assert get_max_bbox_size(KeypointTrack(rows)) == (80, 80)
+        rows[1, 4:6] = (120.5, 60.0)
+        rows[2, 4:6] = (100.0, 70.25)
+        assert get_max_bbox_size(KeypointTrack(rows), 10, 20) == (130, 90)
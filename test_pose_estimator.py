@@ -0,0 +1,412 @@
+import os
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from BD import pose_backends, pose_estimator, pose_model_registry, pose_resolution_report
+from BD.keypoint_io import npz_to_txt, save_keypoint_npz
+from BD.pose_backends import backend_model_path, benchmark_backends, resolve_backend_path
+from BD.pose_estimator import (
+    _PoseWriter,
+    _StrideSegment,
+    _format_txt_row,
+    _load_checkpoint,
+    _needs_dense,
+    _reset_checkpoint,
+    _results_to_numpy,
+    run_pose_estimation,
+)
+from BD.video_info import clear_video_info_cache
+
+NUM_KPTS = 7
+
+
+class _Boxes(SimpleNamespace):
+    def __len__(self):
+        return len(self.conf)
+
+
+def _fake_result(boxes=None, keypoints="auto"):
+    """
+    模仿 Ultralytics Results：boxes 為 [(cls, x, y, w, h, conf), ...]，
+    keypoints 預設依 BBOX 產生 (N, 7, 2)，也可指定 None 或空 tensor。
+    """
+    if boxes is None:
+        return SimpleNamespace(boxes=None, keypoints=None)
+    data = torch.tensor(boxes, dtype=torch.float32).reshape(-1, 6)
+    result_boxes = _Boxes(cls=data[:, 0], xywh=data[:, 1:5], conf=data[:, 5])
+    if isinstance(keypoints, str):
+        xy = data[:, 1:3, None].repeat(1, 1, NUM_KPTS).transpose(1, 2) + torch.arange(NUM_KPTS)[:, None]
+        keypoints = SimpleNamespace(xy=xy, conf=torch.full((len(data), NUM_KPTS), 0.5))
+    elif keypoints is not None:
+        keypoints = SimpleNamespace(xy=keypoints, conf=None)
+    return SimpleNamespace(boxes=result_boxes, keypoints=keypoints)
+
+
+def test_results_to_numpy_mixed_batch():
+    results = [
+        _fake_result([(0, 10, 20, 4, 6, 0.9)]),
+        _fake_result(),  # 沒有 BBOX
+        _fake_result([(0, 1, 2, 3, 4, 0.3), (0, 30, 40, 5, 5, 0.8)]),
+        _fake_result([(0, 10, 20, 4, 6, 0.9)], keypoints=None),
+        _fake_result([(0, 10, 20, 4, 6, 0.9)], keypoints=torch.zeros((0, NUM_KPTS, 2))),
+        _fake_result([(0, 10, 20, 4, 6, 0.9)], keypoints=torch.zeros((1, 0, 2))),
+    ]
+    detected, rows = _results_to_numpy(results)
+
+    assert detected.tolist() == [True, False, True, True, True, True]
+    assert rows.shape == (6, 6 + 3 * NUM_KPTS)
+    assert np.isnan(rows[1]).all()
+    # 多個 BBOX 時取信心度最高者
+    assert rows[2, :6].tolist() == [0, 30, 40, 5, 5, np.float32(0.8)]
+    assert rows[2, 6:9].tolist() == [30, 40, 0.5]
+    # 沒有關鍵點：保留 BBOX，關鍵點為 NaN
+    assert np.array_equal(rows[3:, :6], rows[[0, 0, 0], :6])
+    assert np.isnan(rows[3:, 6:]).all()
+
+    # 與逐張轉換的結果相同
+    for i, result in enumerate(results):
+        det, row = _results_to_numpy([result])
+        assert det[0] == detected[i]
+        if det[0]:
+            assert np.array_equal(row[0], rows[i], equal_nan=True)
+
+    detected, rows = _results_to_numpy([_fake_result(), _fake_result([(0, 1, 1, 1, 1, 0.9)], None)])
+    assert detected.tolist() == [False, True] and rows.shape == (2, 6 + 3 * NUM_KPTS)
+    detected, rows = _results_to_numpy([_fake_result(), _fake_result()])
+    assert not detected.any() and rows.shape == (2, 0)
+
+
+def test_format_txt_row_without_keypoints():
+    # 有 BBOX 但沒有關鍵點的幀與逐幀版相同，只寫 BBOX
+    _, rows = _results_to_numpy([
+        _fake_result([(1, 10, 20, 4, 6, 0.9)], keypoints=None),
+        _fake_result([(0, 10, 20, 4, 6, 0.5)]),
+    ])
+    assert _format_txt_row(3, rows[0]) == "3 1 10.000000 20.000000 4.000000 6.000000 0.900000\n"
+    line = _format_txt_row(4, rows[1]).split()
+    assert len(line) == 7 + 3 * NUM_KPTS and line[7:10] == ["10.000000", "20.000000", "0.500000"]
+
+
+def test_npz_to_txt_matches_raw_txt(tmp_path):
+    results = [
+        _fake_result([(0, 10.123456789, 20, 4, 6, 0.9)]),
+        _fake_result(),
+        _fake_result([(1, 10, 20, 4, 6, 0.9)], keypoints=None),
+        _fake_result([(0, 1, 2, 3, 4, 0.3), (0, 30.5, 40.25, 5, 5, 0.8)]),
+    ]
+    detected, rows = _results_to_numpy(results)
+    txt_path = tmp_path / "clip_raw.txt"
+    writer = _PoseWriter(open(txt_path, "w"), len(results), collect=True)
+    for frame_id, (det, row) in enumerate(zip(detected, rows)):
+        writer.write(frame_id, det, row)
+    writer.close()
+    npz_path = save_keypoint_npz(str(tmp_path / "clip_raw.npz"), *writer.track_arrays())
+
+    npz_to_txt(npz_path, str(tmp_path / "from_npz.txt"))
+    assert (tmp_path / "from_npz.txt").read_bytes() == txt_path.read_bytes()
+
+
+def test_resolve_backend_path(tmp_path, monkeypatch):
+    model_path = str(tmp_path / "best_1.pt")
+    assert backend_model_path(model_path, "onnx") == str(tmp_path / "best_1.onnx")
+    assert backend_model_path(model_path, "openvino") == str(tmp_path / "best_1_openvino_model")
+    # torch 不檢查檔案 (例如尚未下載的 Ultralytics 內建名稱)
+    assert resolve_backend_path(model_path, "torch") == model_path
+    with pytest.raises(ValueError, match="Unknown pose backend"):
+        backend_model_path(model_path, "tensorrt")
+
+    for backend in ("onnx", "openvino"):
+        with pytest.raises(FileNotFoundError, match=f"export .*best_1.pt --backends {backend}"):
+            resolve_backend_path(model_path, backend)
+
+    (tmp_path / "best_1.onnx").write_bytes(b"")
+    os.mkdir(tmp_path / "best_1_openvino_model")
+    assert resolve_backend_path(model_path, "onnx") == str(tmp_path / "best_1.onnx")
+    assert resolve_backend_path(model_path, "openvino") == str(tmp_path / "best_1_openvino_model")
+
+    # 未指定時使用 POSE_BACKEND
+    monkeypatch.setattr(pose_backends, "DEFAULT_POSE_BACKEND", "onnx")
+    assert resolve_backend_path(model_path) == str(tmp_path / "best_1.onnx")
+
+
+def test_benchmark_backends_compares_to_torch(monkeypatch):
+    frames = [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(5)]
+
+    def fake_model(offset):
+        def model(source, **kwargs):
+            batch = source if isinstance(source, list) else [source]
+            values = [int(f[0, 0, 0]) for f in batch]
+            # 第 3 幀沒有偵測到
+            return [_fake_result([(0, 10 + v + offset, 20, 4, 6, 0.9)] if v != 3 else None) for v in values]
+        return model
+
+    offsets = {"torch": 0.0, "onnx": 0.25}
+    monkeypatch.setattr(pose_resolution_report, "_read_frames", lambda path, max_frames: frames)
+    monkeypatch.setattr(
+        pose_model_registry,
+        "warm_up_pose_model",
+        lambda model_path, frame_size, backend: fake_model(offsets[backend]),
+    )
+
+    results = benchmark_backends("best_1.pt", "v.mp4", backends=("torch", "onnx"), batch_size=2)
+    torch_poses, _ = results["torch"]
+    onnx_poses, fps = results["onnx"]
+    assert [det for det, _ in onnx_poses] == [True, True, True, False, True]
+    assert fps > 0
+    diffs = [abs(row[6] - ref[6]) for (det, row), (_, ref) in zip(onnx_poses, torch_poses) if det]
+    assert diffs == [0.25] * 4
+
+
+def test_checkpoint_appends_segments(tmp_path):
+    ckpt_dir = str(tmp_path / "v_raw.ckpt")
+    meta = {"video": {"size": 1}, "imgsz": (640, 640)}
+    _reset_checkpoint(ckpt_dir, meta)
+
+    writer = _PoseWriter(None, 8, checkpoint_dir=ckpt_dir, checkpoint_every=3)
+    rows = [np.full(6 + 3 * NUM_KPTS, i, dtype=np.float32) for i in range(8)]
+    for frame_id, row in enumerate(rows):
+        writer.write(frame_id, frame_id != 4, row)
+
+    # 每個分段只含新增的幀
+    assert sorted(os.listdir(ckpt_dir)) == ["meta.json", "part000000000.npz", "part000000003.npz"]
+    with np.load(os.path.join(ckpt_dir, "part000000003.npz")) as part:
+        assert part["detected"].tolist() == [True, False, True]
+        assert part["rows"][:, 0].tolist()[::2] == [3, 5]
+
+    detected, loaded = _load_checkpoint(ckpt_dir, meta)
+    assert detected == [True, True, True, True, False, True]
+    assert loaded[4] is None and loaded[5][0] == 5
+    assert _load_checkpoint(ckpt_dir, dict(meta, imgsz=None)) is None
+
+    # 損毀的分段：只採用之前連續完整的部分，之後的分段刪除
+    with open(os.path.join(ckpt_dir, "part000000003.npz"), "wb") as f:
+        f.write(b"broken")
+    detected, _ = _load_checkpoint(ckpt_dir, meta)
+    assert len(detected) == 3
+    assert sorted(os.listdir(ckpt_dir)) == ["meta.json", "part000000000.npz"]
+
+    # 續跑：replay 後從第 3 幀開始附加新分段
+    writer = _PoseWriter(None, 8, checkpoint_dir=ckpt_dir, checkpoint_every=3)
+    writer.replay(*_load_checkpoint(ckpt_dir, meta))
+    for frame_id in range(3, 6):
+        writer.write(frame_id, True, rows[frame_id])
+    assert len(_load_checkpoint(ckpt_dir, meta)[0]) == 6
+
+
+# --- run_pose_estimation 端到端：假模型 + 無損合成影片 ---
+
+CLIP_FRAMES = 30
+CLIP_SIZE = (160, 96)
+BLANK_FRAME = 12  # 沒有泳者的幀 (frame_stride=4 時正好是錨點)
+
+
+def _write_swimmer_clip(path):
+    """
+    FFV1 無損編碼：背景亮度 = 幀號 * 3 (用來辨識幀)，16x16 白色方塊每幀右移 2 像素。
+    方塊座標與尺寸皆為偶數，縮小 0.5 倍後位置剛好減半。
+    """
+    width, height = CLIP_SIZE
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"FFV1"), 10, CLIP_SIZE)
+    for i in range(CLIP_FRAMES):
+        frame = np.full((height, width, 3), i * 3, dtype=np.uint8)
+        if i != BLANK_FRAME:
+            x0 = 40 + 2 * i
+            frame[40:56, x0 : x0 + 16] = 255
+        out.write(frame)
+    out.release()
+
+
+class _BlobPoseModel:
+    """
+    假的姿態模型：以白色方塊的外框當 BBOX，7 個關鍵點在方塊中線上等距排列。
+    偵測結果對平移與 0.5 倍縮放完全等變，因此裁切 / 縮小推論換算回原座標後應與整張推論相同。
+    fail_at 指定幀號時，推論到該幀就拋出例外 (模擬 worker 中途當機)。
+    """
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.frames_seen = []
+        self.input_shapes = []
+        self.kwargs = []
+
+    def _detect(self, frame):
+        ys, xs = np.nonzero(frame[:, :, 0] > 127)
+        if len(xs) == 0:
+            return _fake_result()
+        x0, x1, y0, y1 = xs.min(), xs.max() + 1, ys.min(), ys.max() + 1
+        w, h = x1 - x0, y1 - y0
+        result = _fake_result([(0, (x0 + x1) / 2, (y0 + y1) / 2, w, h, 0.875)], keypoints=None)
+        xy = torch.tensor([[(x0 + k * w / 8, y0 + h / 2) for k in range(NUM_KPTS)]], dtype=torch.float32)
+        result.keypoints = SimpleNamespace(xy=xy, conf=torch.full((1, NUM_KPTS), 0.75))
+        return result
+
+    def __call__(self, source, **kwargs):
+        batch = source if isinstance(source, list) else [source]
+        self.kwargs.append(kwargs)
+        results = []
+        for frame in batch:
+            # 左上角為背景 (裁切與縮小後亦同)，亮度即幀號 * 3
+            frame_id = int(frame[0, 0, 1]) // 3
+            if frame_id == self.fail_at:
+                raise RuntimeError(f"simulated crash at frame {frame_id}")
+            self.frames_seen.append(frame_id)
+            self.input_shapes.append(frame.shape[:2])
+            results.append(self._detect(frame))
+        return results
+
+
+@pytest.fixture
+def swimmer_clip(tmp_path):
+    path = tmp_path / "clip.avi"
+    _write_swimmer_clip(path)
+    clear_video_info_cache()
+    return str(path)
+
+
+def _run_pose(monkeypatch, video_path, output_dir, model=None, **kwargs):
+    model = model or _BlobPoseModel()
+    monkeypatch.setattr(pose_estimator, "get_pose_model", lambda model_path, backend=None: model)
+    _, txt_path = run_pose_estimation(
+        "fake.pt", video_path, str(output_dir), save_video=False, save_npz=True, **kwargs
+    )
+    with open(txt_path, "rb") as f:
+        txt = f.read()
+    with np.load(os.path.join(output_dir, "clip_raw.npz")) as data:
+        arrays = {key: data[key] for key in data.files}
+    return txt, arrays, model
+
+
+def _assert_same_output(actual, expected):
+    txt, arrays, _ = actual
+    ref_txt, ref_arrays, _ = expected
+    assert txt == ref_txt
+    assert arrays.keys() == ref_arrays.keys()
+    for key in ref_arrays:
+        assert np.array_equal(arrays[key], ref_arrays[key], equal_nan=arrays[key].dtype.kind == "f"), key
+
+
+def test_run_pose_estimation_sequential_output(monkeypatch, swimmer_clip, tmp_path):
+    txt, arrays, model = _run_pose(monkeypatch, swimmer_clip, tmp_path / "seq")
+    lines = txt.decode().splitlines()
+    assert len(lines) == CLIP_FRAMES
+    assert [int(line.split()[0]) for line in lines] == list(range(CLIP_FRAMES))
+    assert lines[BLANK_FRAME] == f"{BLANK_FRAME} no detection"
+    assert lines[1].split()[:7] == ["1", "0", "50.000000", "48.000000", "16.000000", "16.000000", "0.875000"]
+    assert arrays["frame_ids"].tolist() == list(range(CLIP_FRAMES))
+    assert model.frames_seen == list(range(CLIP_FRAMES))
+
+
+def test_run_pose_estimation_reports_progress(monkeypatch, swimmer_clip, tmp_path):
+    reports = []
+    txt, _, _ = _run_pose(
+        monkeypatch, swimmer_clip, tmp_path / "progress",
+        progress_callback=lambda *report: reports.append(report), progress_interval=0,
+    )
+    assert len(txt.decode().splitlines()) == CLIP_FRAMES
+    # 每一幀回報一次，結束時再以實際幀數回報一次
+    assert [done for done, _, _, _ in reports] == list(range(1, CLIP_FRAMES + 1)) + [CLIP_FRAMES]
+    assert all(total == CLIP_FRAMES for _, total, _, _ in reports)
+    for done, _, fps, eta in reports:
+        assert fps > 0 and eta == pytest.approx((CLIP_FRAMES - done) / fps)
+    assert reports[-1][3] == 0.0
+
+
+def _assert_matches_sequential(monkeypatch, video_path, tmp_path, **options):
+    """以 options 執行，_raw.txt 與 .npz 須與預設逐幀執行完全相同；回傳該次使用的假模型。"""
+    expected = _run_pose(monkeypatch, video_path, tmp_path / "seq")
+    actual = _run_pose(monkeypatch, video_path, tmp_path / "mode", **options)
+    _assert_same_output(actual, expected)
+    return actual[2]
+
+
+@pytest.mark.parametrize("batch_size", [4, 7])
+def test_run_pose_estimation_batches_match_sequential(monkeypatch, swimmer_clip, tmp_path, batch_size):
+    model = _assert_matches_sequential(monkeypatch, swimmer_clip, tmp_path, batch_size=batch_size)
+    # 整批送進模型 (最後一批可能不足 batch_size)
+    assert len(model.kwargs) == -(-CLIP_FRAMES // batch_size)
+    assert model.frames_seen == list(range(CLIP_FRAMES))
+
+
+def test_run_pose_estimation_pipelined_matches_sequential(monkeypatch, swimmer_clip, tmp_path):
+    for options in (dict(pipelined=True), dict(batch_size=3, pipelined=True, queue_size=2)):
+        model = _assert_matches_sequential(monkeypatch, swimmer_clip, tmp_path, **options)
+        assert model.frames_seen == list(range(CLIP_FRAMES))
+
+
+def test_run_pose_estimation_frame_stride_matches_sequential(monkeypatch, swimmer_clip, tmp_path):
+    model = _assert_matches_sequential(monkeypatch, swimmer_clip, tmp_path, frame_stride=4, batch_size=2)
+    # 平穩段以內插取代推論；沒有泳者的錨點前後兩段逐幀推論
+    assert len(model.frames_seen) < CLIP_FRAMES
+    assert set(range(BLANK_FRAME - 3, BLANK_FRAME + 4)) <= set(model.frames_seen)
+
+
+def test_needs_dense_when_an_anchor_has_no_keypoints():
+    detected, rows = _results_to_numpy([
+        _fake_result([(0, 80, 48, 16, 16, 0.9)]),
+        _fake_result([(0, 88, 48, 16, 16, 0.9)]),
+        _fake_result([(0, 88, 48, 16, 16, 0.9)], keypoints=None),
+    ])
+    gap = [None] * 3
+    assert not _needs_dense(_StrideSegment((True, rows[0]), gap, (True, rows[1])), CLIP_SIZE)
+    assert _needs_dense(_StrideSegment((True, rows[0]), gap, (True, rows[2])), CLIP_SIZE)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [dict(roi_crop=True, batch_size=2), dict(roi_crop=True, frame_stride=4, pipelined=True)],
+    ids=repr,
+)
+def test_run_pose_estimation_roi_crop_matches_sequential(monkeypatch, swimmer_clip, tmp_path, options):
+    # 小畫面上也要真的裁切 (預設最小裁切邊長 640 會涵蓋整張畫面)
+    monkeypatch.setattr(pose_estimator, "ROI_MIN_SIZE", 48)
+    monkeypatch.setattr(pose_estimator, "ROI_PADDING_RATIO", 0.5)
+    model = _assert_matches_sequential(monkeypatch, swimmer_clip, tmp_path, **options)
+    assert (48, 48) in model.input_shapes
+
+
+def test_run_pose_estimation_resolution_options_match_sequential(monkeypatch, swimmer_clip, tmp_path):
+    model = _assert_matches_sequential(monkeypatch, swimmer_clip, tmp_path, imgsz=320)
+    assert all(kwargs == {"imgsz": 320} for kwargs in model.kwargs)
+
+    # 縮小 0.5 倍推論，BBOX 與關鍵點換算回原始解析度
+    model = _assert_matches_sequential(monkeypatch, swimmer_clip, tmp_path, downscale=0.5, batch_size=2)
+    assert set(model.input_shapes) == {(48, 80)}
+
+
+def test_run_pose_estimation_num_workers_matches_sequential(monkeypatch, swimmer_clip, tmp_path):
+    # fork 讓子程序沿用 monkeypatch 的假模型
+    monkeypatch.setattr(pose_estimator, "POSE_WORKER_START_METHOD", "fork")
+    for options in (dict(num_workers=3), dict(num_workers=4, batch_size=4, pipelined=True)):
+        _assert_matches_sequential(monkeypatch, swimmer_clip, tmp_path, **options)
+    # 暫存的分段資料夾已清除
+    assert sorted(os.listdir(tmp_path / "mode")) == ["clip_raw.npz", "clip_raw.txt"]
+
+
+def test_run_pose_estimation_resumes_after_crash(monkeypatch, swimmer_clip, tmp_path):
+    expected = _run_pose(monkeypatch, swimmer_clip, tmp_path / "seq")
+    output_dir = tmp_path / "resume"
+
+    crashing = _BlobPoseModel(fail_at=17)
+    with pytest.raises(RuntimeError, match="frame 17"):
+        _run_pose(monkeypatch, swimmer_clip, output_dir, model=crashing, checkpoint_every=5)
+    ckpt_dir = output_dir / "clip_raw.ckpt"
+    assert sorted(os.listdir(ckpt_dir)) == [
+        "meta.json", "part000000000.npz", "part000000005.npz", "part000000010.npz"
+    ]
+
+    actual = _run_pose(monkeypatch, swimmer_clip, output_dir, checkpoint_every=5)
+    _assert_same_output(actual, expected)
+    # 只推論 checkpoint 之後的幀
+    assert actual[2].frames_seen == list(range(15, CLIP_FRAMES))
+    assert not ckpt_dir.exists()
+
+    # 推論設定不同時不採用舊的 checkpoint，從頭推論
+    with pytest.raises(RuntimeError):
+        _run_pose(monkeypatch, swimmer_clip, output_dir, model=crashing, checkpoint_every=5)
+    actual = _run_pose(monkeypatch, swimmer_clip, output_dir, checkpoint_every=5, imgsz=320)
+    _assert_same_output(actual, expected)
+    assert actual[2].frames_seen == list(range(CLIP_FRAMES))
@@ -0,0 +1,121 @@
+import os
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from BD import diving_analyzer_track_angles as diving
+from BD.keypoint_track import KeypointTrack
+from BD.result_cache import DiskResultCache, content_hash
+
+
+def test_content_hash_depends_on_content_only():
+    a = np.arange(12, dtype=np.float64).reshape(3, 4)
+    assert content_hash(a, (80, 50, 50)) == content_hash(a.copy(), (80, 50, 50))
+    assert content_hash(np.asfortranarray(a)) == content_hash(a)
+    assert content_hash(a) != content_hash(a.reshape(4, 3))
+    assert content_hash(a) != content_hash(a.astype(np.float32))
+    assert content_hash(a, (80, 50, 50)) != content_hash(a, (81, 50, 50))
+
+
+def test_disk_cache_hits_and_lru_eviction(tmp_path):
+    cache = DiskResultCache(str(tmp_path / "cache"), max_bytes=2500)
+    assert cache.get("a") is None
+
+    payload = b"x" * 1000
+    cache.put("a", {"value": payload})
+    time.sleep(0.01)
+    cache.put("b", {"value": payload})
+    time.sleep(0.01)
+    # 使用 a，使 b 成為最久未使用
+    assert cache.get("a") == {"value": payload}
+    time.sleep(0.01)
+    cache.put("c", {"value": payload})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (3, 2, 1, 2)
+    assert stats["size_bytes"] <= 2500
+
+    # 另一個程序 (新的物件) 共用同一份磁碟快取
+    assert DiskResultCache(cache.cache_dir, max_bytes=2500).get("c") == {"value": payload}
+
+    # 損毀的項目視為未命中並刪除
+    with open(os.path.join(cache.cache_dir, "c.pkl"), "wb") as f:
+        f.write(b"broken")
+    assert cache.get("c") is None
+    assert not os.path.exists(os.path.join(cache.cache_dir, "c.pkl"))
+
+
+@pytest.fixture
+def diving_inputs(tmp_path, monkeypatch):
+    video_path = str(tmp_path / "dive.avi")
+    out = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for i in range(5):
+        out.write(np.full((48, 64, 3), 40 * i, dtype=np.uint8))
+    out.release()
+
+    rows = np.zeros((5, 28))
+    rows[:, 0] = np.arange(5)
+    rows[:, 2:] = 100 + np.arange(26)
+
+    cache = DiskResultCache(str(tmp_path / "cache"), 1 << 20, name="diving_phase")
+    monkeypatch.setattr(diving, "diving_phase_cache", cache)
+
+    calls = []
+
+    def fake_analyze(video_path, track, frame, lower_blue, upper_blue, video_info):
+        # 代替實際分析：寫出一張踢腿角度圖 (內容帶呼叫次數，可辨識是否為快取內容)
+        calls.append((tuple(lower_blue), video_info.frame_count))
+        fig_path = diving._kick_angle_fig_path(video_path, track, 1)
+        with open(fig_path, "wb") as f:
+            f.write(b"png-%d" % len(calls))
+        return {"kick_angle_fig_1": fig_path, "kick_angle_fig_2": None, "entry_frame": 3}
+
+    monkeypatch.setattr(diving, "_analyze_diving_phase", fake_analyze)
+
+    def make_track(folder):
+        os.makedirs(tmp_path / folder, exist_ok=True)
+        return KeypointTrack(rows, source_path=str(tmp_path / folder / "dive.txt"))
+
+    return video_path, make_track, cache, calls
+
+
+def test_analyze_diving_phase_uses_disk_cache(diving_inputs, monkeypatch, tmp_path):
+    video_path, make_track, cache, calls = diving_inputs
+
+    first = diving.analyze_diving_phase(video_path, make_track("run1"))
+    assert len(calls) == 1 and first["entry_frame"] == 3
+    os.remove(first["kick_angle_fig_1"])
+
+    # 同一份內容、不同輸出資料夾：命中快取，踢腿角度圖寫到本次的位置；命中時不掃描快取資料夾
+    def no_listing():
+        raise AssertionError("cache directory listed on a hit")
+
+    with monkeypatch.context() as m:
+        m.setattr(cache, "_entries", no_listing)
+        second = diving.analyze_diving_phase(video_path, make_track("run2"))
+    assert len(calls) == 1
+    assert second["entry_frame"] == 3 and second["kick_angle_fig_2"] is None
+    assert second["kick_angle_fig_1"] == str(tmp_path / "run2" / "kick_angle_1_dive.png")
+    with open(second["kick_angle_fig_1"], "rb") as f:
+        assert f.read() == b"png-1"
+    assert not os.path.exists(first["kick_angle_fig_1"])
+
+    # 水色範圍或快取版本改變：不命中
+    diving.analyze_diving_phase(video_path, make_track("run3"), lower_blue=(90, 50, 50))
+    assert calls[-1] == ((90, 50, 50), 5)
+    monkeypatch.setattr(diving, "DIVING_CACHE_VERSION", diving.DIVING_CACHE_VERSION + 1)
+    diving.analyze_diving_phase(video_path, make_track("run4"))
+    assert len(calls) == 3
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 3)
+    assert cache.hit_rate() == 0.25
+
+    # 關閉快取時每次都重新分析
+    monkeypatch.setattr(diving, "DIVING_CACHE", False)
+    diving.analyze_diving_phase(video_path, make_track("run1"))
+    assert len(calls) == 4
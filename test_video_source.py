@@ -0,0 +1,254 @@
+import cv2
+import numpy as np
+import pandas as pd
+
+from BD import skeleton_renderer
+from BD.focus_tracking_view import export_focus_only_video
+from BD.keypoint_track import KeypointTrack
+from BD.skeleton_renderer import load_keypoints_from_txt, render_skeleton_video_from_txt
+from BD.video_info import clear_video_info_cache, probe_video
+from BD.video_postprocessor import PIP_MARGIN, overlay_results_on_video, render_focus_and_overlay
+from BD.video_source import VideoSource, _OpenCVDecoder, read_frame
+
+
+def _write_video(path, num_frames=12, size=(64, 48)):
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, size)
+    for i in range(num_frames):
+        frame = np.full((size[1], size[0], 3), i * 20, dtype=np.uint8)
+        out.write(frame)
+    out.release()
+
+
+def _read_all_cv2(path):
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def test_video_source_matches_cv2(tmp_path):
+    path = tmp_path / "v.avi"
+    _write_video(path)
+    expected = _read_all_cv2(path)
+
+    for threaded in (False, True):
+        with VideoSource(str(path), threaded=threaded) as source:
+            assert (source.width, source.height) == (64, 48)
+            frames = [frame.copy() for frame in source]
+        assert len(frames) == len(expected)
+        assert all(np.array_equal(a, b) for a, b in zip(frames, expected))
+
+
+def test_video_source_hold_and_seek(tmp_path):
+    path = tmp_path / "v.avi"
+    _write_video(path)
+    expected = _read_all_cv2(path)
+
+    with VideoSource(str(path), threaded=True, hold=3) as source:
+        held = []
+        for frame in source.frames(4, 10):
+            held = (held + [frame])[-3:]
+            # hold 幀內回傳的 frame 不會被覆寫
+            start = source.position - len(held)
+            for k, f in enumerate(held):
+                assert np.array_equal(f, expected[start + k])
+        assert source.position == 10
+
+    assert np.array_equal(read_frame(str(path), 7), expected[7])
+
+
+def _write_gop_video(path, num_frames=60, size=(64, 48)):
+    """MPEG-4 Part 2 (mp4v)：有 P 幀，seek 需從關鍵幀解碼到目標幀；每幀內容都不同。"""
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 25, size)
+    for i in range(num_frames):
+        frame = np.full((size[1], size[0], 3), (i * 4) % 256, dtype=np.uint8)
+        frame[10:20, i % (size[0] - 5) : i % (size[0] - 5) + 5] = 255
+        out.write(frame)
+    out.release()
+
+
+def test_video_source_seek_accuracy_on_encoded_clip(tmp_path):
+    path = tmp_path / "gop.mp4"
+    _write_gop_video(path)
+    expected = _read_all_cv2(path)
+    assert len(expected) == 60
+    assert len({frame.tobytes() for frame in expected}) == 60
+
+    for threaded in (False, True):
+        with VideoSource(str(path), threaded=threaded, reuse_buffers=False) as source:
+            for start in (1, 13, 29, 30, 47, 59, 5):
+                frames = list(source.frames(start, start + 3))
+                assert all(np.array_equal(f, expected[start + k]) for k, f in enumerate(frames))
+                assert source.position == min(start + 3, 60)
+
+
+class _DriftingCapture:
+    """
+    模擬關鍵幀不精確的 seek：設定 CAP_PROP_POS_FRAMES 時實際落在前 3 幀，
+    但讀回 CAP_PROP_POS_FRAMES 仍是剛設定的值。
+    """
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.requested = None
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.requested = value
+            value = max(0, value - 3)
+        return self.cap.set(prop, value)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES and self.requested is not None:
+            return self.requested
+        return self.cap.get(prop)
+
+    def __getattr__(self, name):
+        return getattr(self.cap, name)
+
+
+def test_opencv_seek_falls_back_when_inaccurate(tmp_path):
+    path = tmp_path / "gop.mp4"
+    _write_gop_video(path)
+    expected = _read_all_cv2(path)
+
+    decoder = _OpenCVDecoder(str(path))
+    decoder.cap = _DriftingCapture(decoder.cap)
+    decoder.seek(20)
+    assert not isinstance(decoder.cap, _DriftingCapture)  # 已改為重開逐幀 grab
+    assert np.array_equal(decoder.read_into(None), expected[20])
+    assert np.array_equal(decoder.read_into(None), expected[21])
+
+    decoder.seek(35)
+    buf = np.empty_like(expected[0])
+    assert decoder.read_into(buf) is buf and np.array_equal(buf, expected[35])
+    decoder.release()
+
+
+def test_probe_video_cached_until_file_changes(tmp_path):
+    path = tmp_path / "v.avi"
+    _write_video(path)
+    clear_video_info_cache()
+
+    info = probe_video(str(path))
+    assert (info.fps, info.width, info.height, info.frame_count) == (10, 64, 48, 12)
+    assert probe_video(str(path)) is info
+
+    _write_video(path, num_frames=5)
+    assert probe_video(str(path)).frame_count == 5
+
+
+class _RecordingWriter:
+    """取代 cv2.VideoWriter，保留寫入的每一幀 (不經過有損編碼)；outputs 以輸出路徑查詢。"""
+
+    outputs = {}
+
+    def __init__(self, path, fourcc, fps, size):
+        self.size = size
+        self.frames = []
+        _RecordingWriter.last = self
+        _RecordingWriter.outputs[path] = self
+
+    def isOpened(self):
+        return True
+
+    def write(self, frame):
+        assert (frame.shape[1], frame.shape[0]) == self.size
+        self.frames.append(frame.copy())
+
+    def release(self):
+        pass
+
+
+def test_render_skeleton_video_from_txt(tmp_path, monkeypatch):
+    path = tmp_path / "v.avi"
+    _write_video(path, size=(96, 64))
+    expected = _read_all_cv2(path)
+
+    txt_path = tmp_path / "v_raw.txt"
+    lines = []
+    for frame_id in range(len(expected)):
+        if frame_id % 3 == 1:
+            lines.append(f"{frame_id} no detection")
+            continue
+        keypoints = " ".join(f"{20 + 8 * k:.6f} {30.000000:.6f} 0.900000" for k in range(7))
+        lines.append(f"{frame_id} 0 48.000000 32.000000 40.000000 20.000000 0.900000 {keypoints}")
+    txt_path.write_text("\n".join(lines) + "\n")
+
+    frame_ids, keypoints = load_keypoints_from_txt(str(txt_path))
+    assert frame_ids.tolist() == [i for i in range(len(expected)) if i % 3 != 1]
+    assert keypoints.shape == (len(frame_ids), 7, 3)
+
+    monkeypatch.setattr(skeleton_renderer.cv2, "VideoWriter", _RecordingWriter)
+    out_path = str(tmp_path / "v_1.avi")
+    assert render_skeleton_video_from_txt(str(path), str(txt_path), out_path) == out_path
+
+    rendered = _RecordingWriter.last.frames
+    assert len(rendered) == len(expected)
+    for frame_id, (frame, original) in enumerate(zip(rendered, expected)):
+        if frame_id % 3 == 1:
+            # 未偵測到的幀原樣輸出
+            assert np.array_equal(frame, original)
+        else:
+            assert not np.array_equal(frame, original)
+            assert np.array_equal(frame[:10], original[:10])  # 骨架以外的區域不變
+
+
+def test_render_focus_and_overlay_matches_two_passes(tmp_path, monkeypatch):
+    path = tmp_path / "v.avi"
+    size = (160, 96)
+    _write_video(path, num_frames=12, size=size)
+
+    # 第 3 幀髖關節為 NaN (追焦影片略過該幀)；關鍵點只有 10 幀 (之後不再輸出追焦畫面)
+    rows = np.zeros((10, 28))
+    rows[:, 0] = np.arange(10)
+    rows[:, 4:6] = (30, 20)
+    rows[:, 19] = 40 + 4 * np.arange(10)
+    rows[:, 20] = 50
+    rows[3, 2:] = np.nan
+    track = KeypointTrack(rows)
+    hips = pd.DataFrame({"frame_id": range(10), "hip_x": rows[:, 19], "hip_y": rows[:, 20]}).dropna()
+    analysis_results = {
+        "df_hip_trajectory": hips,
+        "track_segment_start": 2,
+        "track_segment_end": 8,
+    }
+
+    monkeypatch.setattr(cv2, "VideoWriter", _RecordingWriter)
+    _RecordingWriter.outputs = {}
+    overlay_results_on_video(str(path), analysis_results, "two_pass.mp4")
+    export_focus_only_video(str(path), track, "two_pass_focus.mp4")
+    for pip in (False, True):
+        output_path, focus_path = render_focus_and_overlay(
+            str(path), track, analysis_results, f"combined{pip}.mp4", f"focus{pip}.mp4",
+            picture_in_picture=pip,
+        )
+        assert (output_path, focus_path) == (f"combined{pip}.mp4", f"focus{pip}.mp4")
+
+    outputs = {name: writer.frames for name, writer in _RecordingWriter.outputs.items()}
+    reference, reference_focus = outputs["two_pass.mp4"], outputs["two_pass_focus.mp4"]
+    assert len(reference) == 12 and len(reference_focus) == 9
+    assert _RecordingWriter.outputs["focusTrue.mp4"].size == (48, 24)
+
+    # 子母畫面關閉時與兩次解碼的結果逐幀相同
+    for name in ("combinedFalse.mp4", "focusFalse.mp4", "focusTrue.mp4"):
+        expected = reference_focus if name.startswith("focus") else reference
+        assert len(outputs[name]) == len(expected)
+        assert all(np.array_equal(a, b) for a, b in zip(outputs[name], expected))
+
+    # 子母畫面：追焦畫面貼在右上角 (距上、右邊緣 PIP_MARGIN)，其餘與疊加影片相同
+    focus_frames = iter(reference_focus)
+    x0, y0 = size[0] - 48 - PIP_MARGIN, PIP_MARGIN
+    for frame_id, (frame, expected) in enumerate(zip(outputs["combinedTrue.mp4"], reference)):
+        if frame_id == 3 or frame_id >= 10:
+            assert np.array_equal(frame, expected)
+            continue
+        pip = frame[y0 : y0 + 24, x0 : x0 + 48]
+        assert np.array_equal(pip, next(focus_frames))
+        frame[y0 : y0 + 24, x0 : x0 + 48] = expected[y0 : y0 + 24, x0 : x0 + 48]
+        assert np.array_equal(frame, expected)